@@ -0,0 +1,94 @@
+#!/usr/bin/env python3.11
+# Benchmark the compiled alert condition index against a linear scan over every
+# subscription, and check both find the same triggered subscriptions.
+#
+#   python benchmarks/bench_alert_conditions.py --subscriptions 1000000 --symbols 50 --ticks 200
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from app.services import alert_conditions
+
+COOLDOWN_SECONDS = 24 * 3600
+
+
+def make_subscriptions(n: int, n_symbols: int, seed: int):
+    rng = random.Random(seed)
+    symbols = [f"SYM{i}-USD" for i in range(n_symbols)]
+    now = time.time()
+    subscriptions = []
+    for sub_id in range(1, n + 1):
+        kind = rng.randrange(4)
+        if kind == 0:
+            condition = f"price_drops_below_{rng.randint(500, 1500)}"
+        elif kind == 1:
+            condition = f"price_exceeds_{rng.randint(500, 1500)}"
+        elif kind == 2:
+            condition = f"price_increase_{rng.randint(1, 20)}_percent"
+        else:
+            condition = f"price_decrease_{rng.randint(1, 20)}_percent"
+        last_sent = now - rng.random() * 3 * COOLDOWN_SECONDS if rng.random() < 0.3 else alert_conditions.NEVER_SENT
+        subscriptions.append((sub_id, rng.choice(symbols), condition, last_sent))
+    return symbols, subscriptions
+
+
+def linear_scan(subscriptions, symbol, price, change_pct, now):
+    # What a per-subscription check_and_send_alerts() loop would do
+    triggered = []
+    for sub_id, sub_symbol, condition, last_sent in subscriptions:
+        if sub_symbol != symbol or last_sent > now - COOLDOWN_SECONDS:
+            continue
+        kind, threshold = alert_conditions.parse_condition(condition)
+        if ((kind == alert_conditions.KIND_BELOW and price < threshold)
+                or (kind == alert_conditions.KIND_ABOVE and price > threshold)
+                or (kind == alert_conditions.KIND_PCT_UP and change_pct >= threshold)
+                or (kind == alert_conditions.KIND_PCT_DOWN and change_pct <= -threshold)):
+            triggered.append(sub_id)
+    return triggered
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compiled alert index vs linear scan")
+    parser.add_argument("--subscriptions", type=int, default=1_000_000)
+    parser.add_argument("--symbols", type=int, default=50)
+    parser.add_argument("--ticks", type=int, default=200)
+    parser.add_argument("--scan-ticks", type=int, default=3, help="ticks to time with the (slow) linear scan")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    symbols, subscriptions = make_subscriptions(args.subscriptions, args.symbols, args.seed)
+    rng = random.Random(args.seed + 1)
+    ticks = [(rng.choice(symbols), rng.uniform(400, 1600), rng.uniform(-25, 25)) for _ in range(args.ticks)]
+    now = time.time()
+
+    start = time.perf_counter()
+    index = alert_conditions.compile_subscriptions(subscriptions)
+    compile_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    total = 0
+    for symbol, price, change in ticks:
+        total += len(index.triggered(symbol, price, change, now=now, cooldown_seconds=COOLDOWN_SECONDS))
+    index_time = (time.perf_counter() - start) / len(ticks)
+
+    start = time.perf_counter()
+    for symbol, price, change in ticks[:args.scan_ticks]:
+        expected = linear_scan(subscriptions, symbol, price, change, now)
+        got = index.triggered(symbol, price, change, now=now, cooldown_seconds=COOLDOWN_SECONDS)
+        assert sorted(expected) == sorted(got.tolist()), symbol
+    scan_time = (time.perf_counter() - start) / max(1, min(args.scan_ticks, len(ticks)))
+
+    print(f"subscriptions: {len(index):,} ({index.invalid} invalid), groups: {len(index.groups)}")
+    print(f"compile:       {compile_time:.2f}s")
+    print(f"index tick:    {index_time * 1e3:.3f} ms (avg {total / len(ticks):,.0f} triggered)")
+    print(f"linear tick:   {scan_time * 1e3:.1f} ms")
+    print(f"speedup:       {scan_time / index_time:,.0f}x per tick")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3.11
+# SQLite benchmark for the alert subscription tables at millions of rows: bulk upsert and
+# deactivate throughput, single subscribe/unsubscribe latency, keyset vs OFFSET pagination
+# and the per-symbol active lookup - optionally re-timed with the composite indexes dropped.
+#
+#   python benchmarks/bench_alert_store.py --rows 2000000 --compare-unindexed
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+CONDITIONS = ["price_drops_below_{}", "price_exceeds_{}", "price_increase_{}_percent", "price_decrease_{}_percent"]
+HEAVY_USER = "heavy-user" # One user with many subscriptions, for deep pagination
+
+
+def timed(fn, repeat: int = 1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) / repeat, result
+
+
+def make_rows(n: int, n_users: int, n_symbols: int, heavy: int, rng):
+    rows = set()
+    for i in range(heavy):
+        rows.add((HEAVY_USER, f"SYM{i % n_symbols}-USD", CONDITIONS[i % 4].format(i // n_symbols + 1)))
+    while len(rows) < n:
+        rows.add((f"user{rng.randrange(n_users)}", f"SYM{rng.randrange(n_symbols)}-USD",
+                  rng.choice(CONDITIONS).format(rng.randint(1, 5000))))
+    return list(rows)
+
+
+def seed(db, models, rows, users):
+    # Plain executemany INSERTs for the bulk of the data; the service APIs are timed separately
+    db.session.execute(models.UserPreference.__table__.insert(), [{"user_identifier": u} for u in users])
+    table = models.AlertSubscription.__table__
+    for start in range(0, len(rows), 50_000):
+        db.session.execute(table.insert(), [
+            {"user_identifier": u, "crypto_symbol": s, "alert_condition": c, "is_active": True}
+            for u, s, c in rows[start:start + 50_000]
+        ])
+    db.session.commit()
+
+
+def lookups(db, models, alert_service, heavy_last_id, args):
+    sub = models.AlertSubscription
+    results = {}
+    results["keyset first page"] = timed(lambda: alert_service.get_user_alert_subscriptions(HEAVY_USER, 100), 20)[0]
+    results["keyset deep page"] = timed(lambda: alert_service.get_user_alert_subscriptions(
+        HEAVY_USER, 100, after_id=heavy_last_id - 200), 20)[0]
+    results["offset deep page"] = timed(lambda: db.session.query(sub.id).filter(
+        sub.user_identifier == HEAVY_USER, sub.is_active.is_(True)).order_by(sub.id)
+        .offset(args.heavy - 200).limit(100).all(), 5)[0]
+    results["small user page"] = timed(lambda: alert_service.get_user_alert_subscriptions("user7", 100), 20)[0]
+    results["symbol active count"] = timed(lambda: db.session.query(db.func.count(sub.id)).filter(
+        sub.crypto_symbol == "SYM3-USD", sub.is_active.is_(True)).scalar(), 5)[0]
+    results["exact lookup"] = timed(lambda: db.session.query(sub.id).filter(
+        sub.user_identifier == "user7", sub.crypto_symbol == "SYM1-USD",
+        sub.alert_condition == "price_exceeds_42").first(), 20)[0]
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Alert subscription store benchmark (SQLite)")
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--symbols", type=int, default=200)
+    parser.add_argument("--heavy", type=int, default=50_000, help="subscriptions of the one heavy user")
+    parser.add_argument("--batch", type=int, default=20_000, help="rows per bulk upsert/deactivate call")
+    parser.add_argument("--compare-unindexed", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="alert_store_bench_")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.sqlite')}"
+    from app import create_app, models
+    from app.models import db
+    from app.services import alert_service
+
+    rng = random.Random(args.seed)
+    app = create_app()
+    with app.app_context():
+        rows = make_rows(args.rows, args.users, args.symbols, args.heavy, rng)
+        rng.shuffle(rows)
+        users = sorted({user for user, _, _ in rows})
+        seed_time, _ = timed(lambda: seed(db, models, rows, users))
+        print(f"seeded {len(rows):,} subscriptions for {len(users):,} users in {seed_time:.1f}s ({workdir})")
+        heavy_last_id = db.session.query(db.func.max(models.AlertSubscription.id)).filter(
+            models.AlertSubscription.user_identifier == HEAVY_USER).scalar()
+
+        # Bulk APIs: half new rows, half re-subscriptions of existing ones
+        existing = rows[:args.batch // 2]
+        new = [(f"user{rng.randrange(args.users)}", f"NEW{i}-USD", "price_exceeds_1") for i in range(args.batch // 2)]
+        upsert_time, n = timed(lambda: alert_service.bulk_upsert_subscriptions(existing + new))
+        print(f"bulk upsert:      {n:,} rows in {upsert_time:.2f}s ({n / upsert_time:,.0f} rows/s)")
+        deactivate_time, n = timed(lambda: alert_service.bulk_deactivate_subscriptions(existing))
+        print(f"bulk deactivate:  {n:,} rows in {deactivate_time:.2f}s ({n / deactivate_time:,.0f} rows/s)")
+        t, _ = timed(lambda: alert_service.bulk_upsert_subscriptions([("user1", "SYM1-USD", "price_exceeds_7")]), 100)
+        print(f"single subscribe: {t * 1e3:.2f} ms")
+        t, _ = timed(lambda: alert_service.bulk_deactivate_subscriptions([("user1", "SYM1-USD", "price_exceeds_7")]), 100)
+        print(f"single deactivate:{t * 1e3:.2f} ms")
+
+        indexed = lookups(db, models, alert_service, heavy_last_id, args)
+        print("\nquery plans:")
+        plans = {
+            "keyset page": "SELECT id FROM alert_subscriptions WHERE user_identifier = 'user7' AND is_active = 1 AND id > 5 ORDER BY id LIMIT 101",
+            "symbol active": "SELECT count(id) FROM alert_subscriptions WHERE crypto_symbol = 'SYM3-USD' AND is_active = 1",
+            "upsert conflict": "SELECT id FROM alert_subscriptions WHERE user_identifier = 'u' AND crypto_symbol = 's' AND alert_condition = 'c'",
+        }
+        for name, sql in plans.items():
+            detail = " | ".join(row[-1] for row in db.session.execute(db.text("EXPLAIN QUERY PLAN " + sql)))
+            print(f"  {name:<16} {detail}")
+
+        unindexed = None
+        if args.compare_unindexed:
+            names = [index.name for index in models.AlertSubscription.__table__.indexes]
+            for name in names:
+                db.session.execute(db.text(f"DROP INDEX {name}"))
+            db.session.commit()
+            unindexed = lookups(db, models, alert_service, heavy_last_id, args)
+            models.ensure_indexes(db.engine)
+
+        print(f"\n{'query':<22}{'indexed':>12}" + (f"{'no index':>12}{'speedup':>10}" if unindexed else ""))
+        for name, t in indexed.items():
+            line = f"{name:<22}{t * 1e3:>10.2f}ms"
+            if unindexed:
+                line += f"{unindexed[name] * 1e3:>10.2f}ms{unindexed[name] / t:>9.0f}x"
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3.11
+# Compare the serial fetch loop with the concurrent fetch stage against a stub
+# ApiClient that injects latency and failures.
+#
+#   python benchmarks/bench_fetch.py --symbols 200 --latency 0.05 --workers 16
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+
+from pipeline.fetch import fetch_all, fetch_symbol
+from stub_api import StubApiClient
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serial vs concurrent fetch benchmark")
+    parser.add_argument("--symbols", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--failure-rate", type=float, default=0.05)
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--rate-limit", type=float, default=None)
+    args = parser.parse_args()
+
+    symbols = [f"SYM{i}-USD" for i in range(args.symbols)]
+
+    client = StubApiClient(latency=args.latency, failure_rate=args.failure_rate)
+    start = time.perf_counter()
+    serial = {s: fetch_symbol(client, s, timeout=5, retries=3, backoff=0.01) for s in symbols}
+    serial_time = time.perf_counter() - start
+
+    client = StubApiClient(latency=args.latency, failure_rate=args.failure_rate)
+    start = time.perf_counter()
+    concurrent = fetch_all(client, symbols, max_workers=args.workers, timeout=5, retries=3,
+                           backoff=0.01, rate_limit=args.rate_limit)
+    concurrent_time = time.perf_counter() - start
+
+    ok = sum(1 for df in concurrent.values() if not df.empty)
+    print(f"serial:     {serial_time:.2f}s ({sum(1 for df in serial.values() if not df.empty)}/{len(symbols)} ok)")
+    print(f"concurrent: {concurrent_time:.2f}s ({ok}/{len(symbols)} ok, {client.calls} calls)")
+    print(f"speedup:    {serial_time / concurrent_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
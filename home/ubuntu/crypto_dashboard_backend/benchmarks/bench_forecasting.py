@@ -0,0 +1,92 @@
+#!/usr/bin/env python3.11
+# Benchmark the vectorized walk-forward backtester (services/forecasting.py) against a plain
+# per-symbol, per-bar loop that refits each model step by step, and check that both score the
+# models identically and pick the same model for every symbol.
+#
+#   python benchmarks/bench_forecasting.py --symbols 10 100 1000 --bars 365
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from app.services import forecasting
+from stub_api import synthetic_ohlcv
+
+
+def loop_paths(model, y: np.ndarray, horizon: int) -> np.ndarray:
+    # Forecast from every bar with straightforward Python recurrences
+    n = len(y)
+    paths = np.full((n, horizon), np.nan)
+    steps = np.arange(1, horizon + 1)
+    if isinstance(model, forecasting.HoltLinear):
+        level = y[0]
+        trend = (y[1] - y[0]) if n > 1 and not isinstance(model, forecasting.EMA) else 0.0
+        paths[0] = level + trend * steps
+        for t in range(1, n):
+            new_level = model.alpha * y[t] + (1 - model.alpha) * (level + trend)
+            trend = model.beta * (new_level - level) + (1 - model.beta) * trend
+            level = new_level
+            paths[t] = level + trend * steps
+    elif isinstance(model, forecasting.SMAExtrapolation):
+        w = model.window
+        for t in range(w, n):
+            sma, prev = y[t - w + 1:t + 1].mean(), y[t - w:t].mean()
+            paths[t] = sma + (sma - prev) * steps
+    elif isinstance(model, forecasting.RollingOLS):
+        w = model.window
+        x = np.arange(w)
+        for t in range(w - 1, n):
+            slope, intercept = np.polyfit(x, y[t - w + 1:t + 1], 1)
+            paths[t] = intercept + slope * (w - 1 + steps)
+    return paths
+
+
+def loop_backtest(prices: np.ndarray, models, horizon: int) -> np.ndarray:
+    mape = np.full((len(models), len(prices)), np.nan)
+    for row, y in enumerate(prices):
+        paths = np.stack([loop_paths(model, y, horizon) for model in models])
+        actual = np.full((len(y), horizon), np.nan)
+        for k in range(1, horizon + 1):
+            actual[:-k, k - 1] = y[k:]
+        mask = np.isfinite(actual) & np.isfinite(paths).all(axis=0)
+        for m in range(len(models)):
+            mape[m, row] = np.mean(np.abs(paths[m][mask] - actual[mask]) / np.abs(actual[mask])) * 100
+    return mape
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vectorized vs looped forecasting backtest")
+    parser.add_argument("--symbols", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--bars", type=int, default=365)
+    parser.add_argument("--horizon", type=int, default=3)
+    parser.add_argument("--loop-limit", type=int, default=100, help="largest symbol count to run the loop for")
+    args = parser.parse_args()
+
+    models = forecasting.DEFAULT_MODELS
+    print(f"{len(models)} models: {', '.join(model.name for model in models)}; {args.bars} bars, horizon {args.horizon}")
+    print(f"{'symbols':>8}{'vectorized':>13}{'loop':>11}{'speedup':>9}  check")
+    for n in args.symbols:
+        prices = np.stack([synthetic_ohlcv(f"SYM{i}-USD", args.bars)["adj_close"] for i in range(n)])
+        start = time.perf_counter()
+        result = forecasting.backtest(prices, models, args.horizon)
+        vector_time = time.perf_counter() - start
+        if n > args.loop_limit:
+            print(f"{n:>8}{vector_time * 1e3:>11.1f}ms{'-':>11}{'-':>9}")
+            continue
+        start = time.perf_counter()
+        expected = loop_backtest(prices, models, args.horizon)
+        loop_time = time.perf_counter() - start
+        same_scores = np.allclose(result["mape"], expected, rtol=1e-9, equal_nan=True)
+        same_best = np.array_equal(result["best"], np.argmin(expected, axis=0))
+        check = "identical" if same_scores and same_best else \
+            f"MISMATCH (max diff {np.nanmax(np.abs(result['mape'] - expected)):.3g})"
+        print(f"{n:>8}{vector_time * 1e3:>11.1f}ms{loop_time:>10.2f}s{loop_time / vector_time:>8.0f}x  {check}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3.11
+# Benchmark the batch indicator engine against the per-symbol pandas code it replaced
+# in run_pipeline() (rolling SMA-3/SMA-7, pct_change, trend and SMA-slope extrapolation),
+# and check that both produce identical numbers.
+#
+#   python benchmarks/bench_indicators.py --sizes 10 1000 10000 --bars 10
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from app.services import indicators
+
+SMA_WINDOW_SHORT = 3
+SMA_WINDOW_LONG = 7
+PREDICTION_DAYS = 3
+
+
+def legacy_indicators(adj_close: pd.Series) -> dict:
+    # Same operations run_pipeline() used to perform for each symbol
+    sma_short = adj_close.rolling(window=SMA_WINDOW_SHORT).mean()
+    sma_long = adj_close.rolling(window=SMA_WINDOW_LONG).mean()
+    daily_change = adj_close.pct_change() * 100
+    trend = "Neutral"
+    if sma_short.iloc[-1] > sma_long.iloc[-1]:
+        trend = "Upward"
+    elif sma_short.iloc[-1] < sma_long.iloc[-1]:
+        trend = "Downward"
+    sma_series = sma_short.dropna()
+    if len(sma_series) >= 2:
+        last_sma_val = sma_series.iloc[-1]
+        sma_slope = last_sma_val - sma_series.iloc[-2]
+    else:
+        sma_slope = 0
+        last_sma_val = sma_series.iloc[-1] if not sma_series.empty else adj_close.iloc[-1]
+    predictions = [last_sma_val + (sma_slope * i) for i in range(1, PREDICTION_DAYS + 1)]
+    return {"sma_short": sma_short, "sma_long": sma_long, "daily_change_pct": daily_change,
+            "trend": trend, "predictions": predictions}
+
+
+def check_equal(series_list, legacy, batch):
+    n_bars = batch["sma_short"].shape[1]
+    for row, (series, ref) in enumerate(zip(series_list, legacy)):
+        for key in ("sma_short", "sma_long", "daily_change_pct"):
+            assert np.array_equal(batch[key][row, n_bars - len(series):], ref[key].to_numpy(), equal_nan=True), (row, key)
+        assert indicators.TREND_LABELS[int(batch["trend"][row])] == ref["trend"], (row, "trend")
+        assert np.array_equal(batch["predictions"][row], np.array(ref["predictions"])), (row, "predictions")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch indicator engine vs per-symbol pandas")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 1000, 10000])
+    parser.add_argument("--bars", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    print(f"{'symbols':>8} {'legacy (s)':>11} {'batch (s)':>10} {'speedup':>8}")
+    for n_symbols in args.sizes:
+        prices = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, (n_symbols, args.bars)), axis=1))
+        series_list = [pd.Series(row) for row in prices]
+
+        start = time.perf_counter()
+        legacy = [legacy_indicators(series) for series in series_list]
+        legacy_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        batch = indicators.compute_indicators(prices, SMA_WINDOW_SHORT, SMA_WINDOW_LONG, PREDICTION_DAYS)
+        batch_time = time.perf_counter() - start
+
+        check_equal(series_list, legacy, batch)
+        print(f"{n_symbols:>8} {legacy_time:>11.4f} {batch_time:>10.4f} {legacy_time / batch_time:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3.11
+# Peak memory of ingesting long intraday histories: the DataFrame path (parse_chart_response
+# per symbol, every frame kept until all are stored, as fetch_all() returns them) against the
+# chunked compact-array path in pipeline/ingest.py. Each run happens in a fresh child process
+# so its peak RSS is its own.
+#
+#   python benchmarks/bench_ingest.py --symbols 10 50 200 --interval 5m --range 3mo
+
+import argparse
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from app.services import ohlcv_store
+from pipeline import ingest
+from pipeline.fetch import fetch_all
+from stub_api import StubApiClient
+
+
+def run_dataframes(args, symbols, store_dir):
+    frames = fetch_all(StubApiClient(latency=0.0), symbols, interval=args.interval, range_val=args.range,
+                       max_workers=args.workers)
+    return sum(ohlcv_store.append_bars(store_dir, symbol, args.interval, ohlcv_store.to_bars(df))
+               for symbol, df in frames.items() if not df.empty)
+
+
+def run_ingest(args, symbols, store_dir):
+    written = ingest.ingest_symbols(StubApiClient(latency=0.0), symbols, store_dir, args.interval, args.range,
+                                    chunk_size=args.chunk_size, max_workers=args.workers)
+    return sum(count or 0 for count in written.values())
+
+
+def child(mode, args, n, queue):
+    sys.stdout = open(os.devnull, "w") # Progress lines would drown the table
+    symbols = [f"SYM{i}-USD" for i in range(n)]
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    bars = (run_dataframes if mode == "dataframes" else run_ingest)(args, symbols, tempfile.mkdtemp(prefix="ingest_bench_"))
+    elapsed = time.perf_counter() - start
+    queue.put((bars, elapsed, baseline, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+
+
+def measure(mode, args, n):
+    context = multiprocessing.get_context("fork")
+    queue = context.Queue()
+    process = context.Process(target=child, args=(mode, args, n, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingestion peak memory: DataFrames vs chunked compact arrays")
+    parser.add_argument("--symbols", type=int, nargs="+", default=[10, 50, 200])
+    parser.add_argument("--interval", default="5m")
+    parser.add_argument("--range", default="3mo")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--chunk-size", type=int, default=ingest.DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--modes", nargs="+", choices=["dataframes", "ingest"], default=["dataframes", "ingest"])
+    args = parser.parse_args()
+
+    print(f"{args.interval} bars over {args.range} per symbol; ru_maxrss of a fresh process per run")
+    print(f"{'mode':<12}{'symbols':>8}{'bars':>13}{'seconds':>9}{'peak RSS':>11}{'growth':>10}")
+    for mode in args.modes:
+        for n in args.symbols:
+            bars, elapsed, before, peak = measure(mode, args, n)
+            print(f"{mode:<12}{n:>8}{bars:>13,}{elapsed:>9.1f}{peak / 1024:>9.0f}MB{(peak - before) / 1024:>8.0f}MB")
+
+
+if __name__ == "__main__":
+    main()
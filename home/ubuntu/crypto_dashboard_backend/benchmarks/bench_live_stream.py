@@ -0,0 +1,180 @@
+#!/usr/bin/env python3.11
+# Load test for the live stream: thousands of simulated clients on one StreamBroker fed by
+# a synthetic upstream ticking every symbol. A share of the clients is slow, to check that
+# conflation and the bounded alert buffers keep them from holding up everyone else.
+#
+#   python benchmarks/bench_live_stream.py --clients 5000 --symbols 50 --seconds 10
+#
+# With --url the clients instead open real SSE connections to a running server
+# (e.g. `python src/stream_server.py`) and only count received events:
+#
+#   python benchmarks/bench_live_stream.py --url http://127.0.0.1:5000 --clients 2000
+
+import argparse
+import http.client
+import os
+import random
+import resource
+import sys
+import threading
+import time
+from urllib.parse import urlparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from app.services import live_stream
+
+
+class SyntheticFeed:
+    """Random-walk price for every watched symbol on each poll; counts upstream reads."""
+
+    def __init__(self, seed: int = 0):
+        self.rng = random.Random(seed)
+        self.prices = {}
+        self.reads = 0
+
+    def poll(self, symbols) -> list:
+        events = []
+        for symbol in symbols:
+            self.reads += 1
+            price = self.prices.get(symbol, 1000.0) * (1 + self.rng.gauss(0, 0.001))
+            self.prices[symbol] = price
+            events.append({"symbol": symbol, "price": price, "change_pct": None,
+                           "as_of": int(time.time()), "sent_at": time.perf_counter()})
+        return events
+
+
+def run_broker(args):
+    rng = random.Random(args.seed)
+    symbols = [f"SYM{i}-USD" for i in range(args.symbols)]
+    feed = SyntheticFeed(args.seed)
+    broker = live_stream.StreamBroker(feed=feed, poll_seconds=1 / args.tick_rate, max_alerts=args.max_alerts)
+    latencies = []
+    latency_lock = threading.Lock()
+    stop = threading.Event()
+
+    # Clients are served by a few reader threads, like an event loop serving sockets: each
+    # pass reads whatever is buffered for every client. Slow clients are only read every
+    # --slow-delay seconds, as if their socket were not writable.
+    def reader(clients):
+        local = []
+        next_read = [0.0] * len(clients)
+        while not stop.is_set():
+            now = time.monotonic()
+            for i, (subscription, slow) in enumerate(clients):
+                if now < next_read[i]:
+                    continue
+                for kind, event in subscription.next_events(timeout=0):
+                    if kind == "price":
+                        local.append(time.perf_counter() - event["sent_at"])
+                if slow:
+                    next_read[i] = now + args.slow_delay
+            time.sleep(0.005)
+        with latency_lock:
+            latencies.extend(local)
+
+    start = time.perf_counter()
+    clients = []
+    for i in range(args.clients):
+        watched = rng.sample(symbols, min(args.symbols_per_client, len(symbols)))
+        clients.append((broker.open(watched, user_identifier=f"user{i % args.users}"), rng.random() < args.slow_share))
+    connect_time = time.perf_counter() - start
+    readers = [threading.Thread(target=reader, args=(clients[i::args.readers],), daemon=True)
+               for i in range(args.readers)]
+    for thread in readers:
+        thread.start()
+
+    # Alerts for random users alongside the price ticks
+    deadline = time.monotonic() + args.seconds
+    alerts = 0
+    while time.monotonic() < deadline:
+        for _ in range(args.alerts_per_second // 10):
+            broker.publish_alert(f"user{rng.randrange(args.users)}", {"crypto_symbol": rng.choice(symbols)})
+            alerts += 1
+        time.sleep(0.1)
+
+    stats = broker.snapshot()
+    stop.set()
+    for thread in readers:
+        thread.join()
+    for subscription, _ in clients:
+        broker.close(subscription)
+
+    lat = np.array(latencies) * 1e3
+    print(f"clients:          {args.clients:,} ({args.slow_share:.0%} slow), {args.symbols} symbols, "
+          f"{args.symbols_per_client} per client; opened in {connect_time:.2f}s")
+    print(f"upstream reads:   {feed.reads:,} ({stats['upstream_polls']:,} polls) for {stats['prices_published']:,} price events")
+    print(f"fan-out:          {stats['prices_delivered']:,} price deliveries offered, {len(lat):,} read by clients")
+    print(f"conflated:        {stats['conflated']:,} prices replaced by a newer one before the client read them")
+    print(f"alerts:           {alerts:,} published, {stats['dropped']:,} dropped from full buffers")
+    if len(lat):
+        print(f"latency:          p50 {np.percentile(lat, 50):.2f} ms, p99 {np.percentile(lat, 99):.2f} ms, "
+              f"max {lat.max():.1f} ms")
+    print(f"peak RSS:         {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+
+
+def run_http(args):
+    url = urlparse(args.url)
+    symbols = [s.strip() for s in args.url_symbols.split(",")]
+    counts = {"connected": 0, "events": 0, "failed": 0}
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def client(i):
+        try:
+            conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=args.seconds + 30)
+            conn.request("GET", f"/api/stream?symbols={','.join(symbols)}&userId=user{i % args.users}")
+            response = conn.getresponse()
+            if response.status != 200:
+                raise ConnectionError(response.status)
+            with lock:
+                counts["connected"] += 1
+            while not stop.is_set():
+                line = response.fp.readline()
+                if not line:
+                    break
+                if line.startswith(b"event:"):
+                    with lock:
+                        counts["events"] += 1
+            conn.close()
+        except Exception:
+            with lock:
+                counts["failed"] += 1
+
+    threading.stack_size(256 * 1024)
+    threads = [threading.Thread(target=client, args=(i,), daemon=True) for i in range(args.clients)]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    print(f"connected: {counts['connected']:,}/{args.clients:,}, failed: {counts['failed']:,}, "
+          f"events received: {counts['events']:,} in {args.seconds}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Live stream fan-out load test")
+    parser.add_argument("--clients", type=int, default=5000)
+    parser.add_argument("--symbols", type=int, default=50)
+    parser.add_argument("--symbols-per-client", type=int, default=5)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--tick-rate", type=float, default=2, help="upstream polls per second")
+    parser.add_argument("--alerts-per-second", type=int, default=1000)
+    parser.add_argument("--max-alerts", type=int, default=live_stream.DEFAULT_MAX_ALERTS)
+    parser.add_argument("--readers", type=int, default=4, help="threads serving the simulated clients")
+    parser.add_argument("--slow-share", type=float, default=0.1)
+    parser.add_argument("--slow-delay", type=float, default=2.0, help="seconds a slow client stalls per read")
+    parser.add_argument("--url", help="load a running server over HTTP instead of an in-process broker")
+    parser.add_argument("--url-symbols", default="BTC-USD,ETH-USD")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    if args.url:
+        run_http(args)
+    else:
+        run_broker(args)
+
+
+if __name__ == "__main__":
+    main()
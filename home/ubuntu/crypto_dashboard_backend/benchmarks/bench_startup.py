@@ -0,0 +1,118 @@
+#!/usr/bin/env python3.11
+# Startup budget check for the API server and the pipeline. Each target runs in a fresh
+# interpreter under `python -X importtime`; the benchmark reports its time (median of
+# --repeat runs) and slowest imports, and fails when a target
+#   - takes longer than its budget,
+#   - imports a module that should only be loaded on first use (pandas, matplotlib, ...), or
+#   - writes to disk, connects anywhere or spawns a process while being imported.
+#
+#   python benchmarks/bench_startup.py
+#   python benchmarks/bench_startup.py --budget pipeline-import=150 --top 15
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+PROJECT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+HEAVY = ["pandas", "matplotlib", "markdown2", "weasyprint", "pyarrow", "msgpack", "tabulate", "pypdf"]
+# name -> (statement, budget in ms, modules it must not load, whether side effects are allowed)
+TARGETS = {
+    "app-import": ("import app", 50, HEAVY + ["flask", "sqlalchemy", "numpy"], False),
+    "services-import": ("from app.services import indicators, ohlcv_store, crypto_service", 250,
+                        HEAVY + ["flask", "sqlalchemy"], False),
+    "app-factory": ("import app; app.create_app()", 900, HEAVY + ["numpy"], True), # Creates the instance dir and DB
+    "pipeline-import": ("import run_daily_crypto_pipeline", 250, HEAVY + ["flask", "sqlalchemy", "data_api"], False),
+}
+
+# Runs inside the measured interpreter: times the statement and records side effects via an audit hook
+PROBE = r"""
+import json, os, sys, time
+side_effects = []
+def audit(event, args):
+    if event == "open":
+        path, mode, flags = args
+        writing = any(c in mode for c in "wax+") if isinstance(mode, str) else \
+            bool((flags or 0) & (os.O_WRONLY | os.O_RDWR | os.O_CREAT))
+        if writing:
+            side_effects.append(f"open {path!r} for writing")
+    elif event in ("os.mkdir", "os.remove", "os.rename", "socket.connect", "sqlite3.connect", "subprocess.Popen"):
+        side_effects.append(f"{event} {args[0]!r}")
+sys.addaudithook(audit)
+preloaded = set(sys.modules)
+start = time.perf_counter()
+exec(compile(%r, "<target>", "exec"))
+elapsed = time.perf_counter() - start
+print(json.dumps({"seconds": elapsed, "side_effects": side_effects, "modules": sorted(set(sys.modules) - preloaded)}))
+"""
+
+
+def run_target(statement: str, env: dict) -> tuple:
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", PROBE % statement], env=env,
+                               cwd=PROJECT_DIR, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1] if completed.stderr else "failed")
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    # importtime lines: "import time: self [us] | cumulative | imported package", nesting by indentation
+    imports = []
+    for line in completed.stderr.splitlines():
+        if line.startswith("import time:") and "self [us]" not in line:
+            _, cumulative, name = line.split("|")
+            imports.append((int(cumulative), name.strip(), len(name) - len(name.lstrip()) - 1))
+    return result, imports
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import-time startup budget check")
+    parser.add_argument("--targets", nargs="+", choices=list(TARGETS), default=list(TARGETS))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=8, help="slowest top-level imports to list per target")
+    parser.add_argument("--budget", action="append", default=[], metavar="TARGET=MS", help="override a budget")
+    args = parser.parse_args()
+    budgets = {name: target[1] for name, target in TARGETS.items()}
+    for override in args.budget:
+        name, ms = override.split("=")
+        budgets[name] = float(ms)
+
+    workdir = tempfile.mkdtemp(prefix="startup_bench_")
+    env = dict(os.environ,
+               PYTHONPATH=os.pathsep.join([os.path.join(PROJECT_DIR, "src"), os.path.join(PROJECT_DIR, "scripts")]),
+               PYTHONDONTWRITEBYTECODE="1", # Bytecode caches would show up as import-time writes
+               DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'startup.sqlite')}")
+    subprocess.run([sys.executable, "-m", "compileall", "-q", os.path.join(PROJECT_DIR, "src"),
+                    os.path.join(PROJECT_DIR, "scripts")], check=True) # Warm .pyc files, as in a deployed image
+
+    problems = []
+    for name in args.targets:
+        statement, _, forbidden, side_effects_allowed = TARGETS[name]
+        runs = [run_target(statement, env) for _ in range(args.repeat)]
+        seconds = sorted(result["seconds"] for result, _ in runs)
+        result, imports = runs[[r["seconds"] for r, _ in runs].index(seconds[len(seconds) // 2])]
+        ms = statistics.median(seconds) * 1e3
+        status = "ok" if ms <= budgets[name] else "OVER BUDGET"
+        print(f"\n{name}: {ms:.0f} ms (budget {budgets[name]:.0f} ms) {status}   [{statement}]")
+        # Outermost imports made by the statement itself (interpreter start-up imports are excluded)
+        top = sorted((imp for imp in imports if imp[2] == 0 and imp[1] in result["modules"]), reverse=True)[:args.top]
+        for cumulative, module, _ in top:
+            print(f"    {cumulative / 1e3:>8.1f} ms  {module}")
+
+        if ms > budgets[name]:
+            problems.append(f"{name}: {ms:.0f} ms > {budgets[name]:.0f} ms")
+        loaded = [module for module in forbidden if module in result["modules"]]
+        if loaded:
+            problems.append(f"{name}: imports {', '.join(loaded)} at startup")
+        if result["side_effects"] and not side_effects_allowed:
+            problems.append(f"{name}: side effects on import: {'; '.join(result['side_effects'][:5])}")
+
+    if problems:
+        print("\nStartup check failed:\n  " + "\n  ".join(problems))
+        sys.exit(1)
+    print("Startup check passed.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+#!/usr/bin/env python3.11
+# Regression benchmark suite: the daily pipeline end to end against a stub ApiClient, its
+# hot spots on their own (calculate_sma, the indicator engine, plot and PDF rendering) and
+# the main_bp endpoints through the Flask test client, all on synthetic OHLCV data.
+#
+# Results are written as JSON; --compare checks them against an earlier run and exits 1
+# when any benchmark got slower than --threshold (relative, on the median).
+#
+#   python benchmarks/bench_suite.py --symbols 2 20 --bars 30 365 --save baseline.json
+#   python benchmarks/bench_suite.py --symbols 2 20 --bars 30 365 --compare baseline.json --threshold 0.2
+#       (exits 1 on a slowdown above 20%; slowdowns under --min-delta seconds are treated as noise)
+#   python benchmarks/bench_suite.py --only api indicators --requests 500
+
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import types
+from datetime import datetime, timezone
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.join(BENCH_DIR, "..")
+sys.path.insert(0, os.path.join(PROJECT_DIR, "scripts"))
+sys.path.insert(0, os.path.join(PROJECT_DIR, "src"))
+
+import pandas as pd
+
+from stub_api import StubApiClient, synthetic_ohlcv
+
+GROUPS = ["indicators", "plot", "pdf", "pipeline", "api"]
+REPORT_DATE = "2026-01-01" # Fixed, so plot/report names and checkpoints do not depend on the day
+
+
+def measure(fn, repeat: int, warmup: int = 1) -> dict:
+    """Time `fn` `repeat` times (after `warmup` untimed calls); seconds is the median."""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def summarize(samples) -> dict:
+    ordered = sorted(samples)
+    return {"seconds": statistics.median(ordered), "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+            "min": ordered[0], "n": len(ordered)}
+
+
+def weasyprint_available() -> bool:
+    try:
+        import weasyprint # noqa: F401 (needs pango/cairo system libraries)
+    except Exception:
+        return False
+    return True
+
+
+def load_pipeline(workdir: str, symbols: list, bars: int, latency: float):
+    """Import scripts/run_daily_crypto_pipeline.py against a stub ApiClient and a scratch output tree."""
+    # The script imports the sandbox's data_api at module level; hand it the stub instead
+    data_api = types.ModuleType("data_api")
+    data_api.ApiClient = lambda: StubApiClient(latency=latency)
+    sys.modules["data_api"] = data_api
+
+    spec = importlib.util.spec_from_file_location(
+        "bench_pipeline", os.path.join(PROJECT_DIR, "scripts", "run_daily_crypto_pipeline.py"))
+    pipeline = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(pipeline)
+    sys.modules[spec.name] = pipeline
+    pipeline.SYMBOLS = symbols
+    pipeline.DATA_RANGE = f"{bars}d" # Backfill length: the stub serves as many bars as the range asks for
+    pipeline.TODAY_STR = REPORT_DATE
+    pipeline.REPORTS_ARCHIVE_DIR = os.path.join(workdir, "reports_archive")
+    pipeline.PLOTS_DIR = os.path.join(pipeline.REPORTS_ARCHIVE_DIR, "plots")
+    pipeline.OHLCV_STORE_DIR = os.path.join(workdir, "ohlcv")
+    pipeline.CHECKPOINT_ROOT = os.path.join(workdir, "checkpoints")
+    pipeline.RUN_SUMMARY_DIR = os.path.join(workdir, "runs")
+    pipeline.FETCH_RATE_LIMIT_PER_SEC = None # Measure our code, not the quota
+    if not weasyprint_available():
+        pipeline.REPORT_PDF_MODE = "deferred"
+    os.makedirs(pipeline.PLOTS_DIR, exist_ok=True)
+    return pipeline
+
+
+# --- Benchmark groups ---
+def bench_indicators(args, results, workdir):
+    from app.services import indicators
+
+    pipeline = sys.modules.get("bench_pipeline") or load_pipeline(os.path.join(workdir, "sma"), ["BENCH-USD"], 10, 0.0)
+    for bars in args.bars:
+        series = pd.Series(synthetic_ohlcv("BENCH-USD", bars)["adj_close"])
+        results[f"calculate_sma.bars={bars}"] = measure(lambda: pipeline.calculate_sma(series, 3), args.repeat)
+        for n in args.symbols:
+            prices = indicators.stack_prices([synthetic_ohlcv(f"SYM{i}-USD", bars)["adj_close"] for i in range(n)])
+            results[f"compute_indicators.symbols={n}.bars={bars}"] = measure(
+                lambda: indicators.compute_indicators(prices, short_window=3, long_window=7, horizon=3), args.repeat)
+
+
+def bench_plot(args, results, workdir):
+    from pipeline import plotting
+
+    for bars in args.bars:
+        df = pd.DataFrame(synthetic_ohlcv("BENCH-USD", bars))
+        df["date"] = pd.to_datetime(df["timestamp"], unit="s").dt.date
+        predictions = pd.DataFrame({"date": [df["date"].iloc[-1]], "predicted_price": [df["adj_close"].iloc[-1]]})
+        path = os.path.join(workdir, f"plot_{bars}.png")
+        job = plotting.make_job(df, "BENCH-USD", df["adj_close"].rolling(3).mean(), df["adj_close"].rolling(7).mean(),
+                                predictions, path, 3, 7)
+        results[f"render_plot.bars={bars}"] = measure(lambda: plotting.render_plot(job), max(1, args.repeat // 5))
+
+
+def bench_pdf(args, results, workdir):
+    from app.services import report_renderer
+
+    if not weasyprint_available():
+        print("pdf: skipped (weasyprint is not importable here)")
+        return
+    # The report of the last pipeline run (largest symbol count and history)
+    pipeline = sys.modules["bench_pipeline"]
+    with open(os.path.join(pipeline.REPORTS_ARCHIVE_DIR, f"daily_crypto_report_{REPORT_DATE}.md"), encoding="utf-8") as f:
+        markdown_text = f.read()
+    cache_dir = os.path.join(workdir, "pdf_sections")
+
+    def render(cached: bool):
+        if not cached:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+        report_renderer.render_report_pdf(markdown_text, os.path.join(workdir, "bench.pdf"),
+                                          pipeline.PLOTS_DIR, pipeline.REPORTS_ARCHIVE_DIR, cache_dir=cache_dir)
+
+    name = f"render_report_pdf.symbols={len(pipeline.SYMBOLS)}"
+    results[f"{name}.cold"] = measure(lambda: render(False), max(1, args.repeat // 5), warmup=0)
+    results[f"{name}.cached"] = measure(lambda: render(True), max(1, args.repeat // 5))
+
+
+def bench_pipeline(args, results, workdir):
+    from app.services import instrumentation
+    from pipeline import plotting
+
+    plot_lock = threading.Lock()
+
+    def render(job):
+        with plot_lock: # As run_pipeline() does with one plot worker: pyplot is not thread-safe
+            return plotting.render_plot(job)
+
+    for n in args.symbols:
+        for bars in args.bars:
+            samples = {} # result name -> seconds per repetition
+            for repetition in range(args.pipeline_repeat):
+                run_dir = os.path.join(workdir, f"pipeline_{n}x{bars}_{repetition}")
+                pipeline = load_pipeline(run_dir, [f"SYM{i}-USD" for i in range(n)], bars, args.latency)
+                for run in ("cold", "cached"):
+                    # cold: empty store, no checkpoints; cached: same day again, everything checkpointed
+                    recorder = instrumentation.RunRecorder()
+                    start = time.perf_counter()
+                    built = pipeline.build_pipeline(render=render, recorder=recorder)
+                    built.run(pipeline.SYMBOLS)
+                    elapsed = time.perf_counter() - start
+                    if built.failed:
+                        print(f"pipeline {n}x{bars} {run}: failed stages {built.failed}")
+                    name = f"pipeline.symbols={n}.bars={bars}.{run}"
+                    samples.setdefault(name, []).append(elapsed)
+                    # Stage time summed over symbols (branches overlap, so these add up to more than the wall time)
+                    for stage, totals in recorder.summary()["stages"].items():
+                        if totals["ran"]:
+                            samples.setdefault(f"{name}.{stage}", []).append(totals["seconds"])
+            for name, values in samples.items():
+                results[name] = summarize(values)
+
+
+def seed_store(store_dir: str, symbols: list, bars: int):
+    from app.services import ohlcv_store
+
+    for symbol in symbols:
+        ohlcv_store.append_bars(store_dir, symbol, "1d", ohlcv_store.to_bars(synthetic_ohlcv(symbol, bars)))
+
+
+def bench_api(args, results, workdir):
+    from app import create_app
+
+    bars = max(args.bars)
+    symbols = [f"SYM{i}-USD" for i in range(max(args.symbols))]
+    os.environ["OHLCV_STORE_DIR"] = store_dir = os.path.join(workdir, "api_ohlcv")
+    seed_store(store_dir, symbols, bars)
+    app = create_app()
+    client = app.test_client()
+    cache = app.extensions["response_cache"]
+    first = symbols[0]
+    batch = ",".join(symbols[:50])
+    endpoints = {
+        "index": "/api/",
+        "prices": f"/api/crypto/prices?symbol={first}&range=30d",
+        "prices_1y": f"/api/crypto/prices?symbol={first}&range=1y",
+        "prices_batch.json": f"/api/crypto/prices/batch?symbols={batch}&range=30d",
+        "analysis": f"/api/crypto/analysis?symbol={first}",
+        "prediction": f"/api/crypto/prediction?symbol={first}",
+        "reports_latest": "/api/reports/latest",
+        "reports_archive": "/api/reports/archive",
+        "user_settings": "/api/user/settings?userId=bench",
+        "alert_subscriptions": "/api/alerts/subscriptions?userId=bench",
+        "cache_stats": "/api/cache/stats",
+        "metrics": "/api/metrics",
+    }
+    for name, url in endpoints.items():
+        def request(uncached: bool = False):
+            if uncached:
+                cache.invalidate()
+            response = client.get(url)
+            if response.status_code >= 500:
+                raise RuntimeError(f"{url} returned {response.status_code}")
+
+        results[f"api.{name}"] = measure(request, args.requests)
+        if name.startswith(("prices", "analysis", "prediction")):
+            results[f"api.{name}.uncached"] = measure(lambda: request(True), max(1, args.requests // 5))
+
+
+# --- Baseline comparison ---
+def compare(results: dict, baseline: dict, threshold: float, min_delta: float) -> list:
+    """Print current vs baseline medians; returns the names that slowed down by more than `threshold`.
+
+    Slowdowns smaller than `min_delta` seconds are ignored: sub-millisecond timings jitter by
+    more than any sensible threshold.
+    """
+    regressions = []
+    print(f"\n{'benchmark':<56}{'baseline':>12}{'current':>12}{'change':>9}")
+    for name in sorted(set(results) | set(baseline)):
+        if name not in baseline or name not in results:
+            where = "new" if name not in baseline else "missing"
+            print(f"{name:<56}{'':>12}{'':>12}{where:>9}")
+            continue
+        old, new = baseline[name]["seconds"], results[name]["seconds"]
+        change = (new - old) / old if old else 0.0
+        flag = ""
+        if change > threshold and new - old > min_delta:
+            regressions.append(name)
+            flag = "  SLOWER"
+        print(f"{name:<56}{old * 1e3:>10.2f}ms{new * 1e3:>10.2f}ms{change:>+8.0%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pipeline and API regression benchmarks")
+    parser.add_argument("--symbols", type=int, nargs="+", default=[2, 20], help="symbol counts to run")
+    parser.add_argument("--bars", type=int, nargs="+", default=[30, 365], help="history lengths (daily bars)")
+    parser.add_argument("--only", nargs="+", choices=GROUPS, default=GROUPS)
+    parser.add_argument("--repeat", type=int, default=20, help="timed calls per micro-benchmark")
+    parser.add_argument("--pipeline-repeat", type=int, default=3, help="end-to-end runs per configuration")
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint")
+    parser.add_argument("--latency", type=float, default=0.0, help="stub ApiClient latency per call (seconds)")
+    parser.add_argument("--save", help="write the results to this JSON file (e.g. a new baseline)")
+    parser.add_argument("--compare", help="baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="relative slowdown reported as a regression")
+    parser.add_argument("--min-delta", type=float, default=0.001,
+                        help="absolute slowdown (seconds) below which a benchmark is never flagged")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch directory")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="crypto_bench_")
+    # Everything the app and the pipeline write goes to the scratch directory
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.sqlite')}"
+    os.environ["REPORTS_ARCHIVE_DIR"] = os.path.join(workdir, "reports_archive")
+    results = {}
+    started = time.perf_counter()
+    try:
+        # Pipeline first: the PDF benchmark renders the report it wrote
+        if "pipeline" in args.only or "pdf" in args.only:
+            bench_pipeline(args, results, workdir)
+        if "pdf" in args.only:
+            bench_pdf(args, results, workdir)
+        if "indicators" in args.only:
+            bench_indicators(args, results, workdir)
+        if "plot" in args.only:
+            bench_plot(args, results, workdir)
+        if "api" in args.only:
+            bench_api(args, results, workdir)
+    finally:
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+    if "pipeline" not in args.only:
+        results = {name: value for name, value in results.items() if not name.startswith("pipeline.")}
+
+    for name, result in results.items():
+        print(f"{name:<56}{result['seconds'] * 1e3:>10.2f}ms  p95 {result['p95'] * 1e3:.2f}ms  n={result['n']}")
+    print(f"\n{len(results)} benchmarks in {time.perf_counter() - started:.1f}s")
+
+    output = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "args": {key: value for key, value in vars(args).items() if key not in ("save", "compare")},
+        "results": results,
+    }
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(output, f, indent=2)
+        print(f"Results saved: {args.save}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("machine") != output["machine"]:
+            print("Note: the baseline was recorded on a different machine/Python; timings may not be comparable.")
+        regressions = compare(results, baseline["results"], args.threshold, args.min_delta)
+        if regressions:
+            print(f"\n{len(regressions)} benchmark(s) slower than the baseline by more than {args.threshold:.0%}")
+            sys.exit(1)
+        print(f"\nNo slowdowns above {args.threshold:.0%}.")
+
+
+if __name__ == "__main__":
+    main()
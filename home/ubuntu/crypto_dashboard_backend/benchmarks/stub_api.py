@@ -0,0 +1,83 @@
+# Local stand-in for the sandbox `data_api.ApiClient`.
+#
+# Returns synthetic YahooFinance/get_stock_chart responses and can inject
+# latency and failures, so the fetch stage can be exercised offline.
+# synthetic_ohlcv() generates the bars themselves (vectorized, so long histories are cheap).
+
+import random
+import threading
+import time
+import zlib
+
+import numpy as np
+
+
+class StubApiClient:
+    def __init__(self, latency: float = 0.1, jitter: float = 0.0, failure_rate: float = 0.0,
+                 hang_rate: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.hang_rate = hang_rate # Calls that sleep far past any sane timeout
+        self.calls = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def call_api(self, api_name: str, query: dict = None):
+        with self._lock:
+            self.calls += 1
+            roll = self._rng.random()
+            delay = self.latency + self._rng.random() * self.jitter
+        if roll < self.hang_rate:
+            time.sleep(3600)
+        time.sleep(delay)
+        if roll < self.hang_rate + self.failure_rate:
+            raise ConnectionError(f"injected failure for {query.get('symbol')}")
+        step = INTERVAL_SECONDS.get(query.get("interval", "1d"), 86400)
+        return chart_response(query["symbol"], bars=_range_to_bars(query.get("range", "10d"), step), step=step)
+
+
+INTERVAL_SECONDS = {"1m": 60, "2m": 120, "5m": 300, "15m": 900, "30m": 1800, "60m": 3600, "1h": 3600,
+                    "90m": 5400, "1d": 86400, "5d": 5 * 86400, "1wk": 7 * 86400, "1mo": 30 * 86400}
+
+
+def _range_to_bars(range_val: str, step: int = 86400) -> int:
+    units = {"d": 1, "mo": 30, "y": 365}
+    for suffix, days in units.items():
+        if range_val.endswith(suffix) and range_val[:-len(suffix)].isdigit():
+            return max(1, int(range_val[:-len(suffix)]) * days * 86400 // step)
+    return 10
+
+
+def synthetic_ohlcv(symbol: str, bars: int = 10, end_ts: int = None, step: int = 86400, seed: int = None,
+                    volatility: float = 0.02) -> dict:
+    """Random-walk OHLCV columns for `symbol` as NumPy arrays (deterministic per symbol/seed)."""
+    rng = np.random.default_rng(seed if seed is not None else zlib.crc32(symbol.encode()))
+    end_ts = end_ts or int(time.time()) // step * step
+    timestamps = end_ts - step * np.arange(bars - 1, -1, -1, dtype=np.int64)
+    start_price = 100 + rng.random() * 900
+    closes = np.maximum(0.01, start_price * np.exp(np.cumsum(rng.normal(0, volatility, bars))))
+    opens = np.concatenate(([start_price], closes[:-1]))
+    highs = np.maximum(opens, closes) * (1 + rng.random(bars) * 0.01)
+    lows = np.minimum(opens, closes) * (1 - rng.random(bars) * 0.01)
+    volumes = rng.integers(1_000, 1_000_000, bars)
+    return {"timestamp": timestamps, "open": opens, "high": highs, "low": lows, "close": closes,
+            "adj_close": closes.copy(), "volume": volumes}
+
+
+def chart_response(symbol: str, bars: int = 10, end_ts: int = None, step: int = 86400, seed: int = None) -> dict:
+    """Build a response shaped like YahooFinance/get_stock_chart for `symbol`."""
+    columns = synthetic_ohlcv(symbol, bars, end_ts, step, seed)
+    return {
+        "chart": {
+            "result": [{
+                "meta": {"symbol": symbol, "currency": "USD"},
+                "timestamp": columns["timestamp"].tolist(),
+                "indicators": {
+                    "quote": [{name: columns[name].tolist() for name in ("open", "high", "low", "close", "volume")}],
+                    "adjclose": [{"adjclose": columns["adj_close"].tolist()}]
+                }
+            }],
+            "error": None
+        }
+    }
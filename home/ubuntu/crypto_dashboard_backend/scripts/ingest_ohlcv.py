@@ -0,0 +1,55 @@
+#!/usr/bin/env python3.11
+# /home/ubuntu/crypto_dashboard_backend/scripts/ingest_ohlcv.py
+#
+# Backfill or update the OHLCV store for many symbols and any interval, e.g. months of
+# 5-minute bars, with bounded memory (see pipeline/ingest.py).
+#
+#   python scripts/ingest_ohlcv.py --interval 5m --range 3mo BTC-USD ETH-USD SOL-USD
+#   python scripts/ingest_ohlcv.py --interval 1h --range 1y --symbols-file symbols.txt
+
+import sys
+sys.path.append("/opt/.manus/.sandbox-runtime")
+
+import argparse
+import os
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from app.services.instrumentation import peak_rss_bytes
+from pipeline import ingest
+
+BASE_OUTPUT_DIR = "/home/ubuntu/crypto_dashboard_backend"
+OHLCV_STORE_DIR = os.environ.get("OHLCV_STORE_DIR") or os.path.join(BASE_OUTPUT_DIR, "data", "ohlcv")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Ingest OHLCV bars into the local store")
+    parser.add_argument("symbols", nargs="*")
+    parser.add_argument("--symbols-file", help="file with one symbol per line")
+    parser.add_argument("--interval", default="1d")
+    parser.add_argument("--range", default="10d", help="backfill range for symbols with nothing stored yet")
+    parser.add_argument("--store-dir", default=OHLCV_STORE_DIR)
+    parser.add_argument("--chunk-size", type=int, default=ingest.DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--rate-limit", type=float, default=5.0, help="API calls per second (0 disables)")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    symbols = list(args.symbols)
+    if args.symbols_file:
+        with open(args.symbols_file, encoding="utf-8") as f:
+            symbols += [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    if not symbols:
+        sys.exit("No symbols given")
+
+    from data_api import ApiClient
+    written = ingest.ingest_symbols(ApiClient(), symbols, args.store_dir, args.interval, args.range,
+                                    chunk_size=args.chunk_size, max_workers=args.workers,
+                                    rate_limit=args.rate_limit or None)
+    failed = [symbol for symbol, count in written.items() if count is None]
+    print(f"Stored {sum(count or 0 for count in written.values()):,} bars for {len(symbols) - len(failed)} symbols "
+          f"in {args.store_dir} (peak RSS {peak_rss_bytes() / 2**20:.0f} MB)")
+    if failed:
+        print(f"Failed: {', '.join(failed)}")
+        sys.exit(1)
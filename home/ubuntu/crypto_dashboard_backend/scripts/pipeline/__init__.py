@@ -0,0 +1,3 @@
+# Stage helpers for scripts/run_daily_crypto_pipeline.py.
+# Kept as a package next to the script so `python scripts/run_daily_crypto_pipeline.py`
+# can import them without any packaging setup.
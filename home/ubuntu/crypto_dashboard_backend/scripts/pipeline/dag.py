@@ -0,0 +1,283 @@
+# Small DAG executor for the daily crypto pipeline.
+#
+# A pipeline is a list of named stages. Per-symbol stages (fetch, indicators, ...) form one
+# branch per symbol. They run in order, each one for all symbols before the next: in parallel
+# on a thread pool, or, for batch stages, in a single call that computes every symbol that is
+# not cached at once (e.g. vectorized indicators). Global stages (markdown, pdf, index) run
+# afterwards and receive the per-symbol results as {symbol: value}.
+#
+# Every stage result is checkpointed to <checkpoint_dir>/<stage>/<symbol or _all>.pkl,
+# together with an input key: a hash of the stage name, its version and parameters and the
+# output keys of the stages it depends on. On the next run a stage whose input key matches
+# its checkpoint (and whose output files still exist) is loaded instead of run, and a stage
+# that re-runs but produces identical output leaves everything downstream cached.
+#
+# Sharded runs (see pipeline/work_queue.py) run the per-symbol branches of each shard with
+# global_stages=False, on workers sharing checkpoint_dir, and then the global stages once with
+# only_symbols=[], which takes every branch from the checkpoints the shards left.
+
+import hashlib
+import os
+import pickle
+import shutil
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+GLOBAL = "_all" # Checkpoint name of global (not per-symbol) stages
+_NOOP = nullcontext()
+
+
+class StageFailed(Exception):
+    pass
+
+
+class Stage:
+    def __init__(self, name: str, fn, deps=(), per_symbol: bool = False, version: int = 1,
+                 params=None, outputs=None, batch: bool = False):
+        self.name = name
+        # fn(symbol, **deps) per symbol, fn(**deps) for global stages; batch stages are per-symbol
+        # stages called as fn(symbols, **deps) with each dep as {symbol: value}, returning
+        # {symbol: value} (symbols left out get None). Results are checkpointed per symbol either way.
+        self.fn = fn
+        self.deps = tuple(deps)
+        self.per_symbol = per_symbol or batch
+        self.batch = batch
+        self.version = version # Bump when the stage's code changes to invalidate checkpoints
+        self.params = params # Anything else the output depends on (config values, dates, ...)
+        self.outputs = outputs # outputs(value) -> files that must exist for a checkpoint to be valid
+
+
+def _hash(*parts) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(repr(part).encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def output_key(value) -> str:
+    try:
+        return hashlib.sha256(pickle.dumps(value, protocol=4)).hexdigest()
+    except Exception:
+        return _hash(value)
+
+
+class Pipeline:
+    def __init__(self, stages, checkpoint_dir: str, max_workers: int = 4, recorder=None):
+        self.stages = {stage.name: stage for stage in stages}
+        self.recorder = recorder # Optional instrumentation.RunRecorder timing each stage run
+        self.order = [stage.name for stage in stages] # Must already be topologically sorted
+        # Per-symbol stages whose results global stages use (all a reused branch needs to load)
+        self.consumed = {dep for stage in stages if not stage.per_symbol for dep in stage.deps
+                         if self.stages[dep].per_symbol}
+        self.checkpoint_dir = checkpoint_dir
+        self.max_workers = max_workers
+        self.report = [] # (stage, symbol, status, seconds), in completion order
+        self._report_lock = threading.Lock()
+        for stage in stages:
+            for dep in stage.deps:
+                if dep not in self.stages or self.order.index(dep) > self.order.index(stage.name):
+                    raise ValueError(f"Stage {stage.name} depends on unknown or later stage {dep}")
+                if stage.per_symbol and not self.stages[dep].per_symbol:
+                    raise ValueError(f"Per-symbol stage {stage.name} cannot depend on global stage {dep}")
+
+    def downstream(self, name: str) -> set:
+        """`name` and every stage that depends on it, directly or not."""
+        result = {name}
+        for stage_name in self.order:
+            if any(dep in result for dep in self.stages[stage_name].deps):
+                result.add(stage_name)
+        return result
+
+    # --- Checkpoints ---
+    def _checkpoint_path(self, stage: str, symbol: str = None) -> str:
+        return os.path.join(self.checkpoint_dir, stage, f"{symbol or GLOBAL}.pkl")
+
+    def _load(self, stage: str, symbol: str = None):
+        try:
+            with open(self._checkpoint_path(stage, symbol), "rb") as f:
+                return pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+            return None
+
+    def _save(self, stage: str, symbol, checkpoint: dict):
+        path = self._checkpoint_path(stage, symbol)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{socket.gethostname()}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(checkpoint, f, protocol=4)
+        os.replace(tmp_path, path) # Atomic: a crash never leaves a half-written checkpoint
+
+    def _record(self, stage: str, symbol, status: str, seconds: float = 0.0):
+        with self._report_lock:
+            self.report.append((stage, symbol, status, seconds))
+        where = f" [{symbol}]" if symbol else ""
+        timing = f" in {seconds:.2f}s" if status == "ran" else ""
+        print(f"Stage {stage}{where}: {status}{timing}\n", end="") # One write, so lines from branches do not interleave
+
+    # --- Execution ---
+    def _cached(self, stage: Stage, symbol, input_key: str, forced: bool, reuse_only: bool):
+        """(value, output_key) from a usable checkpoint, or None if the stage has to run."""
+        checkpoint = self._load(stage.name, symbol)
+        if checkpoint is not None and (reuse_only or (not forced and checkpoint["input_key"] == input_key)):
+            files = stage.outputs(checkpoint["value"]) if stage.outputs else []
+            if all(os.path.exists(path) for path in files if path):
+                self._record(stage.name, symbol, "cached")
+                if self.recorder is not None:
+                    self.recorder.record(stage.name, symbol, status="cached")
+                return checkpoint["value"], checkpoint["output_key"]
+        if reuse_only:
+            raise StageFailed(f"no checkpoint for {stage.name} [{symbol}]")
+        return None
+
+    def _discard(self, stage: str, symbol):
+        # A failed run may have overwritten the checkpointed output files; never reuse it
+        try:
+            os.remove(self._checkpoint_path(stage, symbol))
+        except OSError:
+            pass
+
+    def _finish(self, stage: Stage, symbol, input_key: str, value, seconds: float):
+        key = output_key(value)
+        self._save(stage.name, symbol, {"input_key": input_key, "output_key": key, "value": value})
+        self._record(stage.name, symbol, "ran", seconds)
+        return value, key
+
+    def _run_stage(self, stage: Stage, symbol, dep_values: dict, dep_keys: list, forced: bool, reuse_only: bool):
+        input_key = _hash(stage.name, stage.version, stage.params, symbol, dep_keys)
+        cached = self._cached(stage, symbol, input_key, forced, reuse_only)
+        if cached is not None:
+            return cached
+        start = time.perf_counter()
+        try:
+            with self.recorder.timer(stage.name, symbol) if self.recorder is not None else _NOOP:
+                value = stage.fn(symbol, **dep_values) if stage.per_symbol else stage.fn(**dep_values)
+        except Exception:
+            self._discard(stage.name, symbol)
+            raise
+        return self._finish(stage, symbol, input_key, value, time.perf_counter() - start)
+
+    def _run_symbol(self, stage: Stage, symbol: str, results: dict, forced: set, reuse_only: bool):
+        """Run or load one per-symbol stage for `symbol`, adding it to results {stage: (value, output_key)}."""
+        name = stage.name
+        if reuse_only and name not in self.consumed:
+            return
+        if not reuse_only and any(dep not in results for dep in stage.deps):
+            self._record(name, symbol, "skipped (upstream failed)")
+            return
+        try:
+            if reuse_only: # Loaded from its checkpoint as it is, so its inputs are not needed
+                results[name] = self._run_stage(stage, symbol, {}, [], False, True)
+            else:
+                results[name] = self._run_stage(
+                    stage, symbol, {dep: results[dep][0] for dep in stage.deps},
+                    [results[dep][1] for dep in stage.deps], name in forced, False
+                )
+        except StageFailed as e:
+            self._record(name, symbol, f"skipped ({e})")
+        except Exception as e:
+            self._record(name, symbol, f"failed ({e})")
+
+    def _run_batch(self, stage: Stage, symbols, branches: dict, forced: set, reuse: dict):
+        # Symbols with a usable checkpoint load it; all the others run in a single call
+        pending = {} # symbol -> input key
+        for symbol in symbols:
+            results = branches[symbol]
+            if reuse[symbol] or any(dep not in results for dep in stage.deps):
+                self._run_symbol(stage, symbol, results, forced, reuse[symbol])
+                continue
+            input_key = _hash(stage.name, stage.version, stage.params, symbol, [results[dep][1] for dep in stage.deps])
+            cached = self._cached(stage, symbol, input_key, stage.name in forced, False)
+            if cached is not None:
+                results[stage.name] = cached
+            else:
+                pending[symbol] = input_key
+        if not pending:
+            return
+
+        start = time.perf_counter()
+        try:
+            with self.recorder.timer(stage.name, None, symbols=len(pending)) if self.recorder is not None else _NOOP:
+                values = stage.fn(list(pending), **{dep: {symbol: branches[symbol][dep][0] for symbol in pending}
+                                                    for dep in stage.deps})
+        except Exception as e:
+            for symbol in pending:
+                self._discard(stage.name, symbol)
+                self._record(stage.name, symbol, f"failed ({e})")
+            return
+        seconds = (time.perf_counter() - start) / len(pending) # Reported as an equal share per symbol
+        for symbol, input_key in pending.items():
+            branches[symbol][stage.name] = self._finish(stage, symbol, input_key, values.get(symbol), seconds)
+
+    def run(self, symbols, from_stage: str = None, only_symbols=None, force: bool = False,
+            global_stages: bool = True) -> dict:
+        """Run the pipeline; returns {stage: value} with per-symbol stages as {symbol: value}.
+
+        from_stage: re-run this stage and everything downstream of it, ignoring checkpoints.
+        only_symbols: run the per-symbol branches of these symbols only; other symbols are
+            taken from their checkpoints as they are (and left out if they have none).
+            An empty list runs no branch at all, only the global stages.
+        force: ignore every checkpoint.
+        global_stages: False runs the per-symbol branches only (one shard of a sharded run).
+        """
+        if from_stage is not None and from_stage not in self.stages:
+            raise ValueError(f"Unknown stage {from_stage}. Stages: {', '.join(self.order)}")
+        forced = set(self.order) if force else (self.downstream(from_stage) if from_stage else set())
+        only = {symbol.upper() for symbol in only_symbols} if only_symbols is not None else None
+        reuse = {symbol: only is not None and symbol.upper() not in only for symbol in symbols}
+        self.report = []
+
+        # Per-symbol stages run one after the other, each for all symbols at once: in parallel
+        # on the thread pool, or in one call for batch stages
+        branches = {symbol: {} for symbol in symbols} # symbol -> {stage: (value, output_key)}
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(symbols)))) as pool:
+            for name in self.order:
+                stage = self.stages[name]
+                if not stage.per_symbol:
+                    continue
+                if stage.batch:
+                    self._run_batch(stage, symbols, branches, forced, reuse)
+                else:
+                    list(pool.map(lambda symbol: self._run_symbol(stage, symbol, branches[symbol], forced, reuse[symbol]),
+                                  symbols))
+
+        values = {name: {} for name in self.order if self.stages[name].per_symbol}
+        keys = {name: [] for name in values}
+        for symbol, results in branches.items():
+            for name, (value, key) in results.items():
+                values[name][symbol] = value
+                keys[name].append((symbol, key))
+
+        for name in self.order:
+            stage = self.stages[name]
+            if stage.per_symbol or not global_stages:
+                continue
+            if any(dep not in values for dep in stage.deps):
+                self._record(name, None, "skipped (upstream failed)")
+                continue
+            try:
+                value, key = self._run_stage(stage, None, {dep: values[dep] for dep in stage.deps},
+                                             [keys[dep] for dep in stage.deps], name in forced, False)
+            except Exception as e:
+                self._record(name, None, f"failed ({e})")
+                continue
+            values[name] = value
+            keys[name] = key
+        return values
+
+    @property
+    def failed(self) -> list:
+        return [(stage, symbol) for stage, symbol, status, _ in self.report if status.startswith("failed")]
+
+
+def prune_checkpoints(root: str, keep: int = 7):
+    """Delete all but the newest `keep` run directories (named by date) under `root`."""
+    try:
+        runs = sorted(name for name in os.listdir(root) if os.path.isdir(os.path.join(root, name)))
+    except OSError:
+        return
+    for name in runs[:-keep] if keep else runs:
+        shutil.rmtree(os.path.join(root, name), ignore_errors=True)
@@ -0,0 +1,203 @@
+# Concurrent fetch stage for the daily crypto pipeline.
+#
+# Each symbol is fetched on a bounded thread pool. Every API call gets its own
+# timeout, failed calls are retried with exponential backoff, and a shared
+# token bucket keeps the request rate under the API quota.
+#
+# parse_chart_response() builds the DataFrame the report stages work with;
+# parse_chart_arrays() is the compact form used for ingestion: one structured NumPy
+# array per response in the OHLCV store's record layout (no object columns).
+
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# Parsed bars on their way into the OHLCV store: the same 56-byte records as
+# ohlcv_store.BAR_DTYPE (so appending them needs no conversion), instead of a DataFrame
+# plus a column of Python date objects. Prices stay float64: the store keeps them as sent.
+PRICE_FIELDS = ("open", "high", "low", "close", "adj_close")
+INGEST_DTYPE = np.dtype([("timestamp", "<i8")] + [(name, "<f8") for name in PRICE_FIELDS + ("volume",)])
+
+
+class FetchTimeout(Exception):
+    """Raised when a single API call takes longer than the per-symbol timeout."""
+
+
+class RateLimiter:
+    """Thread-safe token bucket allowing `rate` calls per second (bursts up to `burst`)."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = float(rate)
+        self.capacity = max(1, int(burst))
+        self._tokens = float(self.capacity)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def _call_with_timeout(func, timeout: float):
+    # ApiClient has no timeout of its own, so the call runs on a daemon thread
+    # that is abandoned if it does not finish in time.
+    outcome = {}
+
+    def target():
+        try:
+            outcome["value"] = func()
+        except Exception as e:  # Re-raised in the calling thread
+            outcome["error"] = e
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    if thread.is_alive():
+        raise FetchTimeout(f"call did not finish within {timeout}s")
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome.get("value")
+
+
+def chart_query(symbol: str, interval: str = "1d", range_val: str = "10d") -> dict:
+    return {
+        "symbol": symbol,
+        "interval": interval,
+        "range": range_val,
+        "region": "US",
+        "includeAdjustedClose": True,
+        "events": "div,split"
+    }
+
+
+# Ranges accepted by get_stock_chart, smallest first, with the days each one covers
+_CHART_RANGES = [("1d", 1), ("5d", 5), ("1mo", 30), ("3mo", 90), ("6mo", 182), ("1y", 365),
+                 ("2y", 730), ("5y", 1826), ("10y", 3652)]
+
+
+def covering_range(last_ts, default: str, now: float = None) -> str:
+    """Smallest chart range that reaches back to `last_ts` (the newest stored bar).
+
+    With nothing stored yet, the full `default` window is fetched.
+    """
+    if last_ts is None:
+        return default
+    now = time.time() if now is None else now
+    days_needed = (now - last_ts) / 86400 + 1 # +1 so the stored last bar is refetched and can be finalised
+    for range_val, days in _CHART_RANGES:
+        if days >= days_needed:
+            return range_val
+    return "max"
+
+
+def _chart_result(data: dict):
+    if data and data.get("chart") and data["chart"].get("result") and data["chart"]["result"][0]:
+        return data["chart"]["result"][0]
+    return None
+
+
+def parse_chart_arrays(data: dict, symbol: str, quiet: bool = False) -> np.ndarray:
+    """Turn a get_stock_chart response into a structured array of INGEST_DTYPE (empty if unusable).
+
+    Missing values become NaN; bars without an adjusted close are dropped.
+    """
+    dtype = INGEST_DTYPE
+    result = _chart_result(data)
+    if result is None:
+        if not quiet:
+            print(f"No data found for {symbol} or unexpected API response structure.")
+        return np.empty(0, dtype=dtype)
+    prices = result["indicators"]["quote"][0]
+    columns = dict(prices, adj_close=result["indicators"]["adjclose"][0]["adjclose"])
+    bars = np.empty(len(result["timestamp"]), dtype=dtype)
+    bars["timestamp"] = result["timestamp"]
+    for name in PRICE_FIELDS + ("volume",):
+        # None -> NaN; converted column by column, so only one column is ever held twice
+        bars[name] = np.array(columns[name], dtype=np.float64)
+    return bars[~np.isnan(bars["adj_close"])]
+
+
+def parse_chart_response(data: dict, symbol: str, quiet: bool = False):
+    """Turn a YahooFinance/get_stock_chart response into an OHLCV DataFrame (empty if unusable)."""
+    import pandas as pd
+
+    result = _chart_result(data)
+    if result is not None:
+        timestamps = result["timestamp"]
+        prices = result["indicators"]["quote"][0]
+        adj_close = result["indicators"]["adjclose"][0]["adjclose"]
+
+        df = pd.DataFrame({
+            "timestamp": timestamps,
+            "open": prices["open"],
+            "high": prices["high"],
+            "low": prices["low"],
+            "close": prices["close"],
+            "volume": prices["volume"],
+            "adj_close": adj_close
+        })
+        df["date"] = pd.to_datetime(df["timestamp"], unit="s").dt.date
+        df.dropna(subset=["adj_close"], inplace=True) # Ensure adj_close is not null
+        return df
+    if not quiet:
+        print(f"No data found for {symbol} or unexpected API response structure.")
+    return pd.DataFrame()
+
+
+def fetch_symbol(api_client, symbol: str, interval: str = "1d", range_val: str = "10d",
+                 timeout: float = 20.0, retries: int = 3, backoff: float = 1.0,
+                 rate_limiter: RateLimiter = None, parser=parse_chart_response):
+    """Fetch one symbol, retrying timeouts and errors with exponential backoff.
+
+    Returns parser(response, symbol): a DataFrame by default, see parse_chart_arrays() for
+    the compact form. A symbol that could not be fetched gives the parser's empty result.
+    """
+    query = chart_query(symbol, interval, range_val)
+    for attempt in range(retries + 1):
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        try:
+            data = _call_with_timeout(lambda: api_client.call_api("YahooFinance/get_stock_chart", query=query), timeout)
+            return parser(data, symbol)
+        except Exception as e:
+            if attempt == retries:
+                print(f"Error fetching data for {symbol} after {attempt + 1} attempts: {e}")
+                break
+            delay = backoff * (2 ** attempt) * (1 + random.random() * 0.25) # Jitter avoids retry bursts
+            print(f"Fetch attempt {attempt + 1} for {symbol} failed ({e}); retrying in {delay:.1f}s")
+            time.sleep(delay)
+    return parser(None, symbol, quiet=True)
+
+
+def fetch_all(api_client, symbols, interval: str = "1d", range_val: str = "10d",
+              max_workers: int = 8, timeout: float = 20.0, retries: int = 3,
+              backoff: float = 1.0, rate_limit: float = None) -> dict:
+    """Fetch every symbol concurrently and return {symbol: DataFrame}.
+
+    `range_val` is either one range for all symbols or a {symbol: range} mapping.
+    Symbols that could not be fetched map to an empty DataFrame, the same as
+    a failed `fetch_symbol()` call.
+    """
+    rate_limiter = RateLimiter(rate_limit, burst=max_workers) if rate_limit else None
+    results = {}
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="fetch") as pool:
+        futures = {}
+        for symbol in symbols:
+            symbol_range = range_val[symbol] if isinstance(range_val, dict) else range_val
+            futures[symbol] = pool.submit(fetch_symbol, api_client, symbol, interval, symbol_range,
+                                          timeout, retries, backoff, rate_limiter)
+        for symbol, future in futures.items():
+            results[symbol] = future.result()
+    print(f"Fetched {sum(1 for df in results.values() if not df.empty)}/{len(results)} symbols.")
+    return results
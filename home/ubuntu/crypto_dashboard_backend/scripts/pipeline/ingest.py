@@ -0,0 +1,51 @@
+# Memory-bounded ingestion of many symbols (or long intraday histories) into the OHLCV store.
+#
+# Each symbol is fetched, parsed into a compact structured array (fetch.parse_chart_arrays)
+# and appended to the store on its worker thread; only the number of bars written is kept.
+# Symbols are submitted in chunks, so at most `chunk_size` responses are queued or in flight
+# and peak memory depends on the chunk size and the history length, not on the symbol count.
+
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from app.services import ohlcv_store
+from pipeline.fetch import RateLimiter, covering_range, fetch_symbol, parse_chart_arrays
+
+DEFAULT_CHUNK_SIZE = 32
+
+
+def ingest_symbol(api_client, symbol: str, store_dir: str, interval: str, default_range: str,
+                  **fetch_options) -> int:
+    """Fetch what is newer than the stored bars of `symbol` and append it. Returns bars written."""
+    range_val = covering_range(ohlcv_store.last_timestamp(store_dir, symbol, interval), default_range)
+    bars = fetch_symbol(api_client, symbol, interval=interval, range_val=range_val,
+                        parser=parse_chart_arrays, **fetch_options)
+    if not len(bars):
+        return 0
+    return ohlcv_store.append_bars(store_dir, symbol, interval, bars) # Already in the store's record layout
+
+
+def ingest_symbols(api_client, symbols, store_dir: str, interval: str = "1d", default_range: str = "10d",
+                   chunk_size: int = DEFAULT_CHUNK_SIZE, max_workers: int = 8, timeout: float = 20.0,
+                   retries: int = 3, backoff: float = 1.0, rate_limit: float = None) -> dict:
+    """Ingest `symbols` chunk by chunk. Returns {symbol: bars written, or None if it failed}."""
+    rate_limiter = RateLimiter(rate_limit, burst=max_workers) if rate_limit else None
+    fetch_options = {"timeout": timeout, "retries": retries, "backoff": backoff, "rate_limiter": rate_limiter}
+    symbols = list(symbols)
+    written = {}
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="ingest") as pool:
+        for offset in range(0, len(symbols), chunk_size):
+            chunk = symbols[offset:offset + chunk_size]
+            futures = {pool.submit(ingest_symbol, api_client, symbol, store_dir, interval, default_range,
+                                   **fetch_options): symbol for symbol in chunk}
+            for future in as_completed(futures):
+                symbol = futures[future]
+                try:
+                    written[symbol] = future.result()
+                except Exception as e: # e.g. a store write error; fetch errors already yield 0 bars
+                    print(f"Error ingesting {symbol}: {e}")
+                    written[symbol] = None
+            print(f"Ingested {min(offset + chunk_size, len(symbols))}/{len(symbols)} symbols "
+                  f"({time.perf_counter() - start:.1f}s)")
+    return written
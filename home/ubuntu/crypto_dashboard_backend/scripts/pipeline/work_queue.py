@@ -0,0 +1,203 @@
+# Lease-based work queue for sharded pipeline runs.
+#
+# One SQLite file per run holds a task per shard of symbols plus one final "reduce" task.
+# Workers (processes on this host, or on hosts sharing the directory) claim a task under a
+# lease and renew it while they work on it. A worker that dies stops renewing; once its lease
+# runs out the task goes back to the queue for another worker, up to `max_attempts` claims.
+# The reduce task can only be claimed after every shard is done (or has failed for good).
+#
+# Claims run in `BEGIN IMMEDIATE` transactions, so two workers never get the same task. The
+# file must live on a filesystem with working POSIX locks (local disk, NFSv4, ...), and hosts
+# sharing it need reasonably synchronised clocks, as lease expiry uses wall-clock time.
+
+import json
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+SHARD = "shard"
+REDUCE = "reduce"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    symbols TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    result TEXT,
+    updated REAL
+)
+"""
+
+
+class WorkQueue:
+    def __init__(self, path: str, lease_seconds: float = 300.0, max_attempts: int = 3):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        with self._connect() as conn:
+            conn.execute(_SCHEMA)
+
+    def _connect(self):
+        # Short-lived connections: each call is one transaction, from any thread or process
+        return closing(sqlite3.connect(self.path, timeout=60, isolation_level=None))
+
+    def _write(self, conn):
+        conn.execute("BEGIN IMMEDIATE") # Take the write lock before reading, so claims cannot race
+        return conn
+
+    def create(self, shards) -> bool:
+        """Enqueue one task per shard (a list of symbols) and the reduce task.
+
+        Idempotent, so every worker can call it: returns False if the queue already holds these
+        shards, and raises ValueError if it was created for different ones.
+        """
+        shards = [list(shard) for shard in shards]
+        with self._connect() as conn:
+            self._write(conn)
+            try:
+                existing = [json.loads(row[0]) for row in
+                            conn.execute("SELECT symbols FROM tasks WHERE kind = ? ORDER BY id", (SHARD,))]
+                if existing:
+                    if existing != shards:
+                        raise ValueError(f"Work queue {self.path} holds different shards "
+                                         "(symbols or shard size changed); reset it to start over")
+                    conn.execute("COMMIT")
+                    return False
+                now = time.time()
+                conn.executemany("INSERT INTO tasks (id, kind, symbols, updated) VALUES (?, ?, ?, ?)",
+                                 [(i, SHARD, json.dumps(shard), now) for i, shard in enumerate(shards)]
+                                 + [(len(shards), REDUCE, "[]", now)])
+                conn.execute("COMMIT")
+                return True
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def reset(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM tasks")
+
+    def claim(self, worker: str):
+        """Lease the next runnable task to `worker`; returns it as a dict, or None if there is none."""
+        now = time.time()
+        with self._connect() as conn:
+            self._write(conn)
+            # Expired leases belong to dead (or stalled) workers: retry the task, or give up on it
+            conn.execute("UPDATE tasks SET status = 'failed', error = 'lease expired', updated = ? "
+                         "WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?",
+                         (now, now, self.max_attempts))
+            conn.execute("UPDATE tasks SET status = 'pending', updated = ? WHERE status = 'leased' AND lease_expires < ?",
+                         (now, now))
+            row = conn.execute(
+                "SELECT id, kind, symbols, attempts FROM tasks WHERE status = 'pending' AND (kind = ? OR NOT EXISTS "
+                "(SELECT 1 FROM tasks WHERE kind = ? AND status IN ('pending', 'leased'))) ORDER BY id LIMIT 1",
+                (SHARD, SHARD)
+            ).fetchone()
+            if row is not None:
+                conn.execute("UPDATE tasks SET status = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1, "
+                             "updated = ? WHERE id = ?", (worker, now + self.lease_seconds, now, row[0]))
+            conn.execute("COMMIT")
+        if row is None:
+            return None
+        return {"id": row[0], "kind": row[1], "symbols": json.loads(row[2]), "attempt": row[3] + 1}
+
+    def renew(self, task_id: int, worker: str) -> bool:
+        """Extend `worker`'s lease on a task; False if the lease was lost (expired and reclaimed)."""
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute("UPDATE tasks SET lease_expires = ?, updated = ? WHERE id = ? AND worker = ? "
+                                  "AND status = 'leased'", (now + self.lease_seconds, now, task_id, worker))
+            return cursor.rowcount == 1
+
+    def complete(self, task_id: int, worker: str, result=None) -> bool:
+        with self._connect() as conn:
+            cursor = conn.execute("UPDATE tasks SET status = 'done', result = ?, error = NULL, updated = ? "
+                                  "WHERE id = ? AND worker = ? AND status = 'leased'",
+                                  (json.dumps(result), time.time(), task_id, worker))
+            return cursor.rowcount == 1
+
+    def fail(self, task_id: int, worker: str, error: str) -> bool:
+        """Release a task after an error: it is retried unless it has used up its attempts."""
+        with self._connect() as conn:
+            cursor = conn.execute("UPDATE tasks SET status = CASE WHEN attempts < ? THEN 'pending' ELSE 'failed' END, "
+                                  "error = ?, updated = ? WHERE id = ? AND worker = ? AND status = 'leased'",
+                                  (self.max_attempts, error, time.time(), task_id, worker))
+            return cursor.rowcount == 1
+
+    def tasks(self) -> list:
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            rows = conn.execute("SELECT * FROM tasks ORDER BY id").fetchall()
+        return [dict(row, symbols=json.loads(row["symbols"]), result=json.loads(row["result"] or "null")) for row in rows]
+
+    def finished(self) -> bool:
+        with self._connect() as conn:
+            pending = conn.execute("SELECT COUNT(*) FROM tasks WHERE status IN ('pending', 'leased')").fetchone()[0]
+        return pending == 0
+
+
+class Heartbeat:
+    """Renews a task's lease in the background while the worker runs it."""
+
+    def __init__(self, queue: WorkQueue, task_id: int, worker: str):
+        self.queue = queue
+        self.task_id = task_id
+        self.worker = worker
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"lease-{task_id}", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.queue.lease_seconds / 3):
+            if not self.queue.renew(self.task_id, self.worker):
+                self.lost = True
+                print(f"Worker {self.worker}: lost the lease on task {self.task_id}; another worker will redo it")
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def run_worker(queue: WorkQueue, worker: str, run_shard, reduce, poll_seconds: float = 5.0) -> bool:
+    """Claim and run tasks until none are left, including the reduce task.
+
+    run_shard(symbols) and reduce() return a JSON-serialisable result with a "failed" list.
+    Returns False if any task this worker ran raised or reported failures.
+    """
+    ok = True
+    while True:
+        task = queue.claim(worker)
+        if task is None:
+            if queue.finished():
+                return ok
+            # Other workers hold the remaining leases; keep polling in case one of them dies
+            time.sleep(poll_seconds)
+            continue
+        name = f"shard {task['id']} ({len(task['symbols'])} symbols)" if task["kind"] == SHARD else "reduce"
+        print(f"Worker {worker}: running {name}, attempt {task['attempt']}")
+        start = time.perf_counter()
+        with Heartbeat(queue, task["id"], worker):
+            try:
+                result = run_shard(task["symbols"]) if task["kind"] == SHARD else reduce()
+            except Exception as e:
+                print(f"Worker {worker}: {name} failed: {e}")
+                queue.fail(task["id"], worker, str(e))
+                ok = False
+                continue
+        if result.get("failed"):
+            ok = False
+        if queue.complete(task["id"], worker, result):
+            print(f"Worker {worker}: finished {name} in {time.perf_counter() - start:.1f}s")
+        else:
+            print(f"Worker {worker}: finished {name} after losing its lease; the other worker's result counts")
@@ -3,186 +3,272 @@
 
 import sys
 sys.path.append("/opt/.manus/.sandbox-runtime")
-from data_api import ApiClient
 
+import argparse
+import functools
 import json
-import pandas as pd
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
+import multiprocessing
 import os
-import markdown2 # For MD to HTML conversion
-from weasyprint import HTML, CSS # For HTML to PDF conversion
+import socket
+import threading
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from app import create_app
+from app.services import alert_service, crypto_service, forecasting, indicators, instrumentation, ohlcv_store, report_renderer, report_service # report_renderer: MD -> HTML -> PDF
+from pipeline.fetch import RateLimiter
+from pipeline import dag, ingest, plotting, work_queue
 
 # --- Configuration ---
 SYMBOLS = ["BTC-USD", "ETH-USD"]
-DATA_RANGE = "10d" # Fetch 10 days to have enough data for 7-day SMA and recent analysis
+DATA_INTERVAL = "1d"
+DATA_RANGE = os.environ.get("DATA_RANGE", "10d") # Initial backfill when a symbol has nothing stored yet
+ANALYSIS_BARS = 10 # Enough data for 7-day SMA and recent analysis
 SMA_WINDOW_SHORT = 3
 SMA_WINDOW_LONG = 7 # For trend indication
 PREDICTION_DAYS = 3 # Predict for next 3 days
 
+# Fetch stage: bounded concurrency, per-call timeout, retries with backoff and a request rate cap
+FETCH_MAX_WORKERS = int(os.environ.get("FETCH_MAX_WORKERS", "8"))
+FETCH_TIMEOUT_SECONDS = 20
+FETCH_RETRIES = 3
+FETCH_BACKOFF_SECONDS = 1.0
+FETCH_RATE_LIMIT_PER_SEC = 5 # Stay under the API quota; None disables the limiter
+
+# PDF stage: "eager" renders the PDF here, "deferred" leaves it to the first download request
+REPORT_PDF_MODE = os.environ.get("REPORT_PDF_MODE", "eager")
+
+# Plot stage: number of worker processes rendering PNGs (1 renders in this process)
+PLOT_WORKERS = int(os.environ.get("PLOT_WORKERS", str(os.cpu_count() or 1)))
+
 BASE_OUTPUT_DIR = "/home/ubuntu/crypto_dashboard_backend"
 REPORTS_ARCHIVE_DIR = os.path.join(BASE_OUTPUT_DIR, "reports_archive")
 PLOTS_DIR = os.path.join(REPORTS_ARCHIVE_DIR, "plots") # Store plots alongside reports for simplicity
+OHLCV_STORE_DIR = os.environ.get("OHLCV_STORE_DIR") or os.path.join(BASE_OUTPUT_DIR, "data", "ohlcv") # Shared with the API
+# Stage checkpoints, one directory per run date (see pipeline/dag.py)
+CHECKPOINT_ROOT = os.environ.get("PIPELINE_CHECKPOINT_DIR") or os.path.join(BASE_OUTPUT_DIR, "data", "pipeline_checkpoints")
+CHECKPOINT_KEEP_RUNS = 7
+# Run summaries (per-stage/per-symbol timings, memory) as JSON; PIPELINE_TRACEMALLOC=1 adds
+# Python allocation tracking (slower), PIPELINE_METRICS=0 turns recording off
+RUN_SUMMARY_DIR = os.environ.get("PIPELINE_RUN_SUMMARY_DIR") or os.path.join(BASE_OUTPUT_DIR, "data", "pipeline_runs")
+PIPELINE_METRICS = os.environ.get("PIPELINE_METRICS", "1") == "1"
+PIPELINE_TRACEMALLOC = os.environ.get("PIPELINE_TRACEMALLOC", "0") == "1"
+# Sharded runs (--worker / --local-workers): SYMBOLS is split into shards of SHARD_SIZE on a work
+# queue in the run's checkpoint directory. Workers on other hosts must share CHECKPOINT_ROOT,
+# OHLCV_STORE_DIR and REPORTS_ARCHIVE_DIR. A shard whose worker stops renewing its lease for
+# SHARD_LEASE_SECONDS is handed to another worker (at most SHARD_MAX_ATTEMPTS claims).
+SHARD_SIZE = int(os.environ.get("PIPELINE_SHARD_SIZE", "50"))
+SHARD_LEASE_SECONDS = float(os.environ.get("PIPELINE_SHARD_LEASE_SECONDS", "300"))
+SHARD_MAX_ATTEMPTS = 3
+SHARD_POLL_SECONDS = 5.0 # How often an idle worker checks for reclaimable shards
 # STATIC_PLOTS_DIR = os.path.join(BASE_OUTPUT_DIR, "app", "static", "plots") # Alternative for serving plots directly
 
-# Ensure output directories exist
-os.makedirs(REPORTS_ARCHIVE_DIR, exist_ok=True)
-os.makedirs(PLOTS_DIR, exist_ok=True)
-# os.makedirs(STATIC_PLOTS_DIR, exist_ok=True)
-
-# Initialize API client
-api_client = ApiClient()
+# Importing this module has no side effects: pandas and the API client are loaded by the
+# stages that use them (matplotlib and WeasyPrint by pipeline/plotting.py and
+# report_renderer), and output directories are created when a run starts.
+api_client = None
+_api_client_lock = threading.Lock()
 
 TODAY_STR = datetime.now().strftime("%Y-%m-%d")
 
 # --- Helper Functions ---
-def fetch_stock_data(symbol, interval="1d", range_val="10d"):
-    print(f"Fetching data for {symbol}...")
-    try:
-        data = api_client.call_api(
-            "YahooFinance/get_stock_chart",
-            query={
-                "symbol": symbol,
-                "interval": interval,
-                "range": range_val,
-                "region": "US",
-                "includeAdjustedClose": True,
-                "events": "div,split"
-            }
-        )
-        if data and data.get("chart") and data["chart"].get("result") and data["chart"]["result"][0]:
-            result = data["chart"]["result"][0]
-            timestamps = result["timestamp"]
-            prices = result["indicators"]["quote"][0]
-            adj_close = result["indicators"]["adjclose"][0]["adjclose"]
-            
-            df = pd.DataFrame({
-                "timestamp": timestamps,
-                "open": prices["open"],
-                "high": prices["high"],
-                "low": prices["low"],
-                "close": prices["close"],
-                "volume": prices["volume"],
-                "adj_close": adj_close
-            })
-            df["date"] = pd.to_datetime(df["timestamp"], unit="s").dt.date
-            df.dropna(subset=["adj_close"], inplace=True) # Ensure adj_close is not null
-            return df.tail(10) # Ensure we have enough for 7-day analysis + buffer
-        else:
-            print(f"No data found for {symbol} or unexpected API response structure.")
-            return pd.DataFrame()
-    except Exception as e:
-        print(f"Error fetching data for {symbol}: {e}")
-        return pd.DataFrame()
+def ensure_output_dirs():
+    os.makedirs(REPORTS_ARCHIVE_DIR, exist_ok=True)
+    os.makedirs(PLOTS_DIR, exist_ok=True)
+    # os.makedirs(STATIC_PLOTS_DIR, exist_ok=True)
+
+def get_api_client():
+    global api_client
+    with _api_client_lock: # Fetch branches start concurrently
+        if api_client is None:
+            from data_api import ApiClient # Sandbox runtime module
+            api_client = ApiClient()
+    return api_client
+
+def load_stored_data(symbol, bars=ANALYSIS_BARS):
+    import pandas as pd
+
+    # Memory-mapped read of the newest bars; only this small tail is copied into the DataFrame
+    stored = ohlcv_store.load_bars(OHLCV_STORE_DIR, symbol, DATA_INTERVAL)[-bars:]
+    df = pd.DataFrame(stored)
+    if not df.empty:
+        df["date"] = pd.to_datetime(df["timestamp"], unit="s").dt.date
+        if not df["volume"].isna().any():
+            df["volume"] = df["volume"].astype("int64") # Keep report tables showing whole volumes
+    return df
 
 def calculate_sma(data_series, window):
     return data_series.rolling(window=window).mean()
 
-def generate_plot(df, symbol, sma_short, sma_long, predictions_df, filename):
-    plt.style.use("seaborn-v0_8-darkgrid") # Using a style that might be available
-    fig, ax = plt.subplots(figsize=(12, 6))
-    
-    ax.plot(df["date"], df["adj_close"], label="Adjusted Close", color="blue", marker=".")
-    ax.plot(df["date"], sma_short, label=f"SMA-{SMA_WINDOW_SHORT}", color="orange")
-    ax.plot(df["date"], sma_long, label=f"SMA-{SMA_WINDOW_LONG}", color="green")
-    
-    if not predictions_df.empty:
-        ax.plot(predictions_df["date"], predictions_df["predicted_price"], label="SMA Prediction", color="red", linestyle="--", marker="x")
-
-    ax.set_title(f"{symbol} Price Trend and {SMA_WINDOW_SHORT}-day Prediction", fontsize=16)
-    ax.set_xlabel("Date", fontsize=12)
-    ax.set_ylabel("Price (USD)", fontsize=12)
-    ax.legend()
-    ax.grid(True)
-    fig.autofmt_xdate()
-    ax.xaxis.set_major_formatter(mdates.DateFormatter("%Y-%m-%d"))
-    plt.xticks(rotation=45)
-    plt.tight_layout()
-    plt.savefig(filename)
-    plt.close(fig)
-    print(f"Plot saved: {filename}")
+def update_report_index(symbol_summaries, md_report_filename, pdf_report_filename):
+    app = create_app()
+    app.config["REPORTS_ARCHIVE_DIR"] = REPORTS_ARCHIVE_DIR
+    with app.app_context():
+        report_service.record_report(TODAY_STR, symbol_summaries, md_report_filename, pdf_report_filename)
+    print(f"Report index updated for {TODAY_STR}")
 
-# --- Main Pipeline Logic ---
-def run_pipeline():
-    all_reports_data = []
+def send_alerts():
+    # Evaluate every active alert subscription against the prices just stored; delivery (and
+    # pushing the alerts to open /api/stream connections) finishes before this returns
+    app = create_app()
+    app.config["OHLCV_STORE_DIR"] = OHLCV_STORE_DIR
+    with app.app_context():
+        triggered = alert_service.check_and_send_alerts(dispatcher=alert_service.get_dispatcher(app), wait=True)
+    print(f"Alerts checked: {len(triggered)} triggered")
+    return triggered
 
-    for symbol in SYMBOLS:
-        print(f"\nProcessing {symbol}...")
-        df_data = fetch_stock_data(symbol, range_val=DATA_RANGE)
+# --- Pipeline Stages ---
+# run_pipeline() runs these through pipeline.dag: fetch -> indicators -> predict -> plot ->
+# section per symbol (symbols in parallel; indicators and predict for all of them in one
+# vectorized batch each), then markdown -> pdf -> index and alerts. Each stage is checkpointed
+# under CHECKPOINT_ROOT/<date>, so a rerun only redoes stages whose inputs changed.
+def stage_fetch(symbol, rate_limiter=None):
+    # Only fetch what is newer than the last stored bar; the first run backfills DATA_RANGE.
+    # The response is parsed into a compact array and appended without building a DataFrame.
+    print(f"Fetching data for {symbol}...")
+    appended = ingest.ingest_symbol(get_api_client(), symbol, OHLCV_STORE_DIR, DATA_INTERVAL, DATA_RANGE,
+                                    timeout=FETCH_TIMEOUT_SECONDS, retries=FETCH_RETRIES, backoff=FETCH_BACKOFF_SECONDS,
+                                    rate_limiter=rate_limiter)
+    if appended:
+        print(f"Stored {appended} new/updated bars for {symbol}.")
+    return load_stored_data(symbol)
 
-        if df_data.empty or len(df_data) < SMA_WINDOW_LONG:
+def stage_indicators(symbols, fetch):
+    # Batch stage: the indicators of every symbol that is not cached are computed in one
+    # vectorized pass over their stacked (left-padded) price series; each symbol gets its row
+    usable = []
+    for symbol in symbols:
+        if fetch[symbol].empty or len(fetch[symbol]) < SMA_WINDOW_LONG:
             print(f"Not enough data for {symbol} to process. Skipping.")
-            all_reports_data.append(f"## {symbol}\n\nInsufficient data to generate analysis.\n")
+        else:
+            usable.append(symbol)
+    results = indicators.compute_indicators(indicators.stack_prices([fetch[symbol]["adj_close"].to_numpy() for symbol in usable]),
+                                            short_window=SMA_WINDOW_SHORT, long_window=SMA_WINDOW_LONG,
+                                            horizon=PREDICTION_DAYS)
+    analyses = dict.fromkeys(symbols)
+    for row, symbol in enumerate(usable):
+        bars = len(fetch[symbol]) # Drop the padding in front of shorter series
+        analyses[symbol] = {
+            "sma_short": results["sma_short"][row, -bars:],
+            "sma_long": results["sma_long"][row, -bars:],
+            "daily_change_pct": results["daily_change_pct"][row, -bars:],
+            "trend": indicators.TREND_LABELS[int(results["trend"][row])],
+        }
+    return analyses
+
+def stage_predict(symbols, fetch, indicators):
+    # Batch stage: forecast each symbol by the model (SMA extrapolation, EMA, Holt, rolling OLS)
+    # with the lowest walk-forward backtest error on its stored history, scoring all symbols
+    # in one vectorized backtest (see services/forecasting.py). The stage checkpoints, shared
+    # by sharded workers, take the place of crypto_service's per-process model cache.
+    predictions = dict.fromkeys(symbols)
+    candidates = [symbol for symbol in symbols if indicators[symbol] is not None]
+    selections = crypto_service.score_models(OHLCV_STORE_DIR, candidates, DATA_INTERVAL) if candidates else {}
+    for symbol, selection in selections.items():
+        if selection is None:
             continue
+        last_date = fetch[symbol]["date"].iloc[-1]
+        predictions[symbol] = {
+            "model": selection["model"],
+            "mape": selection["mape"],
+            "predictions": [
+                {"date": last_date + timedelta(days=i), "predicted_price": price}
+                for i, price in enumerate(selection["forecast"], start=1)
+            ],
+        }
+    return predictions
 
-        # Analysis
-        df_data[f"sma_{SMA_WINDOW_SHORT}"] = calculate_sma(df_data["adj_close"], SMA_WINDOW_SHORT)
-        df_data[f"sma_{SMA_WINDOW_LONG}"] = calculate_sma(df_data["adj_close"], SMA_WINDOW_LONG)
-        df_data["daily_change_pct"] = df_data["adj_close"].pct_change() * 100
-        
-        latest_data = df_data.iloc[-1]
-        current_price = latest_data["adj_close"]
-        daily_change = latest_data["daily_change_pct"]
-        trend_sma_short = latest_data[f"sma_{SMA_WINDOW_SHORT}"]
-        trend_sma_long = latest_data[f"sma_{SMA_WINDOW_LONG}"]
-
-        trend_direction = "Neutral"
-        if trend_sma_short > trend_sma_long:
-            trend_direction = "Upward"
-        elif trend_sma_short < trend_sma_long:
-            trend_direction = "Downward"
-
-        # Prediction (Simple SMA extension)
-        predictions = []
-        last_sma_value = df_data[f"sma_{SMA_WINDOW_SHORT}"].iloc[-1]
-        last_date = df_data["date"].iloc[-1]
-        
-        # For simplicity, let's assume the last SMA value is the prediction for the next day
-        # A more robust prediction would extrapolate the trend or use a more complex model
-        # For this example, we will just use the last SMA value for all prediction days
-        # or a very simple linear extrapolation of the last two SMA points.
-        
-        if len(df_data[f"sma_{SMA_WINDOW_SHORT}"].dropna()) >= 2:
-            sma_series = df_data[f"sma_{SMA_WINDOW_SHORT}"].dropna()
-            last_sma_val = sma_series.iloc[-1]
-            second_last_sma_val = sma_series.iloc[-2]
-            sma_slope = last_sma_val - second_last_sma_val
-        else:
-            sma_slope = 0 # Default to no change if not enough data for slope
-            last_sma_val = df_data[f"sma_{SMA_WINDOW_SHORT}"].dropna().iloc[-1] if not df_data[f"sma_{SMA_WINDOW_SHORT}"].dropna().empty else current_price
-
-        for i in range(1, PREDICTION_DAYS + 1):
-            predicted_date = last_date + timedelta(days=i)
-            predicted_price = last_sma_val + (sma_slope * i) # Linear extrapolation of SMA
-            predictions.append({"date": predicted_date, "predicted_price": predicted_price})
-        
-        predictions_df = pd.DataFrame(predictions)
-        if not predictions_df.empty:
-             predictions_df["date"] = pd.to_datetime(predictions_df["date"]).dt.date
-
-        # Plotting
-        plot_filename = os.path.join(PLOTS_DIR, f"{symbol.lower().replace('-usd', '')}_price_trend_{TODAY_STR}.png")
-        generate_plot(df_data, symbol, df_data[f"sma_{SMA_WINDOW_SHORT}"], df_data[f"sma_{SMA_WINDOW_LONG}"], predictions_df, plot_filename)
-
-        # Report Content for this symbol
-        report_symbol_md = f"## {symbol} Analysis ({TODAY_STR})\n\n"
-        report_symbol_md += f"**Current Price:** ${current_price:,.2f}\n"
-        report_symbol_md += f"**Daily Change:** {daily_change:.2f}%\n"
-        report_symbol_md += f"**Trend (SMA {SMA_WINDOW_SHORT} vs SMA {SMA_WINDOW_LONG}):** {trend_direction}\n\n"
-        report_symbol_md += f"**Price Data (Last 7 days):**\n"
-        report_symbol_md += df_data.tail(7)[["date", "open", "high", "low", "close", "adj_close", "volume"]].to_markdown(index=False) + "\n\n"
-        report_symbol_md += f"**Predicted Prices (SMA-{SMA_WINDOW_SHORT} based, next {PREDICTION_DAYS} days):**\n"
-        if not predictions_df.empty:
-            report_symbol_md += predictions_df[["date", "predicted_price"]].to_markdown(index=False) + "\n\n"
-        else:
-            report_symbol_md += "Prediction data not available.\n\n"
-        report_symbol_md += f"![{symbol} Price Trend]({os.path.basename(plot_filename)})\n\n"
-        # Note: For PDF, image path needs to be absolute or resolvable by WeasyPrint
-        # For simplicity, we assume the markdown renderer for the website can handle relative paths if plots are in a subfolder.
-        # For PDF, we might need to adjust path or embed. For now, using basename.
+def prediction_label(prediction):
+    if not prediction:
+        return "Prediction"
+    if prediction["mape"] is None:
+        return f"{prediction['model']} model"
+    return f"{prediction['model']} model, backtest MAPE {prediction['mape']:.2f}%"
+
+def analysis_frame(fetch, analysis):
+    df_data = fetch.copy()
+    df_data[f"sma_{SMA_WINDOW_SHORT}"] = analysis["sma_short"]
+    df_data[f"sma_{SMA_WINDOW_LONG}"] = analysis["sma_long"]
+    df_data["daily_change_pct"] = analysis["daily_change_pct"]
+    return df_data
+
+def predictions_frame(predictions):
+    import pandas as pd
+
+    predictions_df = pd.DataFrame(predictions or [])
+    if not predictions_df.empty:
+         predictions_df["date"] = pd.to_datetime(predictions_df["date"]).dt.date
+    return predictions_df
+
+def plot_path(symbol):
+    return os.path.join(PLOTS_DIR, f"{symbol.lower().replace('-usd', '')}_price_trend_{TODAY_STR}.png")
+
+def stage_plot(symbol, fetch, indicators, predict, render=plotting.render_plot):
+    if indicators is None:
+        return None
+    df_data = analysis_frame(fetch, indicators)
+    plot_filename = render(plotting.make_job(
+        df_data, symbol, df_data[f"sma_{SMA_WINDOW_SHORT}"], df_data[f"sma_{SMA_WINDOW_LONG}"],
+        predictions_frame(predict and predict["predictions"]), plot_path(symbol), SMA_WINDOW_SHORT, SMA_WINDOW_LONG,
+        prediction_label=f"Prediction ({predict['model']})" if predict else "Prediction"
+    ))
+    print(f"Plot saved: {plot_filename}")
+    return plot_filename
+
+def insufficient_data_section(symbol):
+    return {"markdown": f"## {symbol}\n\nInsufficient data to generate analysis.\n",
+            "summary": ("Insufficient data to generate analysis.", None)}
+
+def stage_section(symbol, fetch, indicators, predict, plot):
+    # This symbol's part of the report: markdown plus its (analysis, prediction) summaries
+    # for the report index. Rendered per symbol, so sharded runs build sections in parallel.
+    if indicators is None:
+        return insufficient_data_section(symbol)
+
+    df_data = analysis_frame(fetch, indicators)
+    latest_data = df_data.iloc[-1]
+    current_price = latest_data["adj_close"]
+    daily_change = latest_data["daily_change_pct"]
+    trend_direction = indicators["trend"]
+    predictions = predict["predictions"] if predict else []
+    predictions_df = predictions_frame(predictions)
+    plot_filename = plot or plot_path(symbol)
 
-        all_reports_data.append(report_symbol_md)
+    # Report Content for this symbol
+    report_symbol_md = f"## {symbol} Analysis ({TODAY_STR})\n\n"
+    report_symbol_md += f"**Current Price:** ${current_price:,.2f}\n"
+    report_symbol_md += f"**Daily Change:** {daily_change:.2f}%\n"
+    report_symbol_md += f"**Trend (SMA {SMA_WINDOW_SHORT} vs SMA {SMA_WINDOW_LONG}):** {trend_direction}\n\n"
+    report_symbol_md += f"**Price Data (Last 7 days):**\n"
+    report_symbol_md += df_data.tail(7)[["date", "open", "high", "low", "close", "adj_close", "volume"]].to_markdown(index=False) + "\n\n"
+    report_symbol_md += f"**Predicted Prices ({prediction_label(predict)}, next {PREDICTION_DAYS} days):**\n"
+    if not predictions_df.empty:
+        report_symbol_md += predictions_df[["date", "predicted_price"]].to_markdown(index=False) + "\n\n"
+    else:
+        report_symbol_md += "Prediction data not available.\n\n"
+    report_symbol_md += f"![{symbol} Price Trend]({os.path.basename(plot_filename)})\n\n"
+    # Note: For PDF, image path needs to be absolute or resolvable by WeasyPrint
+    # For simplicity, we assume the markdown renderer for the website can handle relative paths if plots are in a subfolder.
+    # For PDF, we might need to adjust path or embed. For now, using basename.
+
+    return {
+        "markdown": report_symbol_md,
+        "summary": (
+            f"Price ${current_price:,.2f}, daily change {daily_change:.2f}%, trend {trend_direction}",
+            ", ".join(f"{p['date']}: ${p['predicted_price']:,.2f}" for p in predictions)
+        ),
+    }
+
+def stage_markdown(section):
+    # Merge the symbols' sections in SYMBOLS order (from this run's branches, or from the
+    # checkpoints of every shard in a sharded run)
+    all_reports_data = []
+    symbol_summaries = {} # symbol -> (analysis summary, prediction summary) for the report index
+    for symbol in SYMBOLS:
+        symbol_section = section.get(symbol) or insufficient_data_section(symbol)
+        all_reports_data.append(symbol_section["markdown"])
+        symbol_summaries[symbol] = symbol_section["summary"]
 
     # Combine reports into one master markdown file
     final_md_content = f"# Daily Crypto Market Report - {TODAY_STR}\n\n"
@@ -192,57 +278,216 @@ def run_pipeline():
     final_md_content += "\n\n".join(all_reports_data)
 
     md_report_filename = os.path.join(REPORTS_ARCHIVE_DIR, f"daily_crypto_report_{TODAY_STR}.md")
-    pdf_report_filename = os.path.join(REPORTS_ARCHIVE_DIR, f"daily_crypto_report_{TODAY_STR}.pdf")
-
     with open(md_report_filename, "w", encoding="utf-8") as f:
         f.write(final_md_content)
     print(f"Markdown report saved: {md_report_filename}")
+    return {"path": md_report_filename, "content": final_md_content, "symbol_summaries": symbol_summaries}
 
-    # Convert Markdown to PDF
+def stage_pdf(markdown, plot):
+    # Convert Markdown to PDF: sections are rendered separately (cached by content hash) and merged.
+    # In deferred mode the PDF is rendered by /api/reports/download/<report_id> on first request.
+    if REPORT_PDF_MODE == "deferred":
+        print("PDF generation deferred until the report is first downloaded.")
+        return None
+    pdf_report_filename = os.path.join(REPORTS_ARCHIVE_DIR, f"daily_crypto_report_{TODAY_STR}.pdf")
     try:
-        html_content = markdown2.markdown(final_md_content, extras=["tables", "fenced-code-blocks"])
-        # Add some basic CSS for better PDF formatting, including handling Arabic if needed
-        # The plot paths in markdown are relative, for WeasyPrint they need to be absolute or base_url set.
-        # We will use an absolute path for the plots in the HTML for PDF generation.
-        html_with_abs_plot_paths = html_content.replace("![BTC-USD Price Trend](btc_price_trend", f"![BTC-USD Price Trend]({os.path.join(PLOTS_DIR, 'btc_price_trend')}")
-        html_with_abs_plot_paths = html_with_abs_plot_paths.replace("![ETH-USD Price Trend](eth_price_trend", f"![ETH-USD Price Trend]({os.path.join(PLOTS_DIR, 'eth_price_trend')}")
-        
-        # More robust replacement for any plot image
-        import re
-        def replace_plot_path(match):
-            alt_text = match.group(1)
-            img_filename = match.group(2)
-            # Construct absolute path, assuming img_filename is just the basename like 'btc_price_trend_2025-05-08.png'
-            abs_img_path = os.path.join(PLOTS_DIR, img_filename)
-            return f'<img src="file://{abs_img_path}" alt="{alt_text}" style="max-width:100%; height:auto;" />'
-
-        # Replace markdown image syntax with HTML img tags with absolute file paths
-        html_for_pdf = re.sub(r"!\[([^\]]+)\]\(([^)]+)\)", replace_plot_path, final_md_content)
-        html_content_for_pdf = markdown2.markdown(html_for_pdf, extras=["tables", "fenced-code-blocks"])
-        
-        # Basic CSS, including font for Arabic if report text was in Arabic
-        # For this report, content is mostly English tables and plot titles.
-        css = CSS(string="""
-            @page { size: A4; margin: 2cm; }
-            body { font-family: sans-serif; direction: rtl; text-align: right; }
-            h1, h2, h3 { color: #333; }
-            table { border-collapse: collapse; width: 100%; margin-bottom: 1em; }
-            th, td { border: 1px solid #ddd; padding: 8px; text-align: left; }
-            th { background-color: #f2f2f2; }
-            img { max-width: 100%; height: auto; display: block; margin-left: auto; margin-right: auto; margin-bottom:1em; }
-        """)
-        HTML(string=html_content_for_pdf, base_url=REPORTS_ARCHIVE_DIR).write_pdf(pdf_report_filename, stylesheets=[css])
-        print(f"PDF report saved: {pdf_report_filename}")
+        report_renderer.render_report_pdf(markdown["content"], pdf_report_filename, PLOTS_DIR, REPORTS_ARCHIVE_DIR)
     except Exception as e:
         print(f"Error converting Markdown to PDF: {e}")
         print("PDF generation failed. Markdown report is available.")
+        raise # No checkpoint: the next run retries only this stage
+    print(f"PDF report saved: {pdf_report_filename}")
+    return pdf_report_filename
+
+def stage_index(markdown):
+    # Record the report so the API's archive index picks it up (a missing PDF is rendered on download)
+    pdf_report_filename = os.path.join(REPORTS_ARCHIVE_DIR, f"daily_crypto_report_{TODAY_STR}.pdf")
+    update_report_index(markdown["symbol_summaries"], markdown["path"], pdf_report_filename)
+    return TODAY_STR
+
+def stage_alerts(fetch):
+    # Depends on fetch so that it runs again whenever new prices were stored; subscriptions for
+    # symbols outside SYMBOLS are checked against whatever the OHLCV store holds for them
+    return send_alerts()
+
+STAGE_NAMES = ["fetch", "indicators", "predict", "plot", "section", "markdown", "pdf", "index", "alerts"]
+
+def build_pipeline(rate_limiter=None, render=plotting.render_plot, recorder=None):
+    return dag.Pipeline([
+        dag.Stage("fetch", functools.partial(stage_fetch, rate_limiter=rate_limiter), per_symbol=True,
+                  params=(TODAY_STR, OHLCV_STORE_DIR, DATA_INTERVAL, DATA_RANGE, ANALYSIS_BARS)),
+        dag.Stage("indicators", stage_indicators, deps=["fetch"], batch=True,
+                  params=(SMA_WINDOW_SHORT, SMA_WINDOW_LONG, PREDICTION_DAYS)),
+        dag.Stage("predict", stage_predict, deps=["fetch", "indicators"], batch=True, version=2,
+                  params=(PREDICTION_DAYS, crypto_service.FORECAST_HISTORY_BARS, [m.name for m in forecasting.DEFAULT_MODELS])),
+        dag.Stage("plot", functools.partial(stage_plot, render=render), deps=["fetch", "indicators", "predict"],
+                  per_symbol=True, params=(TODAY_STR, PLOTS_DIR, plotting.PLOT_RENDER_VERSION, plotting.PLOT_STYLE),
+                  outputs=lambda path: [path]),
+        dag.Stage("section", stage_section, deps=["fetch", "indicators", "predict", "plot"], per_symbol=True,
+                  params=(TODAY_STR, PLOTS_DIR)),
+        dag.Stage("markdown", stage_markdown, deps=["section"], version=2,
+                  params=(TODAY_STR, SYMBOLS, REPORTS_ARCHIVE_DIR), outputs=lambda md: [md["path"]]),
+        dag.Stage("pdf", stage_pdf, deps=["markdown", "plot"], params=(REPORT_PDF_MODE, report_renderer.REPORT_CSS),
+                  outputs=lambda path: [path]),
+        dag.Stage("index", stage_index, deps=["markdown"], params=TODAY_STR),
+        dag.Stage("alerts", stage_alerts, deps=["fetch"], params=(TODAY_STR, OHLCV_STORE_DIR)),
+    ], checkpoint_dir=os.path.join(CHECKPOINT_ROOT, TODAY_STR), max_workers=FETCH_MAX_WORKERS, recorder=recorder)
+
+# --- Main Pipeline Logic ---
+def run_pipeline(from_stage=None, only_symbols=None, force=False, symbols=None, global_stages=True, label=None):
+    """Run the pipeline for `symbols` (default SYMBOLS); global_stages=False stops after the
+    per-symbol stages, as a shard of a sharded run does. `label` names the run summary."""
+    symbols = SYMBOLS if symbols is None else symbols
+    ensure_output_dirs()
+    rate_limiter = RateLimiter(FETCH_RATE_LIMIT_PER_SEC, burst=FETCH_MAX_WORKERS) if FETCH_RATE_LIMIT_PER_SEC else None
+    # Plots render on a process pool (workers start on first use, so a fully cached run
+    # starts none); with one worker they render here, one at a time (pyplot is not thread-safe).
+    # Jobs are submitted from the DAG's threads, and forking a multi-threaded process can
+    # deadlock the child, so workers come from a fork server (spawned where there is none).
+    start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    plot_pool = ProcessPoolExecutor(max_workers=PLOT_WORKERS, mp_context=multiprocessing.get_context(start_method)) \
+        if PLOT_WORKERS > 1 else None
+    plot_lock = threading.Lock()
+
+    def render(job):
+        if plot_pool is not None:
+            return plot_pool.submit(plotting.render_plot, job).result()
+        with plot_lock:
+            return plotting.render_plot(job)
+
+    recorder = instrumentation.RunRecorder(enabled=PIPELINE_METRICS, trace_allocations=PIPELINE_TRACEMALLOC)
+    pipeline = build_pipeline(rate_limiter, render, recorder)
+    try:
+        pipeline.run(symbols, from_stage=from_stage, only_symbols=only_symbols, force=force, global_stages=global_stages)
+    finally:
+        if plot_pool is not None:
+            plot_pool.shutdown()
+    dag.prune_checkpoints(CHECKPOINT_ROOT, CHECKPOINT_KEEP_RUNS)
+    if recorder.enabled:
+        suffix = f"_{label}" if label else ""
+        summary_path = os.path.join(RUN_SUMMARY_DIR, f"run_{TODAY_STR}_{datetime.now().strftime('%H%M%S')}{suffix}.json")
+        summary = recorder.write_summary(
+            summary_path, report_date=TODAY_STR, symbols=symbols, from_stage=from_stage,
+            only_symbols=only_symbols, failed=[f"{stage} [{symbol}]" if symbol else stage for stage, symbol in pipeline.failed]
+        )
+        slowest = sorted(summary["stages"].items(), key=lambda item: -item[1]["seconds"])[:3]
+        print(f"Run summary saved: {summary_path} (slowest: "
+              + ", ".join(f"{stage} {totals['seconds']:.2f}s" for stage, totals in slowest) + ")")
+    return pipeline
+
+# --- Sharded runs ---
+# Every worker enqueues the same shards (the first one creates them), then claims shards and
+# runs their per-symbol stages, checkpointing into the shared CHECKPOINT_ROOT/<date>. Once all
+# shards are done one worker claims the reduce task: the global stages, which merge every
+# symbol's section and plot from those checkpoints into daily_crypto_report_<date>.
+def queue_path():
+    return os.path.join(CHECKPOINT_ROOT, TODAY_STR, "work_queue.sqlite")
+
+def open_work_queue():
+    os.makedirs(os.path.dirname(queue_path()), exist_ok=True)
+    return work_queue.WorkQueue(queue_path(), lease_seconds=SHARD_LEASE_SECONDS, max_attempts=SHARD_MAX_ATTEMPTS)
+
+def make_shards(symbols, shard_size):
+    return [symbols[i:i + shard_size] for i in range(0, len(symbols), shard_size)]
+
+def run_worker(from_stage=None, force=False, shard_size=SHARD_SIZE, worker_id=None):
+    """Work on today's queue until every shard and the reduce task are finished.
+    Returns False if a task run by this worker failed or reported failed stages."""
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    queue = open_work_queue()
+    if queue.create(make_shards(SYMBOLS, shard_size)):
+        print(f"Work queue created: {queue_path()}")
+
+    def run_shard(symbols):
+        pipeline = run_pipeline(from_stage=from_stage, force=force, symbols=symbols, global_stages=False,
+                                label=f"{worker_id}_shard")
+        return {"failed": [f"{stage} [{symbol}]" for stage, symbol in pipeline.failed]}
+
+    def reduce():
+        # Only the global stages run; every symbol's branch is loaded from its checkpoints
+        pipeline = run_pipeline(from_stage=from_stage, only_symbols=[], force=force, label=f"{worker_id}_reduce")
+        incomplete = [task for task in queue.tasks() if task["kind"] == work_queue.SHARD and task["status"] == "failed"]
+        for task in incomplete:
+            print(f"Shard {task['id']} failed ({task['error']}); missing from the report: {', '.join(task['symbols'])}")
+        return {"failed": [f"{stage} [{symbol}]" if symbol else stage for stage, symbol in pipeline.failed]
+                          + [f"shard {task['id']}" for task in incomplete]}
+
+    return work_queue.run_worker(queue, worker_id, run_shard, reduce, poll_seconds=min(SHARD_POLL_SECONDS, SHARD_LEASE_SECONDS / 3))
+
+def _local_worker(index, from_stage, force, shard_size, plot_workers):
+    global PLOT_WORKERS
+    PLOT_WORKERS = plot_workers
+    if not run_worker(from_stage, force, shard_size, worker_id=f"{socket.gethostname()}-{os.getpid()}-w{index}"):
+        sys.exit(1)
+
+def run_local_workers(count, from_stage=None, force=False, shard_size=SHARD_SIZE):
+    """Start `count` worker processes on this host and wait for them; True if all succeeded."""
+    open_work_queue().create(make_shards(SYMBOLS, shard_size))
+    plot_workers = max(1, PLOT_WORKERS // count) # Share the plot processes between the workers
+    processes = [multiprocessing.Process(target=_local_worker, args=(i, from_stage, force, shard_size, plot_workers),
+                                         name=f"worker-{i}") for i in range(count)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    return all(process.exitcode == 0 for process in processes)
+
+def print_queue_status():
+    if not os.path.exists(queue_path()):
+        print(f"No work queue for {TODAY_STR} ({queue_path()})")
+        return
+    now = datetime.now().timestamp()
+    tasks = open_work_queue().tasks()
+    if not tasks:
+        print(f"Work queue for {TODAY_STR} is empty")
+    for task in tasks:
+        name = f"shard {task['id']} ({len(task['symbols'])} symbols)" if task["kind"] == work_queue.SHARD else "reduce"
+        detail = f" by {task['worker']}, lease {task['lease_expires'] - now:.0f}s left" if task["status"] == "leased" else ""
+        detail += f", error: {task['error']}" if task["error"] else ""
+        detail += f", failed stages: {', '.join(task['result']['failed'])}" if task["result"] and task["result"]["failed"] else ""
+        print(f"{name}: {task['status']} after {task['attempts']} attempt(s){detail}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Daily crypto report pipeline")
+    parser.add_argument("--from-stage", choices=STAGE_NAMES,
+                        help="re-run this stage and everything after it, ignoring their checkpoints")
+    parser.add_argument("--only-symbol", action="append", metavar="SYMBOL",
+                        help="only (re)process this symbol; others are reused from checkpoints (repeatable)")
+    parser.add_argument("--force", action="store_true", help="ignore all checkpoints")
+    sharding = parser.add_argument_group("sharded runs")
+    sharding.add_argument("--worker", action="store_true",
+                          help="work on today's shard queue until the report is done (start one per process/host)")
+    sharding.add_argument("--local-workers", type=int, metavar="N", help="start N workers on this host and wait for them")
+    sharding.add_argument("--shard-size", type=int, default=SHARD_SIZE, help="symbols per shard (default %(default)s)")
+    sharding.add_argument("--reset-queue", action="store_true",
+                          help="clear today's queue first, e.g. to run a finished day again (not while workers run)")
+    sharding.add_argument("--queue-status", action="store_true", help="print today's shard queue and exit")
+    args = parser.parse_args(argv)
+    if args.only_symbol and (args.worker or args.local_workers):
+        parser.error("--only-symbol cannot be combined with sharded runs")
+    return args
 
 if __name__ == "__main__":
+    args = parse_args()
+    if args.reset_queue:
+        open_work_queue().reset()
+        print(f"Work queue cleared: {queue_path()}")
+    if args.queue_status or (args.reset_queue and not (args.worker or args.local_workers)):
+        print_queue_status()
+        sys.exit(0)
+    if args.worker or args.local_workers:
+        print(f"Starting sharded pipeline run ({len(SYMBOLS)} symbols, {args.shard_size} per shard)...")
+        ok = run_local_workers(args.local_workers, args.from_stage, args.force, args.shard_size) if args.local_workers \
+            else run_worker(args.from_stage, args.force, args.shard_size)
+        print_queue_status()
+        sys.exit(0 if ok else 1)
     print("Starting daily crypto processing pipeline...")
-    run_pipeline()
+    pipeline = run_pipeline(from_stage=args.from_stage, only_symbols=args.only_symbol, force=args.force)
     print("\nPipeline finished.")
     print(f"Reports and plots saved in: {REPORTS_ARCHIVE_DIR}")
     print("To run this pipeline again for a new day, simply execute this script.")
     print("Automatic daily execution is not enabled in the current environment.")
     print("You can trigger it manually or via an external scheduler if you set one up.")
-
+    if pipeline.failed:
+        print(f"Failed stages: {', '.join(f'{stage} [{symbol}]' if symbol else stage for stage, symbol in pipeline.failed)}")
+        sys.exit(1)
@@ -1,18 +1,31 @@
-from flask import Flask
-from flask_cors import CORS # To handle Cross-Origin Resource Sharing
 import os
 
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+
 def create_app(config_name=None):
+    # Flask is imported here rather than at module level, so scripts that only use the
+    # services (e.g. the daily pipeline importing app.services.indicators) do not load it
+    from flask import Flask
+    from flask_cors import CORS # To handle Cross-Origin Resource Sharing
+
     app = Flask(__name__, instance_relative_config=True)
 
     # Configuration
     # app.config.from_object(config.get(config_name or 'default')) # Example for config files
     # app.config.from_pyfile('config.py', silent=True) # Example for instance config
     app.config["SECRET_KEY"] = os.environ.get("SECRET_KEY", "a_very_secret_key_for_development")
-    # Database configuration (example for SQLite)
-    # app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL") or \
-    #     f"sqlite:///{os.path.join(app.instance_path, 'app.sqlite')}"
-    # app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    # Database configuration (SQLite by default)
+    app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL") or \
+        f"sqlite:///{os.path.join(app.instance_path, 'app.sqlite')}"
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    # Local OHLCV bar store written by scripts/run_daily_crypto_pipeline.py
+    app.config["OHLCV_STORE_DIR"] = os.environ.get("OHLCV_STORE_DIR") or \
+        os.path.join(PROJECT_ROOT, "data", "ohlcv")
+    # Daily reports (md/pdf) and their plots, written by the pipeline
+    app.config["REPORTS_ARCHIVE_DIR"] = os.environ.get("REPORTS_ARCHIVE_DIR") or \
+        os.path.join(PROJECT_ROOT, "reports_archive")
+    # Let a fronting server (nginx X-Accel/Apache X-Sendfile) stream report files
+    app.config["USE_X_SENDFILE"] = os.environ.get("USE_X_SENDFILE", "0") == "1"
 
     # Ensure the instance folder exists
     try:
@@ -21,11 +34,35 @@ def create_app(config_name=None):
         pass
 
     # Initialize extensions (e.g., SQLAlchemy, Migrate) here
-    # from .models import db
-    # db.init_app(app)
+    from .models import db, ensure_indexes
+    from .services import user_service
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        ensure_indexes(db.engine)
+        user_service.migrate_followed_cryptos() # Legacy comma-separated follows; a no-op once done
     # from flask_migrate import Migrate
     # migrate = Migrate(app, db)
 
+    # Response cache for the /api/crypto/* endpoints (per process)
+    from .services.response_cache import ResponseCache
+    app.extensions["response_cache"] = ResponseCache(
+        max_entries=int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", "1024")),
+        ttl_seconds=float(os.environ.get("RESPONSE_CACHE_TTL_SECONDS", "300"))
+    )
+
+    # Live price/alert stream (/api/stream): feed poll interval, per-connection alert buffer,
+    # and an optional cap on open connections per process
+    app.config["LIVE_STREAM_POLL_SECONDS"] = float(os.environ.get("LIVE_STREAM_POLL_SECONDS", "1.0"))
+    app.config["LIVE_STREAM_MAX_ALERTS"] = int(os.environ.get("LIVE_STREAM_MAX_ALERTS", "100"))
+    max_streams = os.environ.get("LIVE_STREAM_MAX_CONNECTIONS")
+    app.config["LIVE_STREAM_MAX_CONNECTIONS"] = int(max_streams) if max_streams else None
+
+    # Per-endpoint request latency histograms, served at /api/metrics (Prometheus format)
+    app.config["METRICS_ENABLED"] = os.environ.get("METRICS_ENABLED", "1") == "1"
+    from .services import instrumentation
+    instrumentation.init_app(app)
+
     # Enable CORS for all domains on all routes. For production, configure it more strictly.
     CORS(app) 
 
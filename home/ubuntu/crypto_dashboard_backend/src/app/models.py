@@ -25,7 +25,9 @@ class UserPreference(db.Model):
     # This is a placeholder model. Full implementation requires user authentication.
     id = db.Column(db.Integer, primary_key=True)
     user_identifier = db.Column(db.String(100), unique=True, nullable=False) # Could be email or a unique ID
-    followed_cryptos = db.Column(db.Text, nullable=True) # e.g., comma-separated list: "BTC-USD,ETH-USD"
+    # Legacy comma-separated list ("BTC-USD,ETH-USD"); follows now live in the followed_cryptos
+    # table (FollowedCrypto) - see user_service.migrate_followed_cryptos()
+    followed_cryptos = db.Column(db.Text, nullable=True)
     alert_settings_json = db.Column(db.Text, nullable=True) # Store complex settings as JSON string
     report_preferences_json = db.Column(db.Text, nullable=True) # Store complex settings as JSON string
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -33,14 +35,36 @@ class UserPreference(db.Model):
     def __repr__(self):
         return f"<UserPreference {self.user_identifier}>"
 
+class FollowedCrypto(db.Model):
+    __tablename__ = "followed_cryptos"
+    # One row per (user, symbol) followed
+    __table_args__ = (
+        db.Index("uq_followed_crypto_user_symbol", "user_identifier", "crypto_symbol", unique=True),
+        db.Index("ix_followed_crypto_symbol", "crypto_symbol"), # Who follows a symbol
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    user_identifier = db.Column(db.String(100), db.ForeignKey("user_preferences.user_identifier"), nullable=False)
+    crypto_symbol = db.Column(db.String(20), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<FollowedCrypto {self.user_identifier} follows {self.crypto_symbol}>"
+
 class AlertSubscription(db.Model):
     __tablename__ = "alert_subscriptions"
-    # This is a placeholder model. Full implementation requires a robust alert system.
+    __table_args__ = (
+        # One row per (user, symbol, condition); unsubscribing deactivates it, subscribing again reactivates it
+        db.Index("uq_alert_subscription", "user_identifier", "crypto_symbol", "alert_condition", unique=True),
+        # Active subscriptions of a symbol (alert evaluation)
+        db.Index("ix_alert_subscription_symbol_active", "crypto_symbol", "is_active"),
+        # A user's subscriptions in id order (keyset pagination)
+        db.Index("ix_alert_subscription_user_active_id", "user_identifier", "is_active", "id"),
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_identifier = db.Column(db.String(100), db.ForeignKey("user_preferences.user_identifier"), nullable=False)
-    crypto_symbol = db.Column(db.String(20), nullable=False)
-    alert_condition = db.Column(db.String(255), nullable=False) # e.g., "price_increase_5_percent"
-    is_active = db.Column(db.Boolean, default=True)
+    crypto_symbol = db.Column(db.String(20), nullable=False) # Stored upper-case
+    alert_condition = db.Column(db.String(255), nullable=False) # e.g., "price_increase_5_percent", stored lower-case
+    is_active = db.Column(db.Boolean, nullable=False, default=True, server_default=db.true())
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     last_alert_sent_at = db.Column(db.DateTime, nullable=True)
 
@@ -49,6 +73,85 @@ class AlertSubscription(db.Model):
     def __repr__(self):
         return f"<AlertSubscription {self.user_identifier} for {self.crypto_symbol}>"
 
+class StreamAlert(db.Model):
+    __tablename__ = "stream_alerts"
+    # Triggered alerts for /api/stream, written by whichever process evaluates alerts (e.g. the
+    # pipeline) and read by the stream broker of every web process (see live_stream.AlertOutbox).
+    # AUTOINCREMENT keeps ids increasing after old rows are pruned, as readers track the last id seen.
+    __table_args__ = {"sqlite_autoincrement": True}
+    id = db.Column(db.Integer, primary_key=True)
+    user_identifier = db.Column(db.String(100), nullable=False)
+    event_json = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return f"<StreamAlert {self.id} for {self.user_identifier}>"
+
+def dialect_insert(model):
+    """INSERT for `model` supporting .on_conflict_do_nothing()/.on_conflict_do_update() (SQLite, PostgreSQL)."""
+    if db.engine.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(model)
+
+def _merge_duplicate_subscriptions(conn):
+    # Rows written before the unique index existed: normalize their keys as alert_service does,
+    # then make the oldest row of each duplicate group active if any copy was, with the latest
+    # last_alert_sent_at (the other copies are deleted by _delete_duplicates)
+    from sqlalchemy import text
+
+    conn.execute(text("UPDATE alert_subscriptions SET crypto_symbol = UPPER(TRIM(crypto_symbol)), "
+                      "alert_condition = LOWER(TRIM(alert_condition))"))
+    same_key = ("d.user_identifier = alert_subscriptions.user_identifier AND d.crypto_symbol = alert_subscriptions.crypto_symbol "
+                "AND d.alert_condition = alert_subscriptions.alert_condition")
+    conn.execute(text(
+        f"UPDATE alert_subscriptions SET is_active = EXISTS (SELECT 1 FROM alert_subscriptions d WHERE {same_key} AND d.is_active), "
+        f"last_alert_sent_at = (SELECT MAX(d.last_alert_sent_at) FROM alert_subscriptions d WHERE {same_key}) "
+        "WHERE id IN (SELECT MIN(id) FROM alert_subscriptions GROUP BY user_identifier, crypto_symbol, alert_condition "
+        "HAVING COUNT(*) > 1)"
+    ))
+
+# Unique index name -> function folding the rows it would reject into the row that is kept
+_MERGE_DUPLICATES = {"uq_alert_subscription": _merge_duplicate_subscriptions}
+
+def _delete_duplicates(conn, index) -> int:
+    # Keep the oldest row per key of the unique index
+    from sqlalchemy import text
+
+    table = index.table.name
+    key = ", ".join(column.name for column in index.columns)
+    return conn.execute(text(f"DELETE FROM {table} WHERE id NOT IN (SELECT MIN(id) FROM {table} GROUP BY {key})")).rowcount
+
+def ensure_indexes(engine):
+    """Create indexes missing from tables that existed before they were added to the models.
+
+    db.create_all() only creates indexes together with new tables. Before a unique index is
+    added, duplicate rows are merged into the oldest one; if it still cannot be built the
+    error is raised, since upserts (ON CONFLICT) need it. Other index failures are reported.
+    """
+    from sqlalchemy import inspect
+
+    inspector = inspect(engine)
+    for table in db.metadata.sorted_tables:
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            if not index.unique:
+                try:
+                    index.create(engine)
+                except Exception as e:
+                    print(f"Could not create index {index.name}: {e}")
+                continue
+            with engine.begin() as conn:
+                if index.name in _MERGE_DUPLICATES:
+                    _MERGE_DUPLICATES[index.name](conn)
+                removed = _delete_duplicates(conn, index)
+                if removed:
+                    print(f"Removed {removed} duplicate rows from {table.name} to create unique index {index.name}")
+                index.create(conn)
+
 # You would typically add functions here to interact with these models,
 # or handle that logic in service layers.
 
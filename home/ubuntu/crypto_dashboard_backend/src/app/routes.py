@@ -1,80 +1,257 @@
-from flask import Blueprint, jsonify, request
-# Placeholder for services that will handle the business logic
-from .services import alert_service # Assuming other services like crypto_service and report_service will be added
+import json
+import os
+import re
+
+from flask import Blueprint, current_app, jsonify, request, send_file, url_for
+# Services that handle the business logic. The NumPy-backed ones (crypto_service,
+# columnar_encoding, live_stream, alert_service) are imported by the routes that use them,
+# so creating the app does not load them.
+from .services import instrumentation, report_renderer, report_service, user_service
 
 main_bp = Blueprint("main_bp", __name__, url_prefix="/api")
 
+MAX_BATCH_SYMBOLS = 200
+MAX_STREAM_SYMBOLS = 50
+STREAM_HEARTBEAT_SECONDS = 15 # Comment lines keep idle connections open through proxies
+REPORT_ID_RE = re.compile(r"\d{4}-\d{2}-\d{2}") # Report ids are report dates, e.g. 2025-05-08
+
 @main_bp.route("/")
 def index():
     return jsonify({"message": "Welcome to the Crypto Analysis API!"})
 
-# --- Crypto Data Endpoints (Placeholders) ---
+# --- Crypto Data Endpoints ---
+# Responses are cached per (endpoint, symbol, range) until the TTL expires or the pipeline
+# writes new bars for the symbol (see services/response_cache.py).
+def _cached_crypto_response(endpoint, symbol, compute, range_param=None):
+    from .services import crypto_service
+
+    store_dir = current_app.config["OHLCV_STORE_DIR"]
+    cache = current_app.extensions["response_cache"]
+    return cache.get_or_compute(
+        (endpoint, symbol.upper(), range_param), compute,
+        version=crypto_service.data_version(store_dir, symbol)
+    )
+
 @main_bp.route("/crypto/prices", methods=["GET"])
 def get_crypto_prices():
+    from .services import crypto_service
+
     symbol = request.args.get("symbol", default="BTC-USD", type=str)
     range_param = request.args.get("range", default="7d", type=str)
-    # data = crypto_service.get_price_history(symbol, range_param)
+    store_dir = current_app.config["OHLCV_STORE_DIR"]
+    try:
+        data = _cached_crypto_response(
+            "prices", symbol, lambda: crypto_service.get_price_history(store_dir, symbol, range_param), range_param
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     return jsonify({
         "message": f"Endpoint to get price history for {symbol} over {range_param}",
         "symbol": symbol,
         "range": range_param,
-        "data": [] 
+        "data": data
     })
 
+@main_bp.route("/crypto/prices/batch", methods=["GET", "POST"])
+def get_crypto_prices_batch():
+    from .services import columnar_encoding, crypto_service
+
+    # Many symbols in one request, as columnar arrays: timestamps once, then one float array
+    # per symbol and field. Format: ?format=json|msgpack|arrow or the Accept header.
+    params = (request.get_json(silent=True) or {}) if request.method == "POST" else {}
+    for key in ("symbols", "fields"):
+        if key in params and not (isinstance(params[key], list) and all(isinstance(v, str) for v in params[key])):
+            return jsonify({"error": f"{key} must be a JSON list of strings"}), 400
+    for key in ("range", "format"):
+        if key in params and not isinstance(params[key], str):
+            return jsonify({"error": f"{key} must be a string"}), 400
+    symbols = params.get("symbols") or [s for s in request.args.get("symbols", "").split(",") if s]
+    range_param = params.get("range") or request.args.get("range", default="7d", type=str)
+    fields = params.get("fields") or [f for f in request.args.get("fields", "").split(",") if f] \
+        or list(crypto_service.PRICE_FIELDS)
+    symbols = list(dict.fromkeys(symbol.strip().upper() for symbol in symbols)) # Dedupe, keep order
+    if not symbols:
+        return jsonify({"error": "symbols is required (comma-separated or a JSON list)"}), 400
+    if len(symbols) > MAX_BATCH_SYMBOLS:
+        return jsonify({"error": f"At most {MAX_BATCH_SYMBOLS} symbols per request"}), 400
+    unknown = [field for field in fields if field not in crypto_service.PRICE_FIELDS]
+    if unknown:
+        return jsonify({"error": f"Unknown fields: {', '.join(unknown)}"}), 400
+    try:
+        fmt = columnar_encoding.negotiate(params.get("format") or request.args.get("format"), request.accept_mimetypes)
+    except columnar_encoding.UnsupportedFormat as e:
+        return jsonify({"error": str(e)}), 406
+    try:
+        crypto_service.range_to_seconds(range_param)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    store_dir = current_app.config["OHLCV_STORE_DIR"]
+    cache = current_app.extensions["response_cache"]
+    meta = {"symbols": symbols, "range": range_param}
+    body = cache.get_or_compute(
+        ("prices_batch", tuple(symbols), range_param, tuple(fields), fmt),
+        lambda: columnar_encoding.encode(
+            fmt, crypto_service.get_price_columns(store_dir, symbols, range_param, fields), meta
+        ),
+        version=tuple(crypto_service.data_version(store_dir, symbol) for symbol in symbols)
+    )
+    response = current_app.response_class(body, mimetype=columnar_encoding.MIMETYPES[fmt])
+    response.vary.add("Accept")
+    return response
+
 @main_bp.route("/crypto/analysis", methods=["GET"])
 def get_crypto_analysis():
+    from .services import crypto_service
+
     symbol = request.args.get("symbol", default="BTC-USD", type=str)
-    # analysis = crypto_service.get_current_analysis(symbol)
+    store_dir = current_app.config["OHLCV_STORE_DIR"]
+    analysis = _cached_crypto_response("analysis", symbol, lambda: crypto_service.get_current_analysis(store_dir, symbol))
     return jsonify({
         "message": f"Endpoint to get current analysis for {symbol}",
         "symbol": symbol,
-        "analysis": {}
+        "analysis": analysis
     })
 
 @main_bp.route("/crypto/prediction", methods=["GET"])
 def get_crypto_prediction():
+    from .services import crypto_service
+
     symbol = request.args.get("symbol", default="BTC-USD", type=str)
-    # prediction = crypto_service.get_prediction(symbol)
+    store_dir = current_app.config["OHLCV_STORE_DIR"]
+    prediction = _cached_crypto_response("prediction", symbol, lambda: crypto_service.get_prediction(store_dir, symbol))
     return jsonify({
         "message": f"Endpoint to get prediction for {symbol}",
         "symbol": symbol,
-        "prediction": {}
+        "prediction": prediction
+    })
+
+@main_bp.route("/cache/stats", methods=["GET"])
+def get_cache_stats():
+    return jsonify({"response_cache": current_app.extensions["response_cache"].snapshot()})
+
+@main_bp.route("/metrics", methods=["GET"])
+def get_metrics():
+    # Prometheus scrape endpoint; metrics are per process (scrape each worker)
+    if not current_app.config.get("METRICS_ENABLED", True):
+        return jsonify({"error": "Metrics are disabled (METRICS_ENABLED=0)"}), 404
+    return current_app.response_class(instrumentation.render_prometheus(current_app),
+                                      mimetype="text/plain; version=0.0.4")
+
+# --- Live Stream (Server-Sent Events) ---
+# GET /api/stream?symbols=BTC-USD,ETH-USD[&userId=...] keeps the connection open and pushes
+# `price` events (latest bar per symbol, conflated for slow clients) and, with userId,
+# `alert` events for that user. Each open stream holds a worker, so run it under an async
+# server (see src/stream_server.py) rather than a fixed pool of sync workers.
+def _sse(kind, event):
+    return f"id: {event['seq']}\nevent: {kind}\ndata: {json.dumps(event)}\n\n"
+
+@main_bp.route("/stream", methods=["GET"])
+def stream_events():
+    from .services import live_stream
+
+    symbols = list(dict.fromkeys(s.strip().upper() for s in request.args.get("symbols", "").split(",") if s.strip()))
+    user_identifier = request.args.get("userId")
+    if not symbols and not user_identifier:
+        return jsonify({"error": "symbols (comma-separated) or userId is required"}), 400
+    if len(symbols) > MAX_STREAM_SYMBOLS:
+        return jsonify({"error": f"At most {MAX_STREAM_SYMBOLS} symbols per stream"}), 400
+
+    broker = live_stream.get_broker()
+    subscription = broker.open(symbols, user_identifier)
+    if subscription is None:
+        return jsonify({"error": "Too many open streams, retry later"}), 503
+
+    def events():
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                batch = subscription.next_events(timeout=STREAM_HEARTBEAT_SECONDS)
+                if not batch:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield "".join(_sse(kind, event) for kind, event in batch)
+        except live_stream.StreamClosed:
+            pass
+        finally:
+            broker.close(subscription) # Also runs when the client disconnects (GeneratorExit)
+
+    return current_app.response_class(events(), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no" # Tell nginx not to buffer the stream
     })
 
-# --- Reports Endpoints (Placeholders) ---
+@main_bp.route("/stream/stats", methods=["GET"])
+def get_stream_stats():
+    from .services import live_stream
+
+    return jsonify({"live_stream": live_stream.get_broker().snapshot()})
+
+# --- Reports Endpoints ---
 @main_bp.route("/reports/latest", methods=["GET"])
 def get_latest_report():
     format_param = request.args.get("format", default="pdf", type=str.lower)
-    # report_data = report_service.get_latest_report(format_param)
     if format_param not in ["pdf", "md"]:
         return jsonify({"error": "Invalid format. Choose pdf or md."}), 400
+    report = report_service.get_latest_report()
+    if report is None:
+        return jsonify({"error": "No reports available yet"}), 404
     return jsonify({
-        "message": f"Endpoint to get the latest report in {format_param} format",
+        "message": f"Latest report in {format_param} format",
         "format": format_param,
-        "report_content": "Placeholder for report content or link"
+        "report": report,
+        "report_content": url_for("main_bp.download_report", report_id=report["report_id"], format=format_param)
     })
 
 @main_bp.route("/reports/archive", methods=["GET"])
 def get_reports_archive():
-    # archive_list = report_service.get_archive_list()
+    page = request.args.get("page", default=1, type=int)
+    per_page = request.args.get("per_page", default=20, type=int)
+    start_date = request.args.get("start")
+    end_date = request.args.get("end")
+    symbol = request.args.get("symbol")
+    if page < 1 or not 1 <= per_page <= 100:
+        return jsonify({"error": "page must be >= 1 and per_page between 1 and 100"}), 400
+    for value in (start_date, end_date):
+        if value and not REPORT_ID_RE.fullmatch(value):
+            return jsonify({"error": f"Invalid date '{value}'. Use YYYY-MM-DD."}), 400
+    archive = report_service.get_archive_list(page, per_page, start_date, end_date, symbol)
     return jsonify({
-        "message": "Endpoint to get the list of archived reports",
-        "archive": []
+        "message": "Archived reports, newest first",
+        "archive": archive["reports"],
+        "total": archive["total"],
+        "page": archive["page"],
+        "per_page": archive["per_page"]
     })
 
 @main_bp.route("/reports/download/<report_id>", methods=["GET"])
 def download_report(report_id):
     format_param = request.args.get("format", default="pdf", type=str.lower)
-    # file_path = report_service.get_report_file(report_id, format_param)
-    # if file_path: return send_file(file_path, as_attachment=True)
     if format_param not in ["pdf", "md"]:
         return jsonify({"error": "Invalid format. Choose pdf or md."}), 400
-    return jsonify({
-        "message": f"Endpoint to download report {report_id} in {format_param} format",
-        "report_id": report_id,
-        "format": format_param,
-        "download_link": f"/path/to/report_{report_id}.{format_param}"
-    })
+    if not REPORT_ID_RE.fullmatch(report_id):
+        return jsonify({"error": f"Report {report_id} not found"}), 404
+
+    archive_dir = current_app.config["REPORTS_ARCHIVE_DIR"]
+    file_path = os.path.join(archive_dir, f"daily_crypto_report_{report_id}.{format_param}")
+    if format_param == "pdf":
+        # PDFs may be deferred by the pipeline; render on first request
+        md_path = os.path.join(archive_dir, f"daily_crypto_report_{report_id}.md")
+        try:
+            file_path = report_renderer.ensure_report_pdf(md_path, file_path, os.path.join(archive_dir, "plots"), archive_dir)
+        except Exception as e:
+            print(f"Error rendering PDF for report {report_id}: {e}")
+            return jsonify({"error": "PDF generation failed. Try format=md."}), 503
+    if not file_path or not os.path.exists(file_path):
+        return jsonify({"error": f"Report {report_id} not found"}), 404
+    # conditional=True answers If-None-Match / If-Modified-Since with 304 and serves Range
+    # requests as 206; the body is streamed in chunks (or handed to the server's sendfile
+    # via wsgi.file_wrapper / X-Sendfile) rather than read into memory.
+    return send_file(
+        file_path, as_attachment=True, conditional=True,
+        etag=report_service.file_etag(file_path),
+        last_modified=os.path.getmtime(file_path)
+    )
 
 # --- User Settings (Placeholder) ---
 @main_bp.route("/user/settings", methods=["GET", "POST"])
@@ -91,17 +268,64 @@ def user_settings():
         # result = user_service.update_settings(user_identifier, settings_data)
         return jsonify({"message": f"POST (update) user settings for {user_identifier}", "received_data": settings_data})
 
+# --- Followed Cryptos ---
+@main_bp.route("/user/follows", methods=["GET"])
+def get_followed_cryptos():
+    user_identifier = request.args.get("userId") # Or from auth
+    if not user_identifier:
+        return jsonify({"error": "User identifier is required"}), 400
+    return jsonify({"status": "success", "followed_cryptos": user_service.get_followed_cryptos(user_identifier)})
+
+def _follow_request():
+    # (user_identifier, symbols) from a {"userId": ..., "cryptoSymbols": [...]} body, or an error response
+    data = request.get_json(silent=True) or {}
+    user_identifier = data.get("userId")
+    symbols = data.get("cryptoSymbols")
+    if not user_identifier or not isinstance(symbols, list) or not symbols \
+            or not all(isinstance(symbol, str) for symbol in symbols):
+        return None, (jsonify({"error": "Missing data (userId and a cryptoSymbols list of symbols required)"}), 400)
+    if len(symbols) > MAX_BATCH_SYMBOLS:
+        return None, (jsonify({"error": f"At most {MAX_BATCH_SYMBOLS} symbols per request"}), 400)
+    return (user_identifier, symbols), None
+
+@main_bp.route("/user/follow", methods=["POST"])
+def follow_cryptos():
+    parsed, error = _follow_request()
+    if error:
+        return error
+    user_identifier, symbols = parsed
+    count = user_service.follow_cryptos(user_identifier, symbols)
+    return jsonify({"status": "success", "message": f"Successfully followed {count} symbol(s) for {user_identifier}.",
+                    "followed_cryptos": user_service.get_followed_cryptos(user_identifier)})
+
+@main_bp.route("/user/unfollow", methods=["POST"])
+def unfollow_cryptos():
+    parsed, error = _follow_request()
+    if error:
+        return error
+    user_identifier, symbols = parsed
+    removed = user_service.unfollow_cryptos(user_identifier, symbols)
+    return jsonify({"status": "success", "message": f"Successfully unfollowed {removed} symbol(s) for {user_identifier}.",
+                    "followed_cryptos": user_service.get_followed_cryptos(user_identifier)})
+
 # --- Alert System Endpoints ---
 @main_bp.route("/alerts/subscriptions", methods=["GET"])
 def get_alert_subscriptions():
+    from .services import alert_service
+
     user_identifier = request.args.get("userId") # Or from auth
     if not user_identifier:
         return jsonify({"error": "User identifier is required for fetching subscriptions"}), 400
-    subscriptions = alert_service.get_user_alert_subscriptions(user_identifier)
-    return jsonify({"status": "success", "subscriptions": subscriptions})
+    limit = request.args.get("limit", default=alert_service.SUBSCRIPTION_PAGE_SIZE, type=int)
+    after_id = request.args.get("cursor", type=int) # next_cursor of the previous page
+    include_inactive = request.args.get("includeInactive", "false").lower() == "true"
+    page = alert_service.get_user_alert_subscriptions(user_identifier, limit, after_id, include_inactive)
+    return jsonify({"status": "success", "subscriptions": page["subscriptions"], "next_cursor": page["next_cursor"]})
 
 @main_bp.route("/alerts/subscribe", methods=["POST"])
 def subscribe_alerts():
+    from .services import alert_service
+
     data = request.json
     user_identifier = data.get("userId")
     crypto_symbol = data.get("cryptoSymbol")
@@ -110,10 +334,14 @@ def subscribe_alerts():
         return jsonify({"error": "Missing data for alert subscription (userId, cryptoSymbol, alertCondition required)"}), 400
     
     result = alert_service.subscribe_to_alerts(user_identifier, crypto_symbol, alert_condition)
+    if result.get("status") == "error":
+        return jsonify(result), 400
     return jsonify(result)
 
 @main_bp.route("/alerts/unsubscribe", methods=["POST"])
 def unsubscribe_alerts():
+    from .services import alert_service
+
     data = request.json
     user_identifier = data.get("userId")
     crypto_symbol = data.get("cryptoSymbol")
@@ -122,5 +350,7 @@ def unsubscribe_alerts():
         return jsonify({"error": "Missing data for alert unsubscription (userId, cryptoSymbol, alertCondition required)"}), 400
 
     result = alert_service.unsubscribe_from_alerts(user_identifier, crypto_symbol, alert_condition)
+    if result.get("status") == "error":
+        return jsonify(result), 404
     return jsonify(result)
 
@@ -0,0 +1,150 @@
+# app/services/alert_conditions.py
+#
+# Alert condition DSL and compiler.
+#
+# AlertSubscription.alert_condition is a short string such as "price_drops_below_40000".
+# Supported forms (numbers may have a decimal part, e.g. "price_exceeds_3500.5"):
+#
+#   price_drops_below_<price>      triggers when price < <price>
+#   price_exceeds_<price>          triggers when price > <price>   (alias: price_rises_above_<price>)
+#   price_increase_<n>_percent     triggers when the daily change is >= +<n>%
+#   price_decrease_<n>_percent     triggers when the daily change is <= -<n>%
+#
+# compile_subscriptions() turns all active subscriptions into one CompiledAlertIndex: rows
+# are sorted by (symbol, condition kind, threshold), so for each (symbol, kind) group the
+# thresholds form a sorted array. A price tick then finds every triggered subscription of a
+# group with one binary search - they are always a contiguous prefix or suffix of the group.
+
+import re
+from datetime import datetime, timezone
+
+import numpy as np
+
+KIND_BELOW = 0 # price < threshold
+KIND_ABOVE = 1 # price > threshold
+KIND_PCT_UP = 2 # change_pct >= threshold
+KIND_PCT_DOWN = 3 # change_pct <= -threshold
+KIND_NAMES = {KIND_BELOW: "below", KIND_ABOVE: "above", KIND_PCT_UP: "pct_up", KIND_PCT_DOWN: "pct_down"}
+
+_NUMBER = r"(\d+(?:\.\d+)?)"
+_PATTERNS = [
+    (re.compile(rf"price_drops_below_{_NUMBER}"), KIND_BELOW),
+    (re.compile(rf"price_(?:exceeds|rises_above)_{_NUMBER}"), KIND_ABOVE),
+    (re.compile(rf"price_increase_{_NUMBER}_percent"), KIND_PCT_UP),
+    (re.compile(rf"price_decrease_{_NUMBER}_percent"), KIND_PCT_DOWN),
+]
+
+NEVER_SENT = -np.inf
+
+
+class InvalidAlertCondition(ValueError):
+    pass
+
+
+def parse_condition(condition: str):
+    """Parse an alert condition string into (kind, threshold)."""
+    text = (condition or "").strip().lower()
+    for pattern, kind in _PATTERNS:
+        match = pattern.fullmatch(text)
+        if match:
+            return kind, float(match.group(1))
+    raise InvalidAlertCondition(
+        f"Unsupported alert condition '{condition}'. Use price_drops_below_<price>, price_exceeds_<price>, "
+        "price_increase_<n>_percent or price_decrease_<n>_percent."
+    )
+
+
+def to_epoch(value) -> float:
+    """Epoch seconds for a naive-UTC datetime (as stored in the models); NEVER_SENT for None."""
+    if value is None:
+        return NEVER_SENT
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+class CompiledAlertIndex:
+    """All active subscriptions grouped by (symbol, kind) into sorted threshold arrays."""
+
+    def __init__(self, ids, symbols, kinds, thresholds, last_sent, invalid=0):
+        order = np.lexsort((thresholds, kinds, symbols))
+        self.ids = np.asarray(ids, dtype=np.int64)[order]
+        self.thresholds = np.asarray(thresholds, dtype=np.float64)[order]
+        self.last_sent = np.asarray(last_sent, dtype=np.float64)[order]
+        self.invalid = invalid # Subscriptions skipped because their condition did not parse
+        symbols = np.asarray(symbols)[order]
+        kinds = np.asarray(kinds, dtype=np.int8)[order]
+
+        # (symbol, kind) -> (start, end) slice of the sorted arrays
+        self.groups = {}
+        if len(self.ids):
+            boundaries = np.nonzero((symbols[1:] != symbols[:-1]) | (kinds[1:] != kinds[:-1]))[0] + 1
+            starts = np.concatenate(([0], boundaries))
+            ends = np.concatenate((boundaries, [len(self.ids)]))
+            for start, end in zip(starts.tolist(), ends.tolist()):
+                self.groups[(str(symbols[start]), int(kinds[start]))] = (start, end)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def symbols(self):
+        return sorted({symbol for symbol, _ in self.groups})
+
+    def _rows(self, symbol: str, kind: int, value: float):
+        bounds = self.groups.get((symbol, kind))
+        if bounds is None or value is None or value != value:
+            return None
+        start, end = bounds
+        group = self.thresholds[start:end]
+        if kind == KIND_BELOW:
+            return start + int(np.searchsorted(group, value, side="right")), end
+        if kind == KIND_ABOVE:
+            return start, start + int(np.searchsorted(group, value, side="left"))
+        if kind == KIND_PCT_UP:
+            return start, start + int(np.searchsorted(group, value, side="right"))
+        return start, start + int(np.searchsorted(group, -value, side="right")) # KIND_PCT_DOWN
+
+    def triggered(self, symbol: str, price: float, change_pct: float = None, now: float = None,
+                  cooldown_seconds: float = 0) -> np.ndarray:
+        """Ids of subscriptions triggered by one tick and not alerted within the cooldown."""
+        cutoff = None if now is None else now - cooldown_seconds
+        matches = []
+        for kind, value in ((KIND_BELOW, price), (KIND_ABOVE, price), (KIND_PCT_UP, change_pct), (KIND_PCT_DOWN, change_pct)):
+            rows = self._rows(symbol, kind, value)
+            if rows is None or rows[0] >= rows[1]:
+                continue
+            start, end = rows
+            ids = self.ids[start:end]
+            if cutoff is not None:
+                ids = ids[self.last_sent[start:end] <= cutoff]
+            matches.append(ids)
+        return np.concatenate(matches) if matches else np.empty(0, dtype=np.int64)
+
+
+def compile_subscriptions(subscriptions) -> CompiledAlertIndex:
+    """Compile (id, crypto_symbol, alert_condition, last_alert_sent_at) tuples into an index."""
+    parsed = {} # Many subscriptions share a condition string; parse each distinct one once
+    ids, symbols, kinds, thresholds, last_sent = [], [], [], [], []
+    invalid = 0
+    for sub_id, symbol, condition, last_alert_sent_at in subscriptions:
+        rule = parsed.get(condition)
+        if rule is None:
+            try:
+                rule = parse_condition(condition)
+            except InvalidAlertCondition:
+                rule = False
+            parsed[condition] = rule
+        if rule is False:
+            invalid += 1
+            continue
+        ids.append(sub_id)
+        symbols.append(symbol.upper())
+        kinds.append(rule[0])
+        thresholds.append(rule[1])
+        last_sent.append(last_alert_sent_at if isinstance(last_alert_sent_at, float) else to_epoch(last_alert_sent_at))
+    return CompiledAlertIndex(ids, np.array(symbols, dtype=str), kinds, thresholds, last_sent, invalid)
+
+
+def now_epoch() -> float:
+    return datetime.now(timezone.utc).timestamp()
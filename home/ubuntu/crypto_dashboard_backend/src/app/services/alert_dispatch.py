@@ -0,0 +1,212 @@
+# app/services/alert_dispatch.py
+#
+# Alert delivery queue, decoupling alert evaluation (check_and_send_alerts) from delivery.
+#
+# Evaluation submits one AlertEvent per triggered subscription and channel. A background
+# thread then:
+#   - coalesces events for the same (channel, user) arriving within `coalesce_window` seconds
+#     into a single notification, so a market-wide move sends one message per user, not dozens;
+#   - sends ready notifications to the channel's sink in batches of up to `batch_size`,
+#     retrying failed batches with exponential backoff and keeping the ones that still fail
+#     in `dead_letters`;
+#   - reports delivered subscription ids to `write_back(ids, sent_at)` once per flush, so
+#     last_alert_sent_at is updated in bulk instead of row by row.
+# The submit queue is bounded: when delivery falls behind, submit() blocks and finally raises
+# DispatchBackpressure instead of letting memory grow without limit.
+#
+# Sinks are objects with a `send_batch(channel, notifications)` method. LocalSink records
+# notifications in memory (and optionally a JSONL file) so the pipeline can be tested offline.
+
+import json
+import queue
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+
+
+class DispatchBackpressure(Exception):
+    """Raised by submit() when the dispatch queue stays full for longer than the timeout."""
+
+
+@dataclass
+class AlertEvent:
+    subscription_id: int
+    user_identifier: str
+    crypto_symbol: str
+    alert_condition: str
+    price: float
+    channel: str = "email"
+    triggered_at: float = field(default_factory=time.time)
+
+
+@dataclass
+class Notification:
+    channel: str
+    user_identifier: str
+    alerts: list # AlertEvent dicts, oldest first
+    first_seen: float
+
+    @property
+    def subscription_ids(self):
+        return [alert["subscription_id"] for alert in self.alerts]
+
+
+class LocalSink:
+    """Sink that keeps delivered notifications in memory and optionally appends them to a JSONL file."""
+
+    def __init__(self, path: str = None, fail_times: int = 0):
+        self.path = path
+        self.fail_times = fail_times # Fail the first N batches, to exercise retries
+        self.batches = []
+        self._lock = threading.Lock()
+
+    @property
+    def notifications(self):
+        return [n for _, batch in self.batches for n in batch]
+
+    def send_batch(self, channel: str, notifications: list):
+        with self._lock:
+            if self.fail_times > 0:
+                self.fail_times -= 1
+                raise ConnectionError("injected sink failure")
+            self.batches.append((channel, notifications))
+            if self.path:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    for notification in notifications:
+                        f.write(json.dumps(asdict(notification)) + "\n")
+
+
+class LogSink:
+    """Sink that only prints, standing in for real email/Telegram delivery."""
+
+    def send_batch(self, channel: str, notifications: list):
+        for notification in notifications:
+            symbols = sorted({alert["crypto_symbol"] for alert in notification.alerts})
+            print(f"SERVICE: Sending {len(notification.alerts)} {channel} alert(s) to "
+                  f"{notification.user_identifier} for {', '.join(symbols)} (simulation)")
+
+
+class AlertDispatcher:
+    def __init__(self, sinks: dict = None, default_sink=None, write_back=None, batch_size: int = 100,
+                 coalesce_window: float = 2.0, max_queue: int = 10000, max_retries: int = 3,
+                 backoff: float = 0.5, poll_interval: float = 0.05):
+        self.sinks = sinks or {}
+        self.default_sink = default_sink or LogSink()
+        self.write_back = write_back
+        self.batch_size = batch_size
+        self.coalesce_window = coalesce_window
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.poll_interval = poll_interval
+        self.dead_letters = []
+        self.stats = {"submitted": 0, "coalesced": 0, "notifications_sent": 0, "batches_sent": 0,
+                      "retries": 0, "failed_notifications": 0, "written_back": 0}
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._pending = {} # channel -> {user_identifier: Notification}
+        self._stats_lock = threading.Lock()
+        self._idle = threading.Condition()
+        self._in_flight = 0 # Events submitted but not yet delivered or dead-lettered
+        self._flush_now = False # Set by drain() to deliver without waiting for the coalesce window
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="alert-dispatch", daemon=True)
+        self._thread.start()
+
+    def submit(self, event: AlertEvent, timeout: float = 5.0):
+        """Queue an alert for delivery. Blocks while the queue is full (backpressure)."""
+        with self._idle:
+            self._in_flight += 1
+        try:
+            self._queue.put(event, timeout=timeout)
+        except queue.Full:
+            with self._idle:
+                self._in_flight -= 1
+                self._idle.notify_all()
+            raise DispatchBackpressure(f"alert queue full ({self._queue.maxsize} events)")
+        self._count("submitted")
+
+    def drain(self, timeout: float = None) -> bool:
+        """Deliver everything submitted so far, ignoring the coalesce window. True when empty."""
+        self._flush_now = True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._idle:
+            while self._in_flight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._idle.wait(remaining if remaining is not None else 0.1)
+            done = self._in_flight == 0
+        self._flush_now = False
+        return done
+
+    def close(self, timeout: float = 10.0):
+        self.drain(timeout)
+        self._stopping.set()
+        self._thread.join(timeout)
+
+    def _count(self, key: str, n: int = 1):
+        with self._stats_lock:
+            self.stats[key] += n
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                self._add(self._queue.get(timeout=self.poll_interval))
+                # Take what else is already queued (bounded, so flushes keep happening under load)
+                for _ in range(max(self.batch_size, 1000)):
+                    self._add(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            self._flush(force=self._flush_now)
+
+    def _add(self, event: AlertEvent):
+        by_user = self._pending.setdefault(event.channel, {})
+        notification = by_user.get(event.user_identifier)
+        if notification is None:
+            by_user[event.user_identifier] = Notification(event.channel, event.user_identifier, [asdict(event)], time.monotonic())
+        else:
+            notification.alerts.append(asdict(event))
+            self._count("coalesced")
+
+    def _flush(self, force: bool = False):
+        now = time.monotonic()
+        delivered_ids = []
+        settled = 0
+        for channel, by_user in self._pending.items():
+            ready = [n for n in by_user.values() if force or now - n.first_seen >= self.coalesce_window]
+            for n in ready:
+                del by_user[n.user_identifier]
+            for start in range(0, len(ready), self.batch_size):
+                batch = ready[start:start + self.batch_size]
+                settled += sum(len(n.alerts) for n in batch)
+                if self._deliver(channel, batch):
+                    delivered_ids.extend(sub_id for n in batch for sub_id in n.subscription_ids)
+        if delivered_ids and self.write_back is not None:
+            delivered_ids = sorted(set(delivered_ids)) # One row per subscription, even with several channels
+            try:
+                self.write_back(delivered_ids, time.time())
+                self._count("written_back", len(delivered_ids))
+            except Exception as e:
+                print(f"SERVICE: Failed to record sent alerts: {e}")
+        if settled:
+            with self._idle:
+                self._in_flight -= settled
+                self._idle.notify_all()
+
+    def _deliver(self, channel: str, batch: list) -> bool:
+        sink = self.sinks.get(channel, self.default_sink)
+        for attempt in range(self.max_retries + 1):
+            try:
+                sink.send_batch(channel, batch)
+                self._count("batches_sent")
+                self._count("notifications_sent", len(batch))
+                return True
+            except Exception as e:
+                if attempt == self.max_retries:
+                    print(f"SERVICE: Giving up on {len(batch)} {channel} notifications: {e}")
+                    break
+                self._count("retries")
+                time.sleep(self.backoff * (2 ** attempt))
+        self.dead_letters.extend(batch)
+        self._count("failed_notifications", len(batch))
+        return False
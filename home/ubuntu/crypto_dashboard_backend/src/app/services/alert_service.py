@@ -1,45 +1,264 @@
-# Placeholder for app/services/alert_service.py
+# app/services/alert_service.py
+import json
+import threading
+from datetime import datetime, timezone
+
+from . import alert_conditions, alert_dispatch, live_stream, ohlcv_store
+
+ALERT_COOLDOWN_SECONDS = 24 * 3600 # Do not repeat an alert for the same subscription within a day
+DEFAULT_ALERT_CHANNEL = "email"
+WRITE_BACK_CHUNK_SIZE = 500 # Ids per UPDATE ... WHERE id IN (...), well under SQLite's variable limit
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+SUBSCRIPTION_PAGE_SIZE = 100
+MAX_SUBSCRIPTION_PAGE_SIZE = 500
+
+def _subscription_key(user_identifier: str, crypto_symbol: str, alert_condition: str):
+    # Symbols are stored upper-case and conditions lower-case, so the unique index
+    # (user_identifier, crypto_symbol, alert_condition) sees "btc-usd" and "BTC-USD" as one
+    return user_identifier, crypto_symbol.strip().upper(), alert_condition.strip().lower()
+
+
+def _ensure_users(user_identifiers):
+    # AlertSubscription.user_identifier references user_preferences; create missing users
+    from ..models import UserPreference, db, dialect_insert
+
+    users = [{"user_identifier": user} for user in sorted(set(user_identifiers))]
+    if users:
+        db.session.execute(dialect_insert(UserPreference).on_conflict_do_nothing(index_elements=["user_identifier"]), users)
+
+
+def bulk_upsert_subscriptions(subscriptions) -> int:
+    """Create or reactivate many (user_identifier, crypto_symbol, alert_condition) subscriptions.
+
+    A single INSERT ... ON CONFLICT DO UPDATE against the unique index, executed for all rows
+    at once (executemany), so the statement is compiled once. Conditions must already be
+    validated. Returns the number of subscriptions written.
+    """
+    from ..models import AlertSubscription, db, dialect_insert
+
+    keys = list(dict.fromkeys(_subscription_key(*row) for row in subscriptions))
+    if not keys:
+        return 0
+    _ensure_users(user for user, _, _ in keys)
+    upsert = dialect_insert(AlertSubscription).on_conflict_do_update(
+        index_elements=["user_identifier", "crypto_symbol", "alert_condition"],
+        set_={"is_active": True}
+    )
+    db.session.execute(upsert, [
+        {"user_identifier": user, "crypto_symbol": symbol, "alert_condition": condition, "is_active": True}
+        for user, symbol, condition in keys
+    ])
+    db.session.commit()
+    return len(keys)
+
+
+def bulk_deactivate_subscriptions(subscriptions) -> int:
+    """Deactivate many (user_identifier, crypto_symbol, alert_condition) subscriptions.
+
+    Rows are kept (with last_alert_sent_at) so that subscribing again restores them. Each
+    key is one unique-index lookup of an executemany UPDATE. Returns the number of
+    subscriptions that were active.
+    """
+    from sqlalchemy import bindparam
+    from ..models import AlertSubscription, db
+
+    keys = list(dict.fromkeys(_subscription_key(*row) for row in subscriptions))
+    if not keys:
+        return 0
+    table = AlertSubscription.__table__
+    update = table.update().where(
+        table.c.user_identifier == bindparam("k_user"),
+        table.c.crypto_symbol == bindparam("k_symbol"),
+        table.c.alert_condition == bindparam("k_condition"),
+        table.c.is_active.is_(True)
+    ).values(is_active=False)
+    result = db.session.execute(update, [
+        {"k_user": user, "k_symbol": symbol, "k_condition": condition} for user, symbol, condition in keys
+    ])
+    db.session.commit()
+    return result.rowcount
+
 
 def subscribe_to_alerts(user_identifier: str, crypto_symbol: str, alert_condition: str):
-    """Placeholder to handle user subscription to an alert."""
-    # In a real implementation:
-    # 1. Validate inputs.
-    # 2. Check if user_identifier exists in UserPreference table.
-    # 3. Create or update an AlertSubscription entry in the database.
-    #    - Ensure no duplicate active subscriptions for the same user, symbol, and condition.
-    print(f"SERVICE: User {user_identifier} attempting to subscribe to {crypto_symbol} for {alert_condition}")
-    # For now, just return a success message
+    """Subscribe a user to an alert (or reactivate an earlier subscription)."""
+    try:
+        alert_conditions.parse_condition(alert_condition)
+    except alert_conditions.InvalidAlertCondition as e:
+        return {"status": "error", "message": str(e)}
+    print(f"SERVICE: User {user_identifier} subscribing to {crypto_symbol} for {alert_condition}")
+    bulk_upsert_subscriptions([(user_identifier, crypto_symbol, alert_condition)])
     return {"status": "success", "message": f"Successfully subscribed {user_identifier} to {crypto_symbol} alerts for {alert_condition}."}
 
 def unsubscribe_from_alerts(user_identifier: str, crypto_symbol: str, alert_condition: str):
-    """Placeholder to handle user unsubscription from an alert."""
-    # In a real implementation:
-    # 1. Validate inputs.
-    # 2. Find the AlertSubscription entry and mark it as inactive or delete it.
-    print(f"SERVICE: User {user_identifier} attempting to unsubscribe from {crypto_symbol} for {alert_condition}")
-    # For now, just return a success message
+    """Deactivate a user's alert subscription."""
+    print(f"SERVICE: User {user_identifier} unsubscribing from {crypto_symbol} for {alert_condition}")
+    if not bulk_deactivate_subscriptions([(user_identifier, crypto_symbol, alert_condition)]):
+        return {"status": "error", "message": f"No active subscription for {user_identifier} to {crypto_symbol} alerts for {alert_condition}."}
     return {"status": "success", "message": f"Successfully unsubscribed {user_identifier} from {crypto_symbol} alerts for {alert_condition}."}
 
-def get_user_alert_subscriptions(user_identifier: str):
-    """Placeholder to get a user's active alert subscriptions."""
-    print(f"SERVICE: Fetching alert subscriptions for {user_identifier}")
-    # In a real implementation, query the AlertSubscription table.
-    # For now, return mock data
-    return [
-        {"crypto_symbol": "BTC-USD", "alert_condition": "price_drops_below_40000", "is_active": True},
-        {"crypto_symbol": "ETH-USD", "alert_condition": "price_exceeds_3500", "is_active": True},
-    ]
-
-# Placeholder for a function that would be called by a scheduler to check and send alerts
-def check_and_send_alerts():
-    """Placeholder for the core alert checking and sending logic."""
-    # 1. Fetch all active alert subscriptions.
-    # 2. For each subscription, fetch current market data for the crypto_symbol.
-    # 3. Evaluate the alert_condition against the market data.
-    # 4. If condition met and alert not recently sent:
-    #    - Send alert (e.g., email via SendGrid, Telegram message).
-    #    - Update last_alert_sent_at for the subscription.
-    print("SERVICE: Checking alert conditions and sending alerts (simulation)...")
-    # This would be a complex piece of logic.
-    pass
+def get_user_alert_subscriptions(user_identifier: str, limit: int = SUBSCRIPTION_PAGE_SIZE, after_id: int = None,
+                                 include_inactive: bool = False) -> dict:
+    """One page of a user's alert subscriptions, in id order.
+
+    Keyset pagination: pass the returned `next_cursor` as `after_id` for the next page. Each
+    page is a range scan of the (user_identifier, is_active, id) index, however deep it is.
+    """
+    from ..models import AlertSubscription, db
+
+    limit = max(1, min(limit, MAX_SUBSCRIPTION_PAGE_SIZE))
+    query = db.session.query(
+        AlertSubscription.id, AlertSubscription.crypto_symbol, AlertSubscription.alert_condition,
+        AlertSubscription.is_active, AlertSubscription.created_at, AlertSubscription.last_alert_sent_at
+    ).filter(AlertSubscription.user_identifier == user_identifier)
+    if not include_inactive:
+        query = query.filter(AlertSubscription.is_active.is_(True))
+    if after_id is not None:
+        query = query.filter(AlertSubscription.id > after_id)
+    rows = query.order_by(AlertSubscription.id).limit(limit + 1).all()
+
+    subscriptions = [{
+        "id": row.id,
+        "crypto_symbol": row.crypto_symbol,
+        "alert_condition": row.alert_condition,
+        "is_active": row.is_active,
+        "created_at": row.created_at.isoformat() if row.created_at else None,
+        "last_alert_sent_at": row.last_alert_sent_at.isoformat() if row.last_alert_sent_at else None,
+    } for row in rows[:limit]]
+    next_cursor = subscriptions[-1]["id"] if len(rows) > limit else None
+    return {"subscriptions": subscriptions, "next_cursor": next_cursor}
+
+# Called by a scheduler to check and send alerts
+def load_market_data(store_dir: str, symbols) -> dict:
+    """Latest price and daily change (%) per symbol from the OHLCV store."""
+    market_data = {}
+    for symbol in symbols:
+        bars = ohlcv_store.load_bars(store_dir, symbol, "1d")
+        if len(bars) == 0:
+            continue
+        price = float(bars["adj_close"][-1])
+        change_pct = float((bars["adj_close"][-1] / bars["adj_close"][-2] - 1) * 100) if len(bars) > 1 else None
+        market_data[symbol] = (price, change_pct)
+    return market_data
+
+
+def _chunks(values, size: int = WRITE_BACK_CHUNK_SIZE):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def bulk_mark_alerts_sent(app, subscription_ids, sent_at: float):
+    """Write last_alert_sent_at for many subscriptions with a few UPDATE statements."""
+    from ..models import AlertSubscription, db
+
+    sent_at = datetime.fromtimestamp(sent_at, tz=timezone.utc).replace(tzinfo=None)
+    with app.app_context():
+        for chunk in _chunks(list(subscription_ids)):
+            db.session.query(AlertSubscription).filter(AlertSubscription.id.in_(chunk)).update(
+                {AlertSubscription.last_alert_sent_at: sent_at}, synchronize_session=False
+            )
+        db.session.commit()
+
+
+def get_dispatcher(app=None) -> alert_dispatch.AlertDispatcher:
+    """The process-wide alert dispatcher, created on first use."""
+    global _dispatcher
+    if _dispatcher is None:
+        from flask import current_app
+        app = app or current_app._get_current_object()
+        with _dispatcher_lock: # Concurrent first calls must not start two dispatcher threads
+            if _dispatcher is None:
+                _dispatcher = alert_dispatch.AlertDispatcher(
+                    write_back=lambda ids, sent_at: bulk_mark_alerts_sent(app, ids, sent_at)
+                )
+    return _dispatcher
+
+
+def _alert_channels(user_identifiers) -> dict:
+    # user -> delivery channels, from UserPreference.alert_settings_json {"channels": [...]}
+    from ..models import UserPreference, db
+
+    channels = {}
+    for chunk in _chunks(sorted(user_identifiers)):
+        rows = db.session.query(UserPreference.user_identifier, UserPreference.alert_settings_json).filter(
+            UserPreference.user_identifier.in_(chunk))
+        for user_identifier, settings_json in rows:
+            try:
+                configured = json.loads(settings_json or "{}").get("channels")
+            except (ValueError, AttributeError):
+                configured = None
+            channels[user_identifier] = configured or [DEFAULT_ALERT_CHANNEL]
+    return channels
+
+
+def check_and_send_alerts(market_data: dict = None, cooldown_seconds: float = ALERT_COOLDOWN_SECONDS,
+                          dispatcher: alert_dispatch.AlertDispatcher = None, wait: bool = False):
+    """Evaluate every active subscription against the latest prices and queue due alerts.
+
+    `market_data` maps symbol -> (price, daily change %); by default it is read from the
+    OHLCV store. Delivery happens on the dispatcher's thread; pass wait=True (e.g. from a
+    one-shot job such as the pipeline's alerts stage) to block until it is done. Triggered
+    alerts are also queued for the users' /api/stream connections in every web process (see
+    live_stream.AlertOutbox). Returns the ids of the subscriptions whose alerts were queued;
+    when the dispatcher pushes back, the rest are deferred to the next check.
+    """
+    from flask import current_app
+    from ..models import AlertSubscription, db
+
+    # 1. Fetch all active alert subscriptions and compile them into sorted threshold arrays.
+    rows = db.session.query(
+        AlertSubscription.id, AlertSubscription.crypto_symbol,
+        AlertSubscription.alert_condition, AlertSubscription.last_alert_sent_at
+    ).filter(AlertSubscription.is_active.is_(True))
+    index = alert_conditions.compile_subscriptions(rows)
+    if index.invalid:
+        print(f"SERVICE: Skipped {index.invalid} subscriptions with unsupported conditions")
+
+    # 2. Current market data for the subscribed symbols.
+    if market_data is None:
+        market_data = load_market_data(current_app.config["OHLCV_STORE_DIR"], index.symbols)
+
+    # 3. One binary search per (symbol, condition type) finds the triggered subscriptions;
+    # the cooldown filters out those alerted recently.
+    now = alert_conditions.now_epoch()
+    triggered = {} # subscription id -> (symbol, price)
+    for symbol, (price, change_pct) in market_data.items():
+        ids = index.triggered(symbol.upper(), price, change_pct, now=now, cooldown_seconds=cooldown_seconds)
+        if len(ids):
+            print(f"SERVICE: {len(ids)} alerts triggered for {symbol} at {price}")
+            triggered.update((sub_id, (symbol, price)) for sub_id in ids.tolist())
+    if not triggered:
+        return []
 
+    # 4. Hand the alerts to the dispatcher, which batches, coalesces and delivers them and
+    # writes last_alert_sent_at back in bulk once they are sent.
+    dispatcher = dispatcher or get_dispatcher()
+    subscriptions = []
+    for chunk in _chunks(list(triggered)):
+        subscriptions.extend(db.session.query(
+            AlertSubscription.id, AlertSubscription.user_identifier, AlertSubscription.alert_condition
+        ).filter(AlertSubscription.id.in_(chunk)))
+    channels = _alert_channels({user for _, user, _ in subscriptions})
+    queued = []
+    stream_events = []
+    try:
+        for sub_id, user_identifier, condition in subscriptions:
+            symbol, price = triggered[sub_id]
+            for channel in channels.get(user_identifier, [DEFAULT_ALERT_CHANNEL]):
+                dispatcher.submit(alert_dispatch.AlertEvent(sub_id, user_identifier, symbol, condition, price, channel))
+                if not queued or queued[-1] != sub_id:
+                    queued.append(sub_id)
+                    stream_events.append((user_identifier, {"subscription_id": sub_id, "crypto_symbol": symbol,
+                                                            "alert_condition": condition, "price": price}))
+    except alert_dispatch.DispatchBackpressure as e:
+        # Delivery is too far behind: stop here. The rest are not marked as sent, so they
+        # trigger again on the next check
+        print(f"SERVICE: Deferred {len(triggered) - len(queued)} of {len(triggered)} triggered alerts ({e})")
+    # Through the database rather than this process's broker: alerts are usually evaluated by
+    # the pipeline, while the streams are held open by the web processes
+    live_stream.AlertOutbox.publish(stream_events)
+    if wait:
+        dispatcher.drain()
+    return queued
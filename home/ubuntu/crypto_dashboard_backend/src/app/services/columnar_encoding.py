@@ -0,0 +1,136 @@
+# app/services/columnar_encoding.py
+#
+# Encoders for columnar multi-symbol price data, as returned by
+# crypto_service.get_price_columns():
+#
+#   {"timestamps": int64 array, "fields": [...], "symbols": {symbol: {field: float64 array}}}
+#
+# Supported formats, picked from the `format` query parameter or the Accept header:
+#   json     application/json                      arrays as JSON lists (NaN -> null)
+#   msgpack  application/x-msgpack                 each array as raw little-endian bytes + dtype,
+#                                                  plus a "validity" bitmap if it has nulls
+#   arrow    application/vnd.apache.arrow.stream   one Arrow IPC record batch, columns
+#                                                  "timestamp" and "<symbol>.<field>"; NaN -> null
+# Missing values (NaN, e.g. a symbol without a bar at some timestamp) are real nulls in every
+# format. The msgpack bitmap uses Arrow's layout: bit i (least significant bit first) of byte
+# i // 8 is 0 where value i is null, whose bytes in "data" are then meaningless. Arrays without
+# nulls carry no bitmap, and the binary encoders copy their NumPy buffers as-is, without
+# building Python objects per value.
+# msgpack and pyarrow are optional dependencies; formats whose library is missing are not offered.
+
+import json
+
+import numpy as np
+
+MIMETYPES = {
+    "json": "application/json",
+    "msgpack": "application/x-msgpack",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+_FORMAT_BY_MIMETYPE = {mimetype: fmt for fmt, mimetype in MIMETYPES.items()}
+_FORMAT_BY_MIMETYPE["application/msgpack"] = "msgpack"
+
+
+class UnsupportedFormat(ValueError):
+    pass
+
+
+def available_formats() -> list:
+    formats = ["json"]
+    try:
+        import msgpack # noqa: F401
+        formats.append("msgpack")
+    except ImportError:
+        pass
+    try:
+        import pyarrow # noqa: F401
+        formats.append("arrow")
+    except ImportError:
+        pass
+    return formats
+
+
+def negotiate(format_param: str = None, accept_mimetypes=None) -> str:
+    """Pick the response format from an explicit `format` parameter or the Accept header."""
+    formats = available_formats()
+    if format_param:
+        if format_param not in formats:
+            raise UnsupportedFormat(f"Unsupported format '{format_param}'. Available: {', '.join(formats)}.")
+        return format_param
+    if accept_mimetypes:
+        offered = [MIMETYPES[fmt] for fmt in formats] + (["application/msgpack"] if "msgpack" in formats else [])
+        best = accept_mimetypes.best_match(offered)
+        if best:
+            return _FORMAT_BY_MIMETYPE[best]
+    return "json"
+
+
+def encode_json(columns: dict, meta: dict) -> bytes:
+    payload = dict(meta)
+    payload["timestamps"] = columns["timestamps"].tolist()
+    payload["fields"] = columns["fields"]
+    payload["data"] = {
+        symbol: {field: _json_list(values) for field, values in fields.items()}
+        for symbol, fields in columns["symbols"].items()
+    }
+    return json.dumps(payload, separators=(",", ":")).encode()
+
+
+def _nulls(values: np.ndarray):
+    # Boolean mask of missing values, or None if there are none
+    if values.dtype.kind != "f":
+        return None
+    missing = np.isnan(values)
+    return missing if missing.any() else None
+
+
+def _json_list(values: np.ndarray) -> list:
+    missing = _nulls(values)
+    return values.tolist() if missing is None else np.where(missing, None, values).tolist()
+
+
+def _packed_array(values: np.ndarray) -> dict:
+    values = np.ascontiguousarray(values)
+    packed = {"dtype": values.dtype.newbyteorder("<").str, "data": values.astype(values.dtype.newbyteorder("<"), copy=False).tobytes()}
+    missing = _nulls(values)
+    if missing is not None:
+        packed["validity"] = np.packbits(~missing, bitorder="little").tobytes()
+    return packed
+
+
+def encode_msgpack(columns: dict, meta: dict) -> bytes:
+    import msgpack
+
+    payload = dict(meta)
+    payload["timestamps"] = _packed_array(columns["timestamps"])
+    payload["fields"] = columns["fields"]
+    payload["data"] = {
+        symbol: {field: _packed_array(values) for field, values in fields.items()}
+        for symbol, fields in columns["symbols"].items()
+    }
+    return msgpack.packb(payload, use_bin_type=True)
+
+
+def encode_arrow(columns: dict, meta: dict) -> bytes:
+    import pyarrow as pa
+
+    names = ["timestamp"]
+    arrays = [pa.array(columns["timestamps"].astype("datetime64[s]"))]
+    for symbol, fields in columns["symbols"].items():
+        for field, values in fields.items():
+            names.append(f"{symbol}.{field}")
+            # float64 without nulls wraps the NumPy buffer; NaN gaps become nulls in a validity bitmap
+            arrays.append(pa.array(values, mask=_nulls(values)))
+    schema_meta = {key: json.dumps(value) for key, value in meta.items()}
+    batch = pa.RecordBatch.from_arrays(arrays, names=names).replace_schema_metadata(schema_meta)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, batch.schema) as writer:
+        writer.write_batch(batch)
+    return sink.getvalue().to_pybytes()
+
+
+ENCODERS = {"json": encode_json, "msgpack": encode_msgpack, "arrow": encode_arrow}
+
+
+def encode(fmt: str, columns: dict, meta: dict) -> bytes:
+    return ENCODERS[fmt](columns, meta)
@@ -0,0 +1,190 @@
+# app/services/crypto_service.py
+# Market data queries for the /api/crypto/* endpoints, served from the local OHLCV store
+# that the daily pipeline keeps up to date.
+
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+from . import forecasting, indicators, ohlcv_store
+
+DEFAULT_INTERVAL = "1d"
+# Same settings as scripts/run_daily_crypto_pipeline.py
+SMA_WINDOW_SHORT = 3
+SMA_WINDOW_LONG = 7
+PREDICTION_DAYS = 3
+ANALYSIS_BARS = 10
+FORECAST_HISTORY_BARS = 365 # Bars the forecasting models are backtested on
+
+# (store_dir, interval, symbol) -> (data_version, model selection). A symbol's backtest is
+# only redone once the pipeline has written new bars for it.
+_model_cache = {}
+_model_cache_lock = threading.Lock()
+
+_RANGE_UNITS = {"d": 86400, "w": 7 * 86400, "mo": 30 * 86400, "y": 365 * 86400}
+
+
+def range_to_seconds(range_param: str):
+    """Convert a range such as "7d", "3mo" or "1y" to seconds. Returns None for "max"."""
+    if range_param == "max":
+        return None
+    match = re.fullmatch(r"(\d+)(d|w|mo|y)", range_param or "")
+    if not match:
+        raise ValueError(f"Invalid range '{range_param}'. Use e.g. 7d, 2w, 3mo, 1y or max.")
+    return int(match.group(1)) * _RANGE_UNITS[match.group(2)]
+
+
+def get_price_bars(store_dir: str, symbol: str, range_param: str, interval: str = DEFAULT_INTERVAL):
+    """Stored bars for `symbol` covering the last `range_param`, as a zero-copy view."""
+    seconds = range_to_seconds(range_param)
+    start_ts = None if seconds is None else int(time.time()) - seconds
+    return ohlcv_store.load_bars(store_dir, symbol, interval, start_ts=start_ts)
+
+
+PRICE_FIELDS = ("open", "high", "low", "close", "adj_close", "volume")
+
+
+def get_price_columns(store_dir: str, symbols, range_param: str, fields=PRICE_FIELDS,
+                      interval: str = DEFAULT_INTERVAL) -> dict:
+    """Columnar price history for many symbols on one shared timestamp axis.
+
+    Returns {"timestamps": int64 array, "fields": [...], "symbols": {symbol: {field: float64 array}}}.
+    When every symbol has the same bars (the usual case for daily crypto data) the field arrays
+    are copied straight out of the memory-mapped store; otherwise they are aligned on the union
+    of timestamps with NaN for missing bars.
+    """
+    bars_by_symbol = {symbol: get_price_bars(store_dir, symbol, range_param, interval) for symbol in symbols}
+    stamps = [bars["timestamp"] for bars in bars_by_symbol.values()]
+    shared = all(len(ts) == len(stamps[0]) and np.array_equal(ts, stamps[0]) for ts in stamps[1:]) if stamps else True
+    timestamps = np.array(stamps[0] if stamps else [], dtype=np.int64) if shared else np.unique(np.concatenate(stamps))
+
+    columns = {}
+    for symbol, bars in bars_by_symbol.items():
+        if shared:
+            columns[symbol] = {field: np.ascontiguousarray(bars[field]) for field in fields}
+            continue
+        rows = np.searchsorted(timestamps, bars["timestamp"])
+        aligned = {}
+        for field in fields:
+            values = np.full(len(timestamps), np.nan)
+            values[rows] = bars[field]
+            aligned[field] = values
+        columns[symbol] = aligned
+    return {"timestamps": timestamps, "fields": list(fields), "symbols": columns}
+
+
+def _json_column(values):
+    # NaN is not valid JSON, so missing values are returned as None
+    if values.dtype.kind == "f" and np.isnan(values).any():
+        return np.where(np.isnan(values), None, values).tolist()
+    return values.tolist()
+
+
+def get_price_history(store_dir: str, symbol: str, range_param: str, interval: str = DEFAULT_INTERVAL):
+    """Price history rows for `symbol` over `range_param`, oldest first."""
+    bars = get_price_bars(store_dir, symbol, range_param, interval)
+    dates = bars["timestamp"].astype("datetime64[s]").astype("datetime64[D]").astype(str)
+    names = ohlcv_store.BAR_DTYPE.names
+    columns = [_json_column(bars[name]) for name in names]
+    return [
+        dict(zip(names, row), date=date)
+        for row, date in zip(zip(*columns), dates.tolist())
+    ]
+
+
+def data_version(store_dir: str, symbol: str, interval: str = DEFAULT_INTERVAL):
+    """Changes whenever the pipeline writes bars for `symbol`; used to invalidate cached responses."""
+    try:
+        stat = os.stat(ohlcv_store.bar_path(store_dir, symbol, interval))
+    except OSError:
+        return None
+    return (stat.st_size, stat.st_mtime_ns)
+
+
+def _latest_indicators(store_dir: str, symbol: str, interval: str):
+    bars = ohlcv_store.load_bars(store_dir, symbol, interval)[-ANALYSIS_BARS:]
+    if len(bars) < SMA_WINDOW_LONG:
+        return bars, None
+    results = indicators.compute_indicators(bars["adj_close"][None, :], SMA_WINDOW_SHORT, SMA_WINDOW_LONG, PREDICTION_DAYS)
+    return bars, results
+
+
+def _date_str(timestamp) -> str:
+    return str(np.datetime64(int(timestamp), "s").astype("datetime64[D]"))
+
+
+def get_current_analysis(store_dir: str, symbol: str, interval: str = DEFAULT_INTERVAL) -> dict:
+    """Latest price, daily change, SMAs and trend for `symbol` ({} without enough data)."""
+    bars, results = _latest_indicators(store_dir, symbol, interval)
+    if results is None:
+        return {}
+    return {
+        "as_of": _date_str(bars["timestamp"][-1]),
+        "current_price": float(bars["adj_close"][-1]),
+        "daily_change_pct": float(results["daily_change_pct"][0, -1]),
+        f"sma_{SMA_WINDOW_SHORT}": float(results["sma_short"][0, -1]),
+        f"sma_{SMA_WINDOW_LONG}": float(results["sma_long"][0, -1]),
+        "trend": indicators.TREND_LABELS[int(results["trend"][0])],
+    }
+
+
+def score_models(store_dir: str, symbols, interval: str = DEFAULT_INTERVAL) -> dict:
+    """Backtest the forecasting models on the last FORECAST_HISTORY_BARS bars of every symbol
+    in one vectorized pass, without caching.
+
+    Returns {symbol: selection or None} (see forecasting.select_models; selections also carry
+    "as_of", the timestamp of the last bar); None for symbols with too little history.
+    """
+    history = {symbol: ohlcv_store.load_bars(store_dir, symbol, interval)[-FORECAST_HISTORY_BARS:] for symbol in symbols}
+    enough = [symbol for symbol, bars in history.items() if len(bars) >= SMA_WINDOW_LONG]
+    prices = indicators.stack_prices([history[symbol]["adj_close"] for symbol in enough])
+    scored = dict(zip(enough, forecasting.select_models(prices, horizon=PREDICTION_DAYS))) if enough else {}
+    for symbol, selection in scored.items():
+        if selection is not None:
+            selection["as_of"] = int(history[symbol]["timestamp"][-1])
+    print(f"SERVICE: Backtested forecasting models for {len(enough)} symbol(s)")
+    return {symbol: scored.get(symbol) for symbol in symbols}
+
+
+def get_model_selections(store_dir: str, symbols, interval: str = DEFAULT_INTERVAL) -> dict:
+    """Best forecasting model per symbol (see score_models), cached per process.
+
+    Symbols whose bars changed since they were last scored are backtested together in one
+    pass; the rest come from the cache.
+    """
+    selections, stale = {}, {}
+    with _model_cache_lock:
+        for symbol in symbols:
+            version = data_version(store_dir, symbol, interval)
+            cached = _model_cache.get((store_dir, interval, symbol))
+            if cached is not None and version is not None and cached[0] == version:
+                selections[symbol] = cached[1]
+            else:
+                stale[symbol] = version
+
+    if stale:
+        scored = score_models(store_dir, list(stale), interval)
+        with _model_cache_lock:
+            for symbol, version in stale.items():
+                selections[symbol] = scored[symbol]
+                if version is not None:
+                    _model_cache[(store_dir, interval, symbol)] = (version, scored[symbol])
+    return selections
+
+
+def get_prediction(store_dir: str, symbol: str, interval: str = DEFAULT_INTERVAL) -> dict:
+    """Forecast for the next PREDICTION_DAYS days by the symbol's best backtested model ({} without enough data)."""
+    selection = get_model_selections(store_dir, [symbol], interval)[symbol]
+    if selection is None:
+        return {}
+    return {
+        "method": selection["model"],
+        "backtest": {"mape_pct": selection["mape"], "scored": selection["scored"], "models": selection["scores"]},
+        "predictions": [
+            {"date": _date_str(selection["as_of"] + 86400 * step), "predicted_price": price}
+            for step, price in enumerate(selection["forecast"], start=1)
+        ],
+    }
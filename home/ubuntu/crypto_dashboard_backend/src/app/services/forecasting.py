@@ -0,0 +1,278 @@
+# app/services/forecasting.py
+#
+# Price forecasting models and a vectorized walk-forward backtester.
+#
+# Every model implements paths(values, horizon): for a (symbols, time) price array it returns
+# the forecasts made at *every* bar from the data up to that bar, shaped (symbols, time,
+# horizon). A backtest is then just a comparison of those paths with the prices that followed,
+# for all symbols, origins and models at once - no Python loop over symbols or bars:
+#
+#   SMAExtrapolation  window sums (cumsum) for the SMA and its one-step slope
+#   RollingOLS        window sums of y and t*y give the least-squares line per bar
+#   EMA, HoltLinear   linear recurrences (exponential smoothing), evaluated as a convolution
+#                     with their impulse response via FFT instead of step by step
+#
+# Input rows may be left-padded with NaN (see indicators.stack_prices); they are shifted to
+# start at column 0 first, so each symbol is scored on its own history only.
+
+import numpy as np
+
+
+# --- Array helpers ---
+def left_align(prices: np.ndarray):
+    """Shift each row so its first valid price is in column 0 (trailing NaN padding).
+
+    Gaps inside a history are forward-filled. Returns (values, lengths).
+    """
+    prices = np.atleast_2d(np.asarray(prices, dtype=np.float64))
+    n_rows, n_cols = prices.shape
+    valid = ~np.isnan(prices)
+    if n_cols == 0:
+        return prices.copy(), np.zeros(n_rows, dtype=np.int64)
+    first = np.where(valid.any(axis=1), np.argmax(valid, axis=1), n_cols)
+    last = np.where(valid.any(axis=1), n_cols - 1 - np.argmax(valid[:, ::-1], axis=1), -1)
+    lengths = np.maximum(last - first + 1, 0)
+
+    # Forward fill: index of the latest valid column at or before each column
+    filled_idx = np.maximum.accumulate(np.where(valid, np.arange(n_cols), 0), axis=1)
+    filled = np.take_along_axis(prices, filled_idx, axis=1)
+    cols = np.arange(n_cols)[None, :] + first[:, None]
+    values = np.take_along_axis(filled, np.minimum(cols, n_cols - 1), axis=1)
+    values[cols > last[:, None]] = np.nan
+    return values, lengths
+
+
+def window_sum(values: np.ndarray, window: int) -> np.ndarray:
+    """Sum of the last `window` values at each column (NaN until the window is full)."""
+    n_cols = values.shape[1]
+    out = np.full(values.shape, np.nan)
+    if n_cols < window:
+        return out
+    csum = np.cumsum(values, axis=1)
+    out[:, window - 1] = csum[:, window - 1]
+    out[:, window:] = csum[:, window:] - csum[:, :-window]
+    return out
+
+
+def _matrix_powers(a: np.ndarray, n: int) -> np.ndarray:
+    """A^k for k = 0..n-1 of a 2x2 matrix, shaped (n, 2, 2).
+
+    Uses A^k = c0(k) I + c1(k) A (Cayley-Hamilton) with c0/c1 from the eigenvalues, which also
+    covers complex and repeated eigenvalues without an eigenvector basis.
+    """
+    trace, det = np.trace(a), np.linalg.det(a)
+    disc = complex(trace * trace - 4 * det)
+    l1, l2 = (trace + np.sqrt(disc)) / 2, (trace - np.sqrt(disc)) / 2
+    k = np.arange(n)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if abs(l1 - l2) > 1e-9:
+            c1 = (l1 ** k - l2 ** k) / (l1 - l2)
+            c0 = (l1 * l2 ** k - l2 * l1 ** k) / (l1 - l2)
+        else:
+            c1 = np.where(k > 0, k * l1 ** np.maximum(k - 1, 0), 0)
+            c0 = (1 - k) * l1 ** k
+    return c0.real[:, None, None] * np.eye(2) + c1.real[:, None, None] * a
+
+
+def linear_filter(values: np.ndarray, a: np.ndarray, b: np.ndarray, s0: np.ndarray) -> np.ndarray:
+    """States of s_t = A s_{t-1} + B y_t (t >= 1) from s_0, for every row at once.
+
+    values: (symbols, time) left-aligned, trailing NaN allowed (states there are meaningless).
+    s0: (symbols, 2) initial state at column 0. Returns (symbols, time, 2).
+    The input part is a convolution of y with the impulse response A^k B, done with an FFT
+    along the time axis; the initial state decays as A^t s_0.
+    """
+    n_rows, n_cols = values.shape
+    if n_cols == 0:
+        return np.empty((n_rows, 0, 2))
+    powers = _matrix_powers(a, n_cols) # (time, 2, 2)
+    impulse = powers @ b # (time, 2): A^k B
+    y = np.nan_to_num(values)
+    y[:, 0] = 0.0 # Column 0 only sets s_0
+    size = 1 << max(1, int(2 * n_cols - 1).bit_length())
+    y_fft = np.fft.rfft(y, size, axis=1)
+    states = np.empty((n_rows, n_cols, 2))
+    for i in range(2):
+        states[:, :, i] = np.fft.irfft(y_fft * np.fft.rfft(impulse[:, i], size), size, axis=1)[:, :n_cols]
+    states += np.einsum("tij,sj->sti", powers, s0)
+    return states
+
+
+# --- Models ---
+class Forecaster:
+    name = "forecaster"
+
+    def paths(self, values: np.ndarray, horizon: int) -> np.ndarray:
+        """Forecasts made at every column from the data up to it: (symbols, time, horizon)."""
+        raise NotImplementedError
+
+    def forecast(self, prices: np.ndarray, horizon: int) -> np.ndarray:
+        """Forecast after the last bar of each row: (symbols, horizon)."""
+        values, lengths = left_align(prices)
+        paths = self.paths(values, horizon)
+        return paths[np.arange(len(values)), np.maximum(lengths - 1, 0)]
+
+
+def _level_trend_paths(level: np.ndarray, trend: np.ndarray, horizon: int) -> np.ndarray:
+    return level[:, :, None] + trend[:, :, None] * np.arange(1, horizon + 1)
+
+
+class SMAExtrapolation(Forecaster):
+    """Linear extrapolation of the last two SMA points (the pipeline's original prediction)."""
+
+    def __init__(self, window: int = 3):
+        self.window = window
+        self.name = f"sma_{window}_extrapolation"
+
+    def paths(self, values, horizon):
+        sma = window_sum(values, self.window) / self.window
+        slope = np.full(sma.shape, np.nan)
+        slope[:, 1:] = sma[:, 1:] - sma[:, :-1]
+        return _level_trend_paths(sma, slope, horizon)
+
+
+class RollingOLS(Forecaster):
+    """Least-squares line through the last `window` prices, extended forward."""
+
+    def __init__(self, window: int = 14):
+        self.window = window
+        self.name = f"ols_{window}"
+
+    def paths(self, values, horizon):
+        w = self.window
+        # Prices relative to each row's first price keep the t*y sums small
+        y = values - values[:, :1]
+        t = np.arange(values.shape[1], dtype=np.float64)
+        sum_y = window_sum(y, w)
+        sum_ty = window_sum(y * t, w)
+        # x = position inside the window, 0..w-1
+        sum_x, sum_xx = w * (w - 1) / 2, (w - 1) * w * (2 * w - 1) / 6
+        sum_xy = sum_ty - (t - w + 1) * sum_y
+        slope = (w * sum_xy - sum_x * sum_y) / (w * sum_xx - sum_x * sum_x)
+        intercept = (sum_y - slope * sum_x) / w
+        level = intercept + slope * (w - 1) + values[:, :1] # Fitted value at the last bar
+        return _level_trend_paths(level, slope, horizon)
+
+
+class HoltLinear(Forecaster):
+    """Holt's linear trend method (double exponential smoothing)."""
+
+    def __init__(self, alpha: float = 0.5, beta: float = 0.1):
+        self.alpha = alpha
+        self.beta = beta
+        self.name = f"holt_{alpha:g}_{beta:g}"
+
+    def _initial_state(self, values):
+        return np.stack([values[:, 0], np.nan_to_num(values[:, 1] - values[:, 0]) if values.shape[1] > 1
+                         else np.zeros(len(values))], axis=1)
+
+    def paths(self, values, horizon):
+        # level_t = a*y_t + (1-a)(level + trend)_{t-1};  trend_t = b(level_t - level_{t-1}) + (1-b) trend_{t-1}
+        a, b = self.alpha, self.beta
+        transition = np.array([[1 - a, 1 - a], [-a * b, 1 - a * b]])
+        states = linear_filter(values, transition, np.array([a, a * b]), self._initial_state(values))
+        return _level_trend_paths(states[:, :, 0], states[:, :, 1], horizon)
+
+
+class EMA(HoltLinear):
+    """Exponential moving average held flat (Holt without a trend)."""
+
+    def __init__(self, alpha: float = 0.5):
+        super().__init__(alpha, 0.0)
+        self.name = f"ema_{alpha:g}"
+
+    def _initial_state(self, values):
+        return np.stack([values[:, 0], np.zeros(len(values))], axis=1)
+
+
+# Candidates in order of preference: ties go to the earlier (simpler) model
+DEFAULT_MODELS = (
+    SMAExtrapolation(3),
+    EMA(0.3),
+    EMA(0.6),
+    HoltLinear(0.5, 0.1),
+    HoltLinear(0.8, 0.2),
+    RollingOLS(7),
+    RollingOLS(14),
+)
+
+
+# --- Backtesting ---
+def _future_values(values: np.ndarray, horizon: int) -> np.ndarray:
+    # actual[s, t, k-1] = values[s, t + k]
+    padded = np.concatenate([values, np.full((len(values), horizon), np.nan)], axis=1)
+    return np.lib.stride_tricks.sliding_window_view(padded, horizon + 1, axis=1)[:, :values.shape[1], 1:]
+
+
+def backtest(prices: np.ndarray, models=DEFAULT_MODELS, horizon: int = 3, lookback: int = None,
+             min_scored: int = 10) -> dict:
+    """Walk-forward backtest of `models` on every symbol (row) of `prices` in one pass.
+
+    At each bar every model forecasts the next `horizon` bars from the data up to that bar;
+    the error is the mean absolute percentage error over all (bar, step) pairs that have an
+    actual price, counted only where every model able to forecast that symbol has a forecast,
+    so all candidates are scored on the same bars. lookback limits scoring to the newest bars;
+    with fewer than `min_scored` pairs the scores are too noisy to pick a model from.
+
+    Returns a dict:
+      names      model names
+      mape       (models, symbols) MAPE in percent, NaN where a model was not scored
+      scored     (symbols,) forecast/actual pairs each model was scored on
+      forecasts  (models, symbols, horizon) forecasts after the last bar
+      best       (symbols,) index of the lowest-MAPE model (the first usable model when unscored, -1 if none)
+    """
+    values, lengths = left_align(prices)
+    n_rows, n_cols = values.shape
+    if n_cols == 0:
+        return {"names": [model.name for model in models], "mape": np.full((len(models), n_rows), np.nan),
+                "scored": np.zeros(n_rows, dtype=np.int64), "forecasts": np.full((len(models), n_rows, horizon), np.nan),
+                "best": np.full(n_rows, -1)}
+    rows = np.arange(n_rows)
+    last = np.maximum(lengths - 1, 0)
+    paths = np.stack([model.paths(values, horizon) for model in models]) # (models, symbols, time, horizon)
+    forecasts = paths[:, rows, last] # (models, symbols, horizon)
+    usable = np.isfinite(forecasts).all(axis=2) & (lengths > 0) # Model can forecast this symbol now
+
+    actual = _future_values(values, horizon)
+    origin = np.arange(n_cols)[None, :, None]
+    mask = np.isfinite(actual) & (origin + np.arange(1, horizon + 1) < lengths[:, None, None])
+    if lookback is not None:
+        mask &= origin >= (lengths - lookback)[:, None, None]
+    # Score every model on the same (bar, step) pairs: where all usable models have a forecast
+    mask &= np.all(np.isfinite(paths) | ~usable[:, :, None, None], axis=0)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        errors = np.where(mask, np.abs(paths - actual) / np.abs(actual), 0.0)
+    scored = mask.sum(axis=(1, 2))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mape = np.where(usable & (scored > 0), errors.sum(axis=(2, 3)) / scored * 100, np.nan)
+
+    ranked = np.where(np.isnan(mape) | (scored < min_scored), np.inf, mape)
+    best = np.where(np.isfinite(ranked).any(axis=0), np.argmin(ranked, axis=0),
+                    np.where(usable.any(axis=0), np.argmax(usable, axis=0), -1))
+    return {"names": [model.name for model in models], "mape": mape, "scored": scored,
+            "forecasts": forecasts, "best": best}
+
+
+def select_models(prices: np.ndarray, models=DEFAULT_MODELS, horizon: int = 3, lookback: int = None,
+                  min_scored: int = 10) -> list:
+    """Backtest `models` and return, per row of `prices`, the best model and its forecast.
+
+    Each entry is None (no model can forecast the symbol) or
+    {"model", "mape", "scored", "forecast": [horizon floats], "scores": {name: mape}}.
+    """
+    result = backtest(prices, models, horizon, lookback, min_scored)
+    selections = []
+    for row, best in enumerate(result["best"]):
+        if best < 0:
+            selections.append(None)
+            continue
+        mape = result["mape"][:, row]
+        selections.append({
+            "model": result["names"][best],
+            "mape": None if np.isnan(mape[best]) or result["scored"][row] < min_scored else float(mape[best]),
+            "scored": int(result["scored"][row]),
+            "forecast": result["forecasts"][best, row].tolist(),
+            "scores": {name: float(score) for name, score in zip(result["names"], mape) if not np.isnan(score)},
+        })
+    return selections
@@ -0,0 +1,150 @@
+# app/services/indicators.py
+#
+# Batch indicator engine: SMA-short/SMA-long, daily change, trend direction and the
+# SMA-slope price extrapolation for many symbols at once.
+#
+# Input is a 2-D float array of prices shaped (symbols, time), oldest bar first.
+# Symbols with shorter histories are left-padded with NaN (see stack_prices), which
+# gives the same results as running each shorter series on its own.
+#
+# The rolling means reproduce pandas' `Series.rolling(window).mean()` bit for bit:
+# pandas keeps a Kahan-compensated running sum that adds the entering value and
+# subtracts the leaving one, so a cumsum or window-sum shortcut would drift from it
+# in the last few ULPs. Here the same running-sum recurrence is applied to every
+# symbol column at once, looping only over the (short) time axis.
+
+import numpy as np
+
+TREND_UP = 1
+TREND_DOWN = -1
+TREND_NEUTRAL = 0
+TREND_LABELS = {TREND_UP: "Upward", TREND_DOWN: "Downward", TREND_NEUTRAL: "Neutral"}
+
+
+def stack_prices(series_list, length: int = None) -> np.ndarray:
+    """Left-pad 1-D price series with NaN into a (symbols, length) float64 array."""
+    length = length if length is not None else max((len(s) for s in series_list), default=0)
+    prices = np.full((len(series_list), length), np.nan)
+    for row, series in enumerate(series_list):
+        values = np.asarray(series, dtype=np.float64)[-length:] if length else []
+        if len(values):
+            prices[row, length - len(values):] = values
+    return prices
+
+
+def rolling_mean(prices: np.ndarray, window: int) -> np.ndarray:
+    """Row-wise equivalent of pandas `rolling(window).mean()` (min_periods = window)."""
+    prices = np.asarray(prices, dtype=np.float64)
+    n_rows, n_cols = prices.shape
+    out = np.full((n_rows, n_cols), np.nan)
+    if n_cols == 0:
+        return out
+
+    nobs = np.zeros(n_rows, dtype=np.int64)
+    neg_ct = np.zeros(n_rows, dtype=np.int64)
+    same_ct = np.zeros(n_rows, dtype=np.int64)
+    sum_x = np.zeros(n_rows)
+    comp_add = np.zeros(n_rows)
+    comp_remove = np.zeros(n_rows)
+    prev_value = prices[:, 0].copy()
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for i in range(n_cols):
+            if i >= window:
+                # Value leaving the window
+                val = prices[:, i - window]
+                ok = val == val
+                y = -val - comp_remove
+                t = sum_x + y
+                comp_remove = np.where(ok, (t - sum_x) - y, comp_remove)
+                sum_x = np.where(ok, t, sum_x)
+                nobs -= ok
+                neg_ct -= ok & np.signbit(val)
+
+            # Value entering the window
+            val = prices[:, i]
+            ok = val == val
+            y = val - comp_add
+            t = sum_x + y
+            comp_add = np.where(ok, (t - sum_x) - y, comp_add)
+            sum_x = np.where(ok, t, sum_x)
+            nobs += ok
+            neg_ct += ok & np.signbit(val)
+            same_ct = np.where(ok, np.where(val == prev_value, same_ct + 1, 1), same_ct)
+            prev_value = np.where(ok, val, prev_value)
+
+            result = sum_x / nobs
+            # pandas returns the repeated value itself for a constant window and clamps
+            # sign flips caused by rounding
+            result = np.where(same_ct >= nobs, prev_value, result)
+            result = np.where((neg_ct == 0) & (result < 0), 0.0, result)
+            result = np.where((neg_ct == nobs) & (result > 0), 0.0, result)
+            out[:, i] = np.where((nobs >= window) & (nobs > 0), result, np.nan)
+    return out
+
+
+def pct_change(prices: np.ndarray) -> np.ndarray:
+    """Row-wise equivalent of pandas `pct_change() * 100`."""
+    out = np.full(prices.shape, np.nan)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        out[:, 1:] = (prices[:, 1:] / prices[:, :-1] - 1) * 100
+    return out
+
+
+def _last_valid(values: np.ndarray, skip_last: bool = False):
+    # Column index of the last (or second to last) non-NaN value per row, -1 if none
+    if values.shape[1] == 0:
+        return np.full(values.shape[0], -1)
+    valid = ~np.isnan(values)
+    if skip_last:
+        last = _last_valid(values)
+        rows = np.nonzero(last >= 0)[0]
+        valid[rows, last[rows]] = False
+    n_cols = values.shape[1]
+    idx = n_cols - 1 - np.argmax(valid[:, ::-1], axis=1)
+    return np.where(valid.any(axis=1), idx, -1)
+
+
+def compute_indicators(prices: np.ndarray, short_window: int = 3, long_window: int = 7, horizon: int = 3) -> dict:
+    """Compute every pipeline indicator for a (symbols, time) price array in one pass.
+
+    Returns a dict of arrays, one row per symbol:
+      sma_short, sma_long, daily_change_pct  (symbols, time)
+      trend                                  TREND_UP / TREND_DOWN / TREND_NEUTRAL of the latest bar
+      last_sma, sma_slope                    newest SMA-short value and its one-step slope
+      predictions                            (symbols, horizon) linear SMA-short extrapolation
+    """
+    prices = np.atleast_2d(np.asarray(prices, dtype=np.float64))
+    n_rows = prices.shape[0]
+    sma_short = rolling_mean(prices, short_window)
+    sma_long = rolling_mean(prices, long_window)
+    daily_change = pct_change(prices)
+
+    if prices.shape[1]:
+        latest_short, latest_long = sma_short[:, -1], sma_long[:, -1]
+        current_price = prices[:, -1]
+    else:
+        latest_short = latest_long = current_price = np.full(n_rows, np.nan)
+    trend = np.where(latest_short > latest_long, TREND_UP,
+                     np.where(latest_short < latest_long, TREND_DOWN, TREND_NEUTRAL))
+
+    # Slope of the last two SMA-short points; with fewer than two, hold the last SMA
+    # (or the current price when there is no SMA at all) flat.
+    rows = np.arange(n_rows)
+    last_idx = _last_valid(sma_short)
+    prev_idx = _last_valid(sma_short, skip_last=True)
+    last_sma = np.where(last_idx >= 0, sma_short[rows, np.maximum(last_idx, 0)], current_price)
+    prev_sma = sma_short[rows, np.maximum(prev_idx, 0)]
+    sma_slope = np.where(prev_idx >= 0, last_sma - prev_sma, 0.0)
+    steps = np.arange(1, horizon + 1)
+    predictions = last_sma[:, None] + (sma_slope[:, None] * steps)
+
+    return {
+        "sma_short": sma_short,
+        "sma_long": sma_long,
+        "daily_change_pct": daily_change,
+        "trend": trend,
+        "last_sma": last_sma,
+        "sma_slope": sma_slope,
+        "predictions": predictions,
+    }
@@ -0,0 +1,263 @@
+# app/services/instrumentation.py
+#
+# Lightweight timing and memory instrumentation.
+#
+# API: init_app(app) registers before/after-request hooks that record a latency histogram
+# per (method, endpoint, status). render_prometheus() formats them - plus process memory,
+# response cache and live stream counters - in the Prometheus text format for /api/metrics.
+#
+# Pipeline: a RunRecorder times stages per symbol (wall and CPU time, RSS after the stage),
+# optionally tracks Python allocations with tracemalloc, and writes a JSON run summary.
+#
+# Both are switched off by METRICS_ENABLED=0 / a disabled RunRecorder; the hooks are then
+# not registered at all and RunRecorder.timer() returns a shared no-op context manager.
+
+import bisect
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timezone
+
+# Prometheus' default latency buckets (seconds)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+_NOOP = nullcontext()
+
+
+def current_rss_bytes():
+    """Resident set size of this process (Linux /proc; None elsewhere)."""
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def peak_rss_bytes(children: bool = False) -> int:
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    return usage.ru_maxrss * (1 if sys.platform == "darwin" else 1024) # ru_maxrss is KiB on Linux
+
+
+# --- Request metrics ---
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1) # Last slot is +Inf
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class RequestMetrics:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.histograms = {} # (method, endpoint, status) -> Histogram
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    def started(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def observe(self, method: str, endpoint: str, status: int, seconds: float):
+        key = (method, endpoint, str(status))
+        with self._lock:
+            self.in_flight -= 1
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def snapshot(self):
+        with self._lock:
+            return self.in_flight, {key: (list(h.counts), h.total, h.count) for key, h in self.histograms.items()}
+
+
+def init_app(app):
+    """Record per-endpoint request latency for `app` (stored as app.extensions["request_metrics"])."""
+    if not app.config.get("METRICS_ENABLED", True):
+        return None
+    from flask import g, request
+
+    metrics = app.extensions["request_metrics"] = RequestMetrics()
+
+    @app.before_request
+    def _start_timer():
+        g._request_started = time.perf_counter()
+        metrics.started()
+
+    @app.after_request
+    def _record_latency(response):
+        started = g.pop("_request_started", None)
+        if started is not None:
+            # Templated route ("/api/reports/download/<report_id>"), so ids do not explode the label set
+            endpoint = request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+            metrics.observe(request.method, endpoint, response.status_code, time.perf_counter() - started)
+        return response
+
+    @app.teardown_request
+    def _record_error(error):
+        # An unhandled exception skips after_request; count it as a 500
+        started = g.pop("_request_started", None)
+        if started is not None:
+            endpoint = request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+            metrics.observe(request.method, endpoint, 500, time.perf_counter() - started)
+
+    return metrics
+
+
+def _labels(**labels) -> str:
+    parts = []
+    for name, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{name}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def _format_value(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_prometheus(app) -> str:
+    """All metrics of this process in the Prometheus text exposition format (version 0.0.4)."""
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for suffix, labels, value in samples:
+            lines.append(f"{name}{suffix}{_labels(**labels) if labels else ''} {_format_value(value)}")
+
+    metrics = app.extensions.get("request_metrics")
+    if metrics is not None:
+        in_flight, histograms = metrics.snapshot()
+        samples = []
+        for (method, endpoint, status), (counts, total, count) in sorted(histograms.items()):
+            labels = {"method": method, "endpoint": endpoint, "status": status}
+            cumulative = 0
+            for bound, bucket_count in zip(metrics.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                samples.append(("_bucket", dict(labels, le="+Inf" if bound == float("inf") else repr(bound)), cumulative))
+            samples.append(("_sum", labels, total))
+            samples.append(("_count", labels, count))
+        metric("http_request_duration_seconds", "histogram", "Request latency by endpoint.", samples)
+        metric("http_requests_in_flight", "gauge", "Requests being handled.", [("", None, in_flight)])
+
+    rss = current_rss_bytes()
+    if rss is not None:
+        metric("process_resident_memory_bytes", "gauge", "Resident memory size.", [("", None, rss)])
+    metric("process_peak_resident_memory_bytes", "gauge", "Peak resident memory size.", [("", None, peak_rss_bytes())])
+
+    cache = app.extensions.get("response_cache")
+    if cache is not None:
+        stats = cache.snapshot()
+        for key in ("hits", "misses", "coalesced", "evictions", "invalidations"):
+            metric(f"response_cache_{key}_total", "counter", f"Response cache {key}.", [("", None, stats[key])])
+        metric("response_cache_entries", "gauge", "Cached responses.", [("", None, stats["entries"])])
+
+    stream = app.extensions.get("live_stream")
+    if stream is not None:
+        stats = stream.snapshot()
+        metric("live_stream_connections", "gauge", "Open /api/stream connections.", [("", None, stats["connections"])])
+        for key in ("prices_delivered", "alerts_published", "conflated", "dropped"):
+            metric(f"live_stream_{key}_total", "counter", f"Live stream {key.replace('_', ' ')}.", [("", None, stats[key])])
+    return "\n".join(lines) + "\n"
+
+
+# --- Pipeline run recording ---
+class RunRecorder:
+    """Per-stage/per-symbol timings and memory for one pipeline run, summarized as JSON."""
+
+    def __init__(self, enabled: bool = True, trace_allocations: bool = False, top_allocations: int = 10):
+        self.enabled = enabled
+        self.trace_allocations = enabled and trace_allocations
+        self.top_allocations = top_allocations
+        self.started_at = datetime.now(timezone.utc)
+        self.records = []
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+        if self.trace_allocations:
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+
+    def timer(self, stage: str, symbol: str = None, **details):
+        """Context manager timing one stage (for one symbol). A no-op when disabled."""
+        if not self.enabled:
+            return _NOOP
+        return self._timed(stage, symbol, details)
+
+    @contextmanager
+    def _timed(self, stage, symbol, details):
+        wall = time.perf_counter()
+        cpu = time.thread_time() # This thread only: branches run concurrently
+        status = "ok"
+        try:
+            yield details
+        except BaseException as e:
+            status = f"error: {e}"
+            raise
+        finally:
+            record = {"stage": stage, "symbol": symbol, "status": status,
+                      "seconds": round(time.perf_counter() - wall, 6),
+                      "cpu_seconds": round(time.thread_time() - cpu, 6),
+                      "rss_bytes": current_rss_bytes()}
+            if self.trace_allocations:
+                import tracemalloc
+                record["traced_bytes"], record["traced_peak_bytes"] = tracemalloc.get_traced_memory()
+            record.update(details)
+            with self._lock:
+                self.records.append(record)
+
+    def record(self, stage: str, symbol: str = None, **fields):
+        """Record an event without timing it (e.g. a stage loaded from its checkpoint)."""
+        if self.enabled:
+            with self._lock:
+                self.records.append(dict({"stage": stage, "symbol": symbol, "seconds": 0.0}, **fields))
+
+    def summary(self) -> dict:
+        with self._lock:
+            records = list(self.records)
+        stages = {}
+        for record in records:
+            totals = stages.setdefault(record["stage"], {"ran": 0, "cached": 0, "failed": 0, "seconds": 0.0,
+                                                         "max_seconds": 0.0, "slowest_symbol": None})
+            status = record.get("status", "ok")
+            totals["ran" if status == "ok" else "cached" if status == "cached" else "failed"] += 1
+            totals["seconds"] = round(totals["seconds"] + record["seconds"], 6)
+            if record["seconds"] >= totals["max_seconds"]:
+                totals["max_seconds"] = record["seconds"]
+                totals["slowest_symbol"] = record["symbol"]
+        summary = {
+            "started_at": self.started_at.isoformat(),
+            "wall_seconds": round(time.perf_counter() - self._start, 6),
+            "peak_rss_bytes": peak_rss_bytes(),
+            "children_peak_rss_bytes": peak_rss_bytes(children=True), # e.g. plot worker processes
+            "stages": stages,
+            "records": records,
+        }
+        if self.trace_allocations:
+            import tracemalloc
+            snapshot = tracemalloc.take_snapshot()
+            summary["top_allocations"] = [
+                {"where": str(stat.traceback), "bytes": stat.size, "blocks": stat.count}
+                for stat in snapshot.statistics("lineno")[:self.top_allocations]
+            ]
+            summary["traced_peak_bytes"] = tracemalloc.get_traced_memory()[1]
+        return summary
+
+    def write_summary(self, path: str, **extra) -> dict:
+        summary = dict(self.summary(), **extra)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2, default=str)
+        os.replace(tmp_path, path)
+        return summary
@@ -0,0 +1,321 @@
+# app/services/live_stream.py
+#
+# Push channel for live prices and triggered alerts (served as Server-Sent Events by
+# /api/stream, see routes.py).
+#
+# One StreamBroker per process fans events out to any number of connections:
+#   - Upstream reads are shared: a single poller thread asks the feed for new prices of the
+#     symbols that currently have at least one listener, so 5,000 clients watching BTC-USD
+#     cost one read per update, not 5,000. The poller starts with the first connection and
+#     a symbol is dropped from polling when its last listener disconnects.
+#   - Every connection has a bounded buffer. Price updates are conflated: a slow client only
+#     ever holds the latest price per symbol. Alerts are kept in a ring of `max_alerts`;
+#     when it is full the oldest alert is dropped. A slow consumer therefore never blocks the
+#     publisher or grows memory without limit, and drops are counted in the stats.
+#
+# The default feed (StoreFeed) watches the OHLCV store written by the pipeline and
+# publishes a symbol's latest bar when its file changes. Alerts come from the stream_alerts
+# table (AlertOutbox), where alert_service.check_and_send_alerts queues them from whichever
+# process evaluated them; the poller reads them for users with an open stream.
+
+import itertools
+import json
+import threading
+import time
+from collections import deque
+
+from . import crypto_service, ohlcv_store
+
+DEFAULT_POLL_SECONDS = 1.0
+DEFAULT_MAX_ALERTS = 100 # Per connection; older alerts are dropped beyond this
+STREAM_ALERT_RETENTION_SECONDS = 3600 # Outbox rows older than this are pruned on publish
+OUTBOX_BATCH_SIZE = 1000
+
+
+class StreamClosed(Exception):
+    pass
+
+
+class Subscription:
+    """One client connection: the symbols it watches and its bounded event buffer."""
+
+    def __init__(self, symbols, user_identifier: str = None, max_alerts: int = DEFAULT_MAX_ALERTS):
+        self.symbols = frozenset(symbols)
+        self.user_identifier = user_identifier
+        self.closed = False
+        self.stats = {"delivered": 0, "conflated": 0, "dropped": 0}
+        self._prices = {} # symbol -> latest price event not yet read (conflated)
+        self._alerts = deque(maxlen=max_alerts)
+        self._cond = threading.Condition()
+
+    def offer_prices(self, events):
+        with self._cond:
+            for event in events:
+                if event["symbol"] in self._prices:
+                    self.stats["conflated"] += 1
+                self._prices[event["symbol"]] = event
+            self._cond.notify() # One wake-up per batch, however many symbols changed
+
+    def offer_alert(self, event: dict):
+        with self._cond:
+            if len(self._alerts) == self._alerts.maxlen:
+                self.stats["dropped"] += 1
+            self._alerts.append(event)
+            self._cond.notify()
+
+    def next_events(self, timeout: float = None) -> list:
+        """Wait up to `timeout` seconds for events; returns [(kind, event), ...], possibly empty."""
+        with self._cond:
+            if not self._prices and not self._alerts and not self.closed:
+                self._cond.wait(timeout)
+            if self.closed:
+                raise StreamClosed()
+            events = [("alert", event) for event in self._alerts]
+            events.extend(("price", event) for event in self._prices.values())
+            self._alerts.clear()
+            self._prices.clear()
+            self.stats["delivered"] += len(events)
+            return events
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+
+class StoreFeed:
+    """Upstream feed reading the latest bar of each symbol from the OHLCV store when it changes."""
+
+    def __init__(self, store_dir: str, interval: str = "1d"):
+        self.store_dir = store_dir
+        self.interval = interval
+        self._versions = {}
+
+    def poll(self, symbols) -> list:
+        events = []
+        for symbol in symbols:
+            version = crypto_service.data_version(self.store_dir, symbol, self.interval)
+            if version is None or version == self._versions.get(symbol):
+                continue
+            self._versions[symbol] = version
+            bars = ohlcv_store.load_bars(self.store_dir, symbol, self.interval)
+            if len(bars) == 0:
+                continue
+            closes = bars["adj_close"]
+            change_pct = float((closes[-1] / closes[-2] - 1) * 100) if len(bars) > 1 else None
+            events.append({"symbol": symbol, "price": float(closes[-1]), "change_pct": change_pct,
+                           "as_of": int(bars["timestamp"][-1])})
+        return events
+
+    def forget(self, symbol: str):
+        self._versions.pop(symbol, None)
+
+
+class AlertOutbox:
+    """Alert feed over the stream_alerts table, shared by every process using the app database."""
+
+    def __init__(self, app, batch_size: int = OUTBOX_BATCH_SIZE):
+        self.app = app
+        self.batch_size = batch_size
+        self._last_id = None # Streams only get alerts queued after they opened
+
+    @staticmethod
+    def publish(events, retention_seconds: float = STREAM_ALERT_RETENTION_SECONDS):
+        """Queue (user_identifier, event) pairs for the brokers of all processes (needs an app context)."""
+        from datetime import datetime, timedelta
+        from ..models import StreamAlert, db
+
+        now = datetime.utcnow()
+        db.session.query(StreamAlert).filter(StreamAlert.created_at < now - timedelta(seconds=retention_seconds)).delete(
+            synchronize_session=False)
+        rows = [{"user_identifier": user, "event_json": json.dumps(event), "created_at": now} for user, event in events]
+        if rows:
+            db.session.execute(StreamAlert.__table__.insert(), rows)
+        db.session.commit()
+
+    def poll(self, user_identifiers) -> list:
+        """Alerts queued since the last poll for `user_identifiers`, as [(user_identifier, event)]."""
+        from sqlalchemy import func
+        from ..models import StreamAlert, db
+
+        users = set(user_identifiers)
+        if not users:
+            self._last_id = None # Nobody is listening: start from the newest alert when someone is
+            return []
+        alerts = []
+        with self.app.app_context():
+            if self._last_id is None:
+                self._last_id = db.session.query(func.max(StreamAlert.id)).scalar() or 0
+                return alerts
+            while True:
+                rows = db.session.query(StreamAlert.id, StreamAlert.user_identifier, StreamAlert.event_json).filter(
+                    StreamAlert.id > self._last_id).order_by(StreamAlert.id).limit(self.batch_size).all()
+                if rows:
+                    self._last_id = rows[-1].id
+                alerts.extend((row.user_identifier, json.loads(row.event_json)) for row in rows if row.user_identifier in users)
+                if len(rows) < self.batch_size:
+                    return alerts
+
+
+class StreamBroker:
+    def __init__(self, feed=None, poll_seconds: float = DEFAULT_POLL_SECONDS,
+                 max_alerts: int = DEFAULT_MAX_ALERTS, max_connections: int = None, alert_feed=None):
+        self.feed = feed
+        self.alert_feed = alert_feed # poll(user_identifiers) -> [(user_identifier, event)], e.g. AlertOutbox
+        self.poll_seconds = poll_seconds
+        self.max_alerts = max_alerts
+        self.max_connections = max_connections
+        self.stats = {"connections": 0, "opened": 0, "rejected": 0, "prices_published": 0,
+                      "prices_delivered": 0, "alerts_published": 0, "upstream_polls": 0}
+        self._by_symbol = {} # symbol -> set of Subscriptions
+        self._by_user = {} # user_identifier -> set of Subscriptions
+        self._latest = {} # symbol -> last price event, sent to new connections right away
+        self._seq = itertools.count(1)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._poller = None
+
+    def open(self, symbols, user_identifier: str = None) -> Subscription:
+        symbols = [symbol.upper() for symbol in symbols]
+        subscription = Subscription(symbols, user_identifier, self.max_alerts)
+        with self._lock:
+            if self.max_connections is not None and self.stats["connections"] >= self.max_connections:
+                self.stats["rejected"] += 1
+                return None
+            new_listeners = False
+            for symbol in symbols:
+                listeners = self._by_symbol.get(symbol)
+                if listeners is None:
+                    listeners = self._by_symbol[symbol] = set()
+                    new_listeners = True
+                listeners.add(subscription)
+            if user_identifier:
+                listeners = self._by_user.get(user_identifier)
+                if listeners is None:
+                    listeners = self._by_user[user_identifier] = set()
+                    new_listeners = True
+                listeners.add(subscription)
+            self.stats["connections"] += 1
+            self.stats["opened"] += 1
+            latest = [self._latest[symbol] for symbol in symbols if symbol in self._latest]
+            if (self.feed is not None or self.alert_feed is not None) and self._poller is None:
+                self._poller = threading.Thread(target=self._poll_loop, name="live-stream-feed", daemon=True)
+                self._poller.start()
+        if latest:
+            subscription.offer_prices(latest)
+        if new_listeners:
+            self._wake.set() # Poll for the new symbols/user now instead of at the next tick
+        return subscription
+
+    def close(self, subscription: Subscription):
+        subscription.close()
+        with self._lock:
+            for symbol in subscription.symbols:
+                listeners = self._by_symbol.get(symbol)
+                if listeners is not None:
+                    listeners.discard(subscription)
+                    if not listeners:
+                        del self._by_symbol[symbol]
+                        self._latest.pop(symbol, None)
+                        if self.feed is not None and hasattr(self.feed, "forget"):
+                            self.feed.forget(symbol)
+            if subscription.user_identifier:
+                listeners = self._by_user.get(subscription.user_identifier)
+                if listeners is not None:
+                    listeners.discard(subscription)
+                    if not listeners:
+                        del self._by_user[subscription.user_identifier]
+            self.stats["connections"] -= 1
+
+    def watched_symbols(self) -> list:
+        with self._lock:
+            return list(self._by_symbol)
+
+    def listening_users(self) -> list:
+        with self._lock:
+            return list(self._by_user)
+
+    def publish_prices(self, events) -> int:
+        """Fan price events out to every connection watching their symbols. Returns the deliveries.
+
+        Events of one batch (e.g. one upstream poll) are grouped per connection, so each
+        connection is woken once per batch rather than once per symbol.
+        """
+        events = [dict(event, symbol=event["symbol"].upper(), seq=next(self._seq)) for event in events]
+        per_subscription = {}
+        with self._lock:
+            for event in events:
+                listeners = self._by_symbol.get(event["symbol"])
+                if not listeners:
+                    continue
+                self._latest[event["symbol"]] = event
+                for subscription in listeners:
+                    per_subscription.setdefault(subscription, []).append(event)
+            delivered = sum(len(batch) for batch in per_subscription.values())
+            self.stats["prices_published"] += len(events)
+            self.stats["prices_delivered"] += delivered
+        for subscription, batch in per_subscription.items():
+            subscription.offer_prices(batch)
+        return delivered
+
+    def publish_price(self, event: dict) -> int:
+        return self.publish_prices([event])
+
+    def publish_alert(self, user_identifier: str, event: dict) -> int:
+        with self._lock:
+            listeners = list(self._by_user.get(user_identifier, ()))
+            if listeners:
+                self.stats["alerts_published"] += 1
+        event = dict(event, seq=next(self._seq))
+        for subscription in listeners:
+            subscription.offer_alert(event)
+        return len(listeners)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            subscriptions = {s for listeners in self._by_symbol.values() for s in listeners}
+            subscriptions.update(s for listeners in self._by_user.values() for s in listeners)
+            stats = dict(self.stats, symbols=len(self._by_symbol))
+        stats["conflated"] = sum(s.stats["conflated"] for s in subscriptions)
+        stats["dropped"] = sum(s.stats["dropped"] for s in subscriptions)
+        return stats
+
+    def _poll_loop(self):
+        while True:
+            self._wake.wait(self.poll_seconds)
+            self._wake.clear()
+            try:
+                symbols = self.watched_symbols()
+                if symbols and self.feed is not None:
+                    events = self.feed.poll(symbols)
+                    self.stats["upstream_polls"] += 1
+                    if events:
+                        self.publish_prices(events)
+                if self.alert_feed is not None:
+                    for user_identifier, event in self.alert_feed.poll(self.listening_users()):
+                        self.publish_alert(user_identifier, event)
+            except Exception as e:
+                print(f"SERVICE: Live stream feed failed: {e}")
+                time.sleep(self.poll_seconds)
+
+
+_broker_lock = threading.Lock()
+
+
+def get_broker(app=None) -> StreamBroker:
+    """The app's broker (app.extensions["live_stream"]), created on first use."""
+    from flask import current_app
+    app = app or current_app._get_current_object()
+    broker = app.extensions.get("live_stream")
+    if broker is None:
+        with _broker_lock:
+            broker = app.extensions.get("live_stream")
+            if broker is None:
+                broker = app.extensions["live_stream"] = StreamBroker(
+                    feed=StoreFeed(app.config["OHLCV_STORE_DIR"]),
+                    poll_seconds=app.config.get("LIVE_STREAM_POLL_SECONDS", DEFAULT_POLL_SECONDS),
+                    max_alerts=app.config.get("LIVE_STREAM_MAX_ALERTS", DEFAULT_MAX_ALERTS),
+                    max_connections=app.config.get("LIVE_STREAM_MAX_CONNECTIONS"),
+                    alert_feed=AlertOutbox(app)
+                )
+    return broker
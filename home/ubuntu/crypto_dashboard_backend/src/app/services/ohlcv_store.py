@@ -0,0 +1,126 @@
+# app/services/ohlcv_store.py
+#
+# Local on-disk OHLCV bar store shared by the daily pipeline (writer) and the API (reader).
+#
+# Layout: <store_dir>/<interval>/<SYMBOL>.bars, one file per symbol and interval.
+# Each file is a flat array of fixed-size BAR_DTYPE records sorted by timestamp,
+# so the row count is file_size // BAR_DTYPE.itemsize and there is no header to keep in sync.
+# Writes only ever append (or rewrite the final, still-forming bar); reads memory-map
+# the file and return views, so loading a range does not copy the data.
+
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+BAR_DTYPE = np.dtype([
+    ("timestamp", "<i8"), # Unix epoch seconds, bar open time
+    ("open", "<f8"),
+    ("high", "<f8"),
+    ("low", "<f8"),
+    ("close", "<f8"),
+    ("adj_close", "<f8"),
+    ("volume", "<f8"), # float so missing volumes can be stored as NaN
+])
+
+_EMPTY = np.empty(0, dtype=BAR_DTYPE)
+
+# path -> (file size, memmap), least recently used first. Reused until the file grows or is
+# rewritten. Every map holds a file descriptor, so only MAX_OPEN_MAPS are kept: a map that is
+# evicted or goes stale is dropped, and its descriptor is closed as soon as the views handed
+# out from it are gone (callers copy or slice the few bars they need and let go of them).
+MAX_OPEN_MAPS = int(os.environ.get("OHLCV_STORE_MAX_OPEN_MAPS", "256"))
+_mmap_cache = OrderedDict()
+_mmap_lock = threading.Lock()
+
+
+def bar_path(store_dir: str, symbol: str, interval: str) -> str:
+    safe_symbol = re.sub(r"[^A-Z0-9._-]", "_", symbol.upper())
+    return os.path.join(store_dir, interval, f"{safe_symbol}.bars")
+
+
+def to_bars(columns) -> np.ndarray:
+    """Build a BAR_DTYPE array from any mapping of column name -> sequence (a DataFrame works)."""
+    timestamps = np.asarray(columns["timestamp"], dtype="<i8")
+    bars = np.empty(len(timestamps), dtype=BAR_DTYPE)
+    bars["timestamp"] = timestamps
+    for name in BAR_DTYPE.names[1:]:
+        bars[name] = np.asarray(columns[name], dtype="<f8")
+    return bars
+
+
+def _mapped(path: str) -> np.ndarray:
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return _EMPTY
+    rows = size // BAR_DTYPE.itemsize # Ignore a partially written trailing record
+    if rows == 0:
+        return _EMPTY
+    with _mmap_lock:
+        cached = _mmap_cache.get(path)
+        if cached is not None and cached[0] == size:
+            _mmap_cache.move_to_end(path)
+            return cached[1]
+        _mmap_cache.pop(path, None) # Stale: the file grew or was rewritten
+        bars = np.memmap(path, dtype=BAR_DTYPE, mode="r", shape=(rows,))
+        _mmap_cache[path] = (size, bars)
+        while len(_mmap_cache) > MAX_OPEN_MAPS:
+            _mmap_cache.popitem(last=False)
+        return bars
+
+
+def load_bars(store_dir: str, symbol: str, interval: str, start_ts: int = None, end_ts: int = None) -> np.ndarray:
+    """Return the stored bars with start_ts <= timestamp <= end_ts as a read-only view."""
+    bars = _mapped(bar_path(store_dir, symbol, interval))
+    if len(bars) == 0 or (start_ts is None and end_ts is None):
+        return bars
+    timestamps = bars["timestamp"]
+    lo = 0 if start_ts is None else int(np.searchsorted(timestamps, start_ts, side="left"))
+    hi = len(bars) if end_ts is None else int(np.searchsorted(timestamps, end_ts, side="right"))
+    return bars[lo:hi]
+
+
+def last_timestamp(store_dir: str, symbol: str, interval: str):
+    """Timestamp of the newest stored bar, or None when nothing is stored yet."""
+    bars = _mapped(bar_path(store_dir, symbol, interval))
+    return int(bars["timestamp"][-1]) if len(bars) else None
+
+
+def append_bars(store_dir: str, symbol: str, interval: str, bars: np.ndarray) -> int:
+    """Append bars newer than the stored ones and return how many rows were written.
+
+    A bar carrying the same timestamp as the stored last bar replaces it in place,
+    since the most recent bar is still forming when the pipeline runs.
+    """
+    path = bar_path(store_dir, symbol, interval)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if os.path.exists(path) and os.path.getsize(path) % BAR_DTYPE.itemsize:
+        # A previous writer died mid-record; cut the torn tail so new rows stay aligned
+        with open(path, "r+b") as f:
+            f.truncate(os.path.getsize(path) // BAR_DTYPE.itemsize * BAR_DTYPE.itemsize)
+    bars = np.sort(np.asarray(bars, dtype=BAR_DTYPE), order="timestamp", kind="stable")
+    last_ts = last_timestamp(store_dir, symbol, interval)
+    written = 0
+    if last_ts is not None:
+        same = bars[bars["timestamp"] == last_ts]
+        if len(same):
+            rows = os.path.getsize(path) // BAR_DTYPE.itemsize
+            with open(path, "r+b") as f:
+                f.seek((rows - 1) * BAR_DTYPE.itemsize)
+                f.write(same[-1:].tobytes())
+            written += 1
+        bars = bars[bars["timestamp"] > last_ts]
+    if len(bars):
+        # Drop duplicate timestamps within the batch, keeping the latest one
+        keep = np.append(bars["timestamp"][1:] != bars["timestamp"][:-1], True)
+        bars = bars[keep]
+        with open(path, "ab") as f:
+            f.write(bars.tobytes())
+        written += len(bars)
+    if written:
+        with _mmap_lock:
+            _mmap_cache.pop(path, None)
+    return written
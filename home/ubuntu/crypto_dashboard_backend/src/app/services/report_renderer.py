@@ -0,0 +1,153 @@
+# app/services/report_renderer.py
+#
+# Markdown -> PDF rendering for the daily reports, shared by the pipeline (eager mode)
+# and /api/reports/download (deferred mode, first request renders the PDF).
+#
+# The report is split into its header and one section per "## " heading. Each section is
+# converted with a single markdown2 pass and rendered by WeasyPrint on its own, against a
+# stylesheet that is parsed once per process. Rendered sections are cached on disk keyed
+# by a hash of their HTML, the stylesheet and the plot images they embed, so a run where
+# one symbol changed only re-renders that symbol. The cached section PDFs are then merged
+# into the final report with pypdf.
+
+import hashlib
+import os
+import re
+import threading
+import time
+
+REPORT_CSS = """
+    @page { size: A4; margin: 2cm; }
+    body { font-family: sans-serif; direction: rtl; text-align: right; }
+    h1, h2, h3 { color: #333; }
+    table { border-collapse: collapse; width: 100%; margin-bottom: 1em; }
+    th, td { border: 1px solid #ddd; padding: 8px; text-align: left; }
+    th { background-color: #f2f2f2; }
+    img { max-width: 100%; height: auto; display: block; margin-left: auto; margin-right: auto; margin-bottom:1em; }
+"""
+MARKDOWN_EXTRAS = ["tables", "fenced-code-blocks"]
+SECTION_CACHE_DIRNAME = ".pdf_sections"
+SECTION_CACHE_MAX_AGE_DAYS = 30
+
+_IMAGE_RE = re.compile(r"!\[([^\]]+)\]\(([^)]+)\)")
+
+_stylesheet = None
+_stylesheet_lock = threading.Lock()
+# pdf path -> lock, so concurrent downloads of a deferred report render it once
+_render_locks = {}
+_render_locks_guard = threading.Lock()
+
+
+def stylesheet():
+    """The report CSS, parsed by WeasyPrint once per process."""
+    global _stylesheet
+    if _stylesheet is None:
+        with _stylesheet_lock:
+            if _stylesheet is None:
+                from weasyprint import CSS
+                _stylesheet = CSS(string=REPORT_CSS)
+    return _stylesheet
+
+
+def split_sections(markdown_text: str) -> list:
+    """Split a report into its header and one chunk per "## " section."""
+    return [part for part in re.split(r"(?m)^(?=## )", markdown_text) if part.strip()]
+
+
+def section_html(section_md: str, plots_dir: str):
+    """Convert one markdown section to HTML. Returns (html, absolute image paths)."""
+    import markdown2
+
+    images = []
+
+    def replace_plot_path(match):
+        # Plot paths in the markdown are basenames; WeasyPrint needs absolute file paths
+        abs_img_path = os.path.join(plots_dir, match.group(2))
+        images.append(abs_img_path)
+        return f'<img src="file://{abs_img_path}" alt="{match.group(1)}" style="max-width:100%; height:auto;" />'
+
+    html = markdown2.markdown(_IMAGE_RE.sub(replace_plot_path, section_md), extras=MARKDOWN_EXTRAS)
+    return html, images
+
+
+def section_key(html: str, images) -> str:
+    digest = hashlib.sha256()
+    digest.update(REPORT_CSS.encode())
+    digest.update(html.encode())
+    for path in images:
+        # Plots are rewritten in place under the same name, so their stat is part of the key
+        try:
+            stat = os.stat(path)
+            digest.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+        except OSError:
+            digest.update(f"{path}:missing".encode())
+    return digest.hexdigest()
+
+
+def render_section(html: str, images, cache_dir: str, base_url: str) -> str:
+    """Render one section to a cached PDF and return its path."""
+    path = os.path.join(cache_dir, f"{section_key(html, images)}.pdf")
+    if os.path.exists(path):
+        os.utime(path) # Mark as recently used for pruning
+        return path
+    from weasyprint import HTML
+
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    HTML(string=html, base_url=base_url).write_pdf(tmp_path, stylesheets=[stylesheet()])
+    os.replace(tmp_path, path)
+    return path
+
+
+def prune_section_cache(cache_dir: str, max_age_days: int = SECTION_CACHE_MAX_AGE_DAYS):
+    cutoff = time.time() - max_age_days * 86400
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+def render_report_pdf(markdown_text: str, pdf_path: str, plots_dir: str, base_url: str, cache_dir: str = None) -> str:
+    """Render a markdown report to `pdf_path`, reusing cached section PDFs where possible."""
+    cache_dir = cache_dir or os.path.join(os.path.dirname(pdf_path), SECTION_CACHE_DIRNAME)
+    os.makedirs(cache_dir, exist_ok=True)
+    sections = [section_html(section, plots_dir) for section in split_sections(markdown_text)]
+    tmp_path = f"{pdf_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+    try:
+        from pypdf import PdfWriter
+    except ImportError:
+        # Without pypdf the sections cannot be merged; render the report in one go
+        from weasyprint import HTML
+        html = "\n".join(html for html, _ in sections)
+        HTML(string=html, base_url=base_url).write_pdf(tmp_path, stylesheets=[stylesheet()])
+    else:
+        writer = PdfWriter()
+        for html, images in sections:
+            writer.append(render_section(html, images, cache_dir, base_url))
+        with open(tmp_path, "wb") as f:
+            writer.write(f)
+        prune_section_cache(cache_dir)
+    os.replace(tmp_path, pdf_path)
+    return pdf_path
+
+
+def ensure_report_pdf(md_path: str, pdf_path: str, plots_dir: str, base_url: str, cache_dir: str = None):
+    """Render `pdf_path` from `md_path` if it is missing or older than the markdown.
+
+    Used for deferred PDF generation. Returns the PDF path, or None if there is no markdown.
+    """
+    with _render_locks_guard:
+        lock = _render_locks.setdefault(pdf_path, threading.Lock())
+    with lock:
+        try:
+            md_mtime = os.path.getmtime(md_path)
+        except OSError:
+            return pdf_path if os.path.exists(pdf_path) else None
+        if os.path.exists(pdf_path) and os.path.getmtime(pdf_path) >= md_mtime:
+            return pdf_path
+        with open(md_path, encoding="utf-8") as f:
+            markdown_text = f.read()
+        return render_report_pdf(markdown_text, pdf_path, plots_dir, base_url, cache_dir)
@@ -0,0 +1,222 @@
+# app/services/report_service.py
+#
+# In-memory index of the daily report archive, backing /api/reports/archive and
+# /api/reports/latest.
+#
+# The index is built from the `Report` table (one row per symbol per report date) and
+# holds one entry per report date. Report dates are kept in a sorted list, plus one
+# sorted list per symbol, so date-ranged and per-symbol queries are a bisect plus a
+# slice and the latest report is simply the last element.
+#
+# The pipeline calls record_report() after writing a report. That upserts the rows and
+# touches a marker file in the archive directory; API workers notice the marker's mtime
+# change and fold only the rows written since their last refresh into the index.
+
+import bisect
+import hashlib
+import os
+import re
+import threading
+import time
+from datetime import date, datetime
+
+INDEX_MARKER_FILENAME = ".report_index"
+INDEX_CHECK_INTERVAL_SECONDS = 1.0 # How often a worker stats the marker file
+REPORT_FILENAME_RE = re.compile(r"daily_crypto_report_(\d{4}-\d{2}-\d{2})\.(md|pdf)$")
+
+_lock = threading.Lock()
+# Readers take local references to these; the refresh path builds new objects and swaps them in
+_dates = [] # Report dates (ISO strings), oldest first
+_reports = {} # Report date -> entry dict
+_symbol_dates = {} # Symbol -> report dates containing it, oldest first
+_loaded = False
+_last_seen = None # Newest Report.created_at folded into the index
+_marker_mtime = None
+_last_check = 0.0
+
+ETAG_CHUNK_SIZE = 1024 * 1024
+# path -> ((size, mtime_ns), sha256 hex) so archived files are hashed once, not per download
+_etag_cache = {}
+_etag_lock = threading.Lock()
+
+
+def _marker_path() -> str:
+    from flask import current_app
+
+    return os.path.join(current_app.config["REPORTS_ARCHIVE_DIR"], INDEX_MARKER_FILENAME)
+
+
+def _build_entry(report_date: str, rows) -> dict:
+    return {
+        "report_id": report_date,
+        "report_date": report_date,
+        "symbols": sorted(row.crypto_symbol for row in rows),
+        "formats": [fmt for fmt, attr in (("pdf", "pdf_file_path"), ("md", "md_file_path"))
+                    if any(getattr(row, attr) for row in rows)],
+        "summaries": {
+            row.crypto_symbol: {"analysis": row.analysis_summary, "prediction": row.prediction_summary}
+            for row in rows
+        },
+    }
+
+
+def _apply(rows_by_date: dict):
+    # Replace the index entries for the given dates with ones built from `rows_by_date`
+    global _dates, _reports, _symbol_dates
+    reports = dict(_reports)
+    symbol_dates = {symbol: list(dates) for symbol, dates in _symbol_dates.items()}
+    for report_date, rows in rows_by_date.items():
+        old = reports.get(report_date)
+        if old is not None:
+            for symbol in old["symbols"]:
+                symbol_dates[symbol].remove(report_date)
+        entry = _build_entry(report_date, rows)
+        reports[report_date] = entry
+        for symbol in entry["symbols"]:
+            bisect.insort(symbol_dates.setdefault(symbol, []), report_date)
+    # Publish the entries before the date lists that point at them
+    _reports = reports
+    _symbol_dates = {symbol: dates for symbol, dates in symbol_dates.items() if dates}
+    _dates = sorted(reports)
+
+
+def _rows_by_date(rows) -> dict:
+    grouped = {}
+    for row in rows:
+        grouped.setdefault(row.report_date.isoformat(), []).append(row)
+    return grouped
+
+
+def _load_rows(since=None) -> list:
+    from ..models import Report, db
+
+    if since is None:
+        return Report.query.all()
+    # Reload every row of each date touched since the last refresh, so re-runs that
+    # drop a symbol are reflected too
+    changed_dates = [d for (d,) in db.session.query(Report.report_date).filter(Report.created_at > since).distinct()]
+    if not changed_dates:
+        return []
+    return Report.query.filter(Report.report_date.in_(changed_dates)).all()
+
+
+def backfill_from_archive(archive_dir: str) -> int:
+    """Create Report rows for archived report files that predate the index. Returns rows added."""
+    from ..models import Report, db
+
+    found = {}
+    for name in sorted(os.listdir(archive_dir)) if os.path.isdir(archive_dir) else []:
+        match = REPORT_FILENAME_RE.match(name)
+        if match:
+            found.setdefault(match.group(1), {})[match.group(2)] = os.path.join(archive_dir, name)
+    added = 0
+    for report_date, paths in found.items():
+        symbols = []
+        if "md" in paths:
+            with open(paths["md"], encoding="utf-8") as f:
+                symbols = [line[3:].split()[0] for line in f if line.startswith("## ") and line[3:].strip()]
+        for symbol in symbols or ["ALL"]:
+            db.session.add(Report(
+                report_date=date.fromisoformat(report_date), crypto_symbol=symbol,
+                md_file_path=paths.get("md"), pdf_file_path=paths.get("pdf")
+            ))
+            added += 1
+    db.session.commit()
+    return added
+
+
+def refresh_index(force: bool = False):
+    """Bring the index up to date with the Report table (cheap when nothing changed)."""
+    global _loaded, _last_seen, _marker_mtime, _last_check
+    from flask import current_app
+
+    from ..models import Report, db
+
+    now = time.monotonic()
+    if _loaded and not force and now - _last_check < INDEX_CHECK_INTERVAL_SECONDS:
+        return
+    with _lock:
+        _last_check = now
+        try:
+            marker_mtime = os.path.getmtime(_marker_path())
+        except OSError:
+            marker_mtime = None
+        if _loaded and not force and marker_mtime == _marker_mtime:
+            return
+        if not _loaded and db.session.query(Report.id).first() is None:
+            added = backfill_from_archive(current_app.config["REPORTS_ARCHIVE_DIR"])
+            if added:
+                print(f"SERVICE: Backfilled {added} report rows from the archive directory")
+        rows = _load_rows(None if (force or not _loaded) else _last_seen)
+        if rows:
+            _apply(_rows_by_date(rows))
+            newest = max(row.created_at for row in rows if row.created_at is not None)
+            _last_seen = max(newest, _last_seen) if _last_seen else newest
+        _loaded = True
+        _marker_mtime = marker_mtime
+
+
+def record_report(report_date: str, symbol_summaries: dict, md_file_path: str, pdf_file_path: str):
+    """Upsert the Report rows for one daily report and signal index refreshes.
+
+    `symbol_summaries` maps symbol -> (analysis_summary, prediction_summary).
+    """
+    global _last_check
+    from ..models import Report, db
+
+    day = date.fromisoformat(report_date)
+    Report.query.filter_by(report_date=day).delete()
+    written_at = datetime.utcnow()
+    for symbol, (analysis_summary, prediction_summary) in symbol_summaries.items():
+        db.session.add(Report(
+            report_date=day, crypto_symbol=symbol, analysis_summary=analysis_summary,
+            prediction_summary=prediction_summary, md_file_path=md_file_path,
+            pdf_file_path=pdf_file_path, created_at=written_at
+        ))
+    db.session.commit()
+    marker = _marker_path()
+    os.makedirs(os.path.dirname(marker), exist_ok=True)
+    with open(marker, "a"):
+        pass
+    os.utime(marker)
+    _last_check = 0.0 # Skip the throttle so this process sees its own write immediately
+    refresh_index()
+
+
+def get_latest_report():
+    """The newest report entry, or None when the archive is empty."""
+    refresh_index()
+    dates = _dates
+    return _reports[dates[-1]] if dates else None
+
+
+def get_archive_list(page: int = 1, per_page: int = 20, start_date: str = None, end_date: str = None,
+                     symbol: str = None) -> dict:
+    """One page of report entries, newest first, optionally limited to a date range and symbol."""
+    refresh_index()
+    dates = _symbol_dates.get(symbol.upper(), []) if symbol else _dates
+    reports = _reports
+    lo = bisect.bisect_left(dates, start_date) if start_date else 0
+    hi = bisect.bisect_right(dates, end_date) if end_date else len(dates)
+    total = max(0, hi - lo)
+    page_end = hi - (page - 1) * per_page
+    page_start = max(lo, page_end - per_page)
+    items = [reports[d] for d in reversed(dates[page_start:page_end])] if page_end > lo else []
+    return {"reports": items, "total": total, "page": page, "per_page": per_page}
+
+
+def file_etag(path: str) -> str:
+    """Strong ETag for a report file: the SHA-256 of its content, cached per (size, mtime)."""
+    stat = os.stat(path)
+    version = (stat.st_size, stat.st_mtime_ns)
+    cached = _etag_cache.get(path)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(ETAG_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    etag = digest.hexdigest()
+    with _etag_lock:
+        _etag_cache[path] = (version, etag)
+    return etag
@@ -0,0 +1,106 @@
+# app/services/response_cache.py
+#
+# In-process TTL + LRU cache for the /api/crypto/* responses.
+#
+# Entries are keyed on (endpoint, symbol, range) and carry a data version - for the crypto
+# endpoints, the (size, mtime) of the symbol's OHLCV store file. When the pipeline appends
+# bars for a symbol the version changes, so that symbol's entries are recomputed on the next
+# request while everything else stays cached. Concurrent misses for the same key and
+# version are collapsed into one computation (single-flight): the first caller computes, the
+# others wait for its result. A caller asking for a newer version, or arriving after
+# invalidate(), never joins a computation started for older data.
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+        self.stale = False # Set by invalidate(): the result is still returned but not cached
+
+
+class ResponseCache:
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 300.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict() # key -> (expires_at, version, value), least recently used first
+        self._in_flight = {} # (key, version) -> _Flight
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0, "invalidations": 0}
+
+    def get_or_compute(self, key, compute, version=None):
+        """Return the cached value for `key`, or compute it once for all concurrent callers."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, entry_version, value = entry
+                if expires_at > time.monotonic() and entry_version == version:
+                    self._entries.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return value
+                del self._entries[key]
+                if entry_version != version:
+                    self.stats["invalidations"] += 1
+            flight_key = (key, version)
+            flight = self._in_flight.get(flight_key)
+            leader = flight is None
+            if leader:
+                flight = self._in_flight[flight_key] = _Flight()
+                self.stats["misses"] += 1
+            else:
+                self.stats["coalesced"] += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = compute()
+        except BaseException as e:
+            flight.error = e # Errors are shared with waiters but never cached
+            raise
+        else:
+            with self._lock:
+                if not flight.stale:
+                    self._entries[key] = (time.monotonic() + self.ttl_seconds, version, flight.value)
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+                        self.stats["evictions"] += 1
+            return flight.value
+        finally:
+            with self._lock:
+                if self._in_flight.get(flight_key) is flight: # invalidate() may have detached it
+                    del self._in_flight[flight_key]
+            flight.done.set()
+
+    def invalidate(self, symbol: str = None) -> int:
+        """Drop every entry (or only those for `symbol`, keys being (endpoint, symbol, ...)).
+
+        Computations already running for them finish for their current callers, but their
+        results are not cached and later callers start a new computation.
+        """
+        def matches(key):
+            return symbol is None or (len(key) > 1 and key[1] == symbol)
+
+        with self._lock:
+            keys = [key for key in self._entries if matches(key)]
+            for key in keys:
+                del self._entries[key]
+            for flight_key in [flight_key for flight_key in self._in_flight if matches(flight_key[0])]:
+                self._in_flight.pop(flight_key).stale = True
+            self.stats["invalidations"] += len(keys)
+            return len(keys)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"] + self.stats["coalesced"]
+            return dict(self.stats, entries=len(self._entries), max_entries=self.max_entries,
+                        ttl_seconds=self.ttl_seconds,
+                        hit_ratio=round(self.stats["hits"] / lookups, 4) if lookups else None)
@@ -0,0 +1,83 @@
+# app/services/user_service.py
+#
+# Followed cryptos, stored one row per (user, symbol) in the followed_cryptos table.
+# Follows and unfollows are bulk statements against its unique index, so following 50
+# symbols is one INSERT rather than 50 read-modify-writes of a comma-separated string.
+
+FOLLOW_CHUNK_SIZE = 300 # Rows per multi-row INSERT / IN (...)
+
+
+def _chunks(values, size: int = FOLLOW_CHUNK_SIZE):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def _normalize(symbols) -> list:
+    return list(dict.fromkeys(symbol.strip().upper() for symbol in symbols if symbol and symbol.strip()))
+
+
+def ensure_user(user_identifier: str):
+    from ..models import UserPreference, db, dialect_insert
+
+    db.session.execute(dialect_insert(UserPreference).values(user_identifier=user_identifier)
+                       .on_conflict_do_nothing(index_elements=["user_identifier"]))
+
+
+def follow_cryptos(user_identifier: str, symbols, commit: bool = True) -> int:
+    """Follow `symbols` (already followed ones are ignored). Returns the number of symbols given."""
+    from ..models import FollowedCrypto, db, dialect_insert
+
+    symbols = _normalize(symbols)
+    if not symbols:
+        return 0
+    ensure_user(user_identifier)
+    for chunk in _chunks(symbols):
+        db.session.execute(dialect_insert(FollowedCrypto).values(
+            [{"user_identifier": user_identifier, "crypto_symbol": symbol} for symbol in chunk]
+        ).on_conflict_do_nothing(index_elements=["user_identifier", "crypto_symbol"]))
+    if commit:
+        db.session.commit()
+    return len(symbols)
+
+
+def unfollow_cryptos(user_identifier: str, symbols) -> int:
+    """Stop following `symbols`. Returns the number of follows removed."""
+    from ..models import FollowedCrypto, db
+
+    removed = 0
+    for chunk in _chunks(_normalize(symbols)):
+        removed += db.session.query(FollowedCrypto).filter(
+            FollowedCrypto.user_identifier == user_identifier,
+            FollowedCrypto.crypto_symbol.in_(chunk)
+        ).delete(synchronize_session=False)
+    db.session.commit()
+    return removed
+
+
+def get_followed_cryptos(user_identifier: str) -> list:
+    from ..models import FollowedCrypto, db
+
+    rows = db.session.query(FollowedCrypto.crypto_symbol).filter(
+        FollowedCrypto.user_identifier == user_identifier).order_by(FollowedCrypto.crypto_symbol)
+    return [symbol for symbol, in rows]
+
+
+def migrate_followed_cryptos() -> int:
+    """Copy the legacy comma-separated UserPreference.followed_cryptos into followed_cryptos.
+
+    Safe to run repeatedly; the legacy column is cleared once its follows are copied.
+    Returns the number of users migrated.
+    """
+    from ..models import UserPreference, db
+
+    rows = db.session.query(UserPreference.id, UserPreference.user_identifier, UserPreference.followed_cryptos).filter(
+        UserPreference.followed_cryptos.isnot(None), UserPreference.followed_cryptos != "").all()
+    for _, user_identifier, followed in rows:
+        follow_cryptos(user_identifier, followed.split(","), commit=False)
+    for chunk in _chunks([row_id for row_id, _, _ in rows]):
+        db.session.query(UserPreference).filter(UserPreference.id.in_(chunk)).update(
+            {UserPreference.followed_cryptos: None}, synchronize_session=False)
+    db.session.commit()
+    if rows:
+        print(f"SERVICE: Migrated followed cryptos of {len(rows)} users")
+    return len(rows)
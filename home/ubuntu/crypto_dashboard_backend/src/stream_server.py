@@ -0,0 +1,33 @@
+# Runs the same create_app() app as main.py, but under gevent so that long-lived
+# /api/stream connections are cheap greenlets instead of one OS thread each.
+#
+#   python stream_server.py [--host 0.0.0.0] [--port 5000]
+#
+# With gunicorn the equivalent is: gunicorn -k gevent -w 4 "main:app"
+# Without gevent installed this falls back to Werkzeug's threaded server (fine for a few
+# hundred streams in development, not for thousands).
+import argparse
+
+try:
+    from gevent import monkey
+    monkey.patch_all() # Must run before anything imports threading/socket
+    from gevent.pywsgi import WSGIServer
+except ImportError:
+    WSGIServer = None
+
+from app import create_app
+
+app = create_app()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve the API with an async (gevent) server")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5000)
+    args = parser.parse_args()
+
+    if WSGIServer is not None:
+        print(f"Serving on http://{args.host}:{args.port} (gevent)")
+        WSGIServer((args.host, args.port), app).serve_forever()
+    else:
+        print("gevent is not installed; falling back to the threaded development server")
+        app.run(host=args.host, port=args.port, threaded=True)
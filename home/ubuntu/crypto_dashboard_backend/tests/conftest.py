@@ -0,0 +1,27 @@
+# Test setup: the app, pipeline and benchmark helpers are plain directories rather than
+# installed packages, so put them on sys.path the way the scripts do.
+import os
+import sys
+
+import pytest
+
+PROJECT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+for path in ("src", "scripts", "benchmarks"):
+    sys.path.insert(0, os.path.join(PROJECT_DIR, path))
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """The Flask app on a temporary SQLite database, OHLCV store and report archive."""
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'app.sqlite'}")
+    monkeypatch.setenv("OHLCV_STORE_DIR", str(tmp_path / "ohlcv"))
+    monkeypatch.setenv("REPORTS_ARCHIVE_DIR", str(tmp_path / "reports_archive"))
+    from app import create_app
+    app = create_app()
+    with app.app_context():
+        yield app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
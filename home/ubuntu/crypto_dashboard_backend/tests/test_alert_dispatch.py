@@ -0,0 +1,173 @@
+# Alert delivery: the dispatcher's retries, dead letters, coalescing and backpressure, and
+# check_and_send_alerts end to end on a temporary SQLite database.
+import threading
+
+import pytest
+
+from app.services import alert_dispatch
+from app.services.alert_dispatch import AlertDispatcher, AlertEvent, DispatchBackpressure, LocalSink
+
+
+@pytest.fixture
+def make_dispatcher():
+    dispatchers = []
+
+    def make(**kwargs):
+        kwargs.setdefault("backoff", 0)
+        kwargs.setdefault("coalesce_window", 0)
+        dispatcher = AlertDispatcher(**kwargs)
+        dispatchers.append(dispatcher)
+        return dispatcher
+
+    yield make
+    for dispatcher in dispatchers:
+        dispatcher.close()
+
+
+def event(sub_id, user="u1", symbol="BTC-USD", channel="email"):
+    return AlertEvent(sub_id, user, symbol, "price_exceeds_1", 100.0, channel)
+
+
+def test_failed_batches_are_retried(make_dispatcher):
+    sink = LocalSink(fail_times=2)
+    written = []
+    dispatcher = make_dispatcher(default_sink=sink, max_retries=3, write_back=lambda ids, at: written.extend(ids))
+    dispatcher.submit(event(1))
+    assert dispatcher.drain(timeout=5)
+    assert dispatcher.stats["retries"] == 2
+    assert dispatcher.stats["notifications_sent"] == 1
+    assert not dispatcher.dead_letters
+    assert written == [1]
+
+
+def test_batches_failing_every_retry_are_dead_lettered(make_dispatcher):
+    written = []
+    dispatcher = make_dispatcher(default_sink=LocalSink(fail_times=100), max_retries=2,
+                                 write_back=lambda ids, at: written.extend(ids))
+    dispatcher.submit(event(1))
+    dispatcher.submit(event(2, user="u2"))
+    assert dispatcher.drain(timeout=5)
+    assert dispatcher.stats["retries"] == 2
+    assert dispatcher.stats["failed_notifications"] == 2
+    assert sorted(n.user_identifier for n in dispatcher.dead_letters) == ["u1", "u2"]
+    assert written == [] # Undelivered alerts keep their cooldown open
+
+
+def test_alerts_for_one_user_are_coalesced(make_dispatcher):
+    sink = LocalSink()
+    written = []
+    dispatcher = make_dispatcher(default_sink=sink, coalesce_window=60, write_back=lambda ids, at: written.extend(ids))
+    for sub_id in (3, 1, 2):
+        dispatcher.submit(event(sub_id, symbol=f"SYM{sub_id}-USD"))
+    dispatcher.submit(event(4, user="u2"))
+    assert dispatcher.drain(timeout=5) # Flushes without waiting for the coalesce window
+    by_user = {n.user_identifier: n for n in sink.notifications}
+    assert by_user["u1"].subscription_ids == [3, 1, 2]
+    assert by_user["u2"].subscription_ids == [4]
+    assert dispatcher.stats["coalesced"] == 2
+    assert written == [1, 2, 3, 4]
+
+
+def test_channels_use_their_own_sinks(make_dispatcher):
+    email, telegram = LocalSink(), LocalSink()
+    dispatcher = make_dispatcher(sinks={"email": email, "telegram": telegram})
+    dispatcher.submit(event(1, channel="email"))
+    dispatcher.submit(event(1, channel="telegram"))
+    assert dispatcher.drain(timeout=5)
+    assert [channel for channel, _ in email.batches] == ["email"]
+    assert [channel for channel, _ in telegram.batches] == ["telegram"]
+
+
+def test_full_queue_raises_backpressure(make_dispatcher):
+    entered, release = threading.Event(), threading.Event()
+
+    class BlockingSink:
+        def send_batch(self, channel, notifications):
+            entered.set()
+            release.wait(5)
+
+    dispatcher = make_dispatcher(default_sink=BlockingSink(), max_queue=1)
+    dispatcher.submit(event(1))
+    assert entered.wait(5) # The dispatcher thread is stuck delivering the first alert
+    dispatcher.submit(event(2)) # Fills the queue
+    with pytest.raises(DispatchBackpressure):
+        dispatcher.submit(event(3), timeout=0.05)
+    release.set()
+    assert dispatcher.drain(timeout=5)
+    assert dispatcher.stats["submitted"] == 2
+
+
+def test_check_and_send_alerts_delivers_and_records(app):
+    from app.models import AlertSubscription, StreamAlert, db
+    from app.services import alert_service, live_stream
+
+    for user, symbol, condition in [("u1", "BTC-USD", "price_exceeds_100"), ("u1", "ETH-USD", "price_drops_below_10"),
+                                    ("u2", "BTC-USD", "price_increase_5_percent"), ("u3", "BTC-USD", "price_exceeds_500")]:
+        assert alert_service.subscribe_to_alerts(user, symbol, condition)["status"] == "success"
+    outbox = live_stream.AlertOutbox(app)
+    assert outbox.poll(["u1"]) == [] # Starts after the newest queued alert
+
+    sink = LocalSink()
+    dispatcher = AlertDispatcher(default_sink=sink, coalesce_window=0, backoff=0,
+                                 write_back=lambda ids, at: alert_service.bulk_mark_alerts_sent(app, ids, at))
+    try:
+        market_data = {"BTC-USD": (200.0, 6.0), "ETH-USD": (50.0, -1.0)}
+        triggered = alert_service.check_and_send_alerts(market_data, dispatcher=dispatcher, wait=True)
+        assert len(triggered) == 2
+        assert sorted(n.user_identifier for n in sink.notifications) == ["u1", "u2"]
+        db.session.expire_all()
+        sent = {row.user_identifier for row in AlertSubscription.query.filter(AlertSubscription.last_alert_sent_at.isnot(None))}
+        assert sent == {"u1", "u2"}
+        assert StreamAlert.query.count() == 2
+        assert [(user, event["crypto_symbol"]) for user, event in outbox.poll(["u1", "u3"])] == [("u1", "BTC-USD")]
+
+        # Within the cooldown nothing is sent again
+        assert alert_service.check_and_send_alerts(market_data, dispatcher=dispatcher, wait=True) == []
+    finally:
+        dispatcher.close()
+
+
+def test_get_dispatcher_creates_one_dispatcher(app, monkeypatch):
+    from app.services import alert_service
+
+    monkeypatch.setattr(alert_service, "_dispatcher", None)
+    created = []
+    monkeypatch.setattr(alert_dispatch, "AlertDispatcher", lambda **kwargs: created.append(kwargs) or object())
+    threads = [threading.Thread(target=alert_service.get_dispatcher, args=(app,)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(created) == 1
+
+
+def test_backpressure_defers_the_remaining_alerts(app, capsys):
+    from app.models import StreamAlert
+    from app.services import alert_service
+
+    for user in ("u1", "u2", "u3"):
+        alert_service.subscribe_to_alerts(user, "BTC-USD", "price_exceeds_100")
+
+    class SaturatedDispatcher:
+        def __init__(self, capacity):
+            self.capacity = capacity
+            self.events = []
+
+        def submit(self, event, timeout=5.0):
+            if len(self.events) == self.capacity:
+                raise DispatchBackpressure("alert queue full")
+            self.events.append(event)
+
+        def drain(self, timeout=None):
+            return True
+
+    dispatcher = SaturatedDispatcher(capacity=1)
+    queued = alert_service.check_and_send_alerts({"BTC-USD": (200.0, 0.0)}, dispatcher=dispatcher, wait=True)
+    assert queued == [event.subscription_id for event in dispatcher.events]
+    assert len(queued) == 1
+    assert StreamAlert.query.count() == 1 # Only queued alerts are streamed
+    assert "Deferred 2 of 3 triggered alerts" in capsys.readouterr().out
+
+    # Nothing was marked as sent, so all three are due again on the next check
+    dispatcher = SaturatedDispatcher(capacity=10)
+    assert len(alert_service.check_and_send_alerts({"BTC-USD": (200.0, 0.0)}, dispatcher=dispatcher)) == 3
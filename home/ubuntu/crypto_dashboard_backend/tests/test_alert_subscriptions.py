@@ -0,0 +1,110 @@
+# Alert subscription writes and reads: bulk upsert/deactivate, keyset pagination, and the
+# duplicate merge ensure_indexes runs before creating the unique index on legacy databases.
+import sqlite3
+
+from app.models import AlertSubscription, db
+from app.services import alert_service
+
+
+def active_keys(user):
+    rows = db.session.query(AlertSubscription.crypto_symbol, AlertSubscription.alert_condition).filter_by(
+        user_identifier=user, is_active=True)
+    return sorted(rows)
+
+
+def test_bulk_upsert_normalizes_and_deduplicates(app):
+    written = alert_service.bulk_upsert_subscriptions([
+        ("u1", "btc-usd", "PRICE_EXCEEDS_100"),
+        ("u1", " BTC-USD ", "price_exceeds_100"), # Same key once normalized
+        ("u1", "eth-usd", "price_below_5"),
+        ("u2", "BTC-USD", "price_exceeds_100"),
+    ])
+    assert written == 3
+    assert AlertSubscription.query.count() == 3
+    assert active_keys("u1") == [("BTC-USD", "price_exceeds_100"), ("ETH-USD", "price_below_5")]
+    assert alert_service.bulk_upsert_subscriptions([]) == 0
+
+
+def test_bulk_deactivate_keeps_rows_and_upsert_reactivates_them(app):
+    alert_service.bulk_upsert_subscriptions([("u1", "BTC-USD", "price_exceeds_100"), ("u1", "ETH-USD", "price_below_5")])
+    row = AlertSubscription.query.filter_by(crypto_symbol="BTC-USD").one()
+    row_id = row.id
+    row.last_alert_sent_at = row.created_at
+    db.session.commit()
+
+    assert alert_service.bulk_deactivate_subscriptions([("u1", "btc-usd", "PRICE_EXCEEDS_100"),
+                                                        ("u1", "SOL-USD", "price_exceeds_1")]) == 1
+    assert alert_service.bulk_deactivate_subscriptions([("u1", "BTC-USD", "price_exceeds_100")]) == 0 # Already inactive
+    assert active_keys("u1") == [("ETH-USD", "price_below_5")]
+
+    alert_service.bulk_upsert_subscriptions([("u1", "BTC-USD", "price_exceeds_100")])
+    db.session.expire_all()
+    row = AlertSubscription.query.filter_by(crypto_symbol="BTC-USD").one()
+    assert (row.id, row.is_active) == (row_id, True)
+    assert row.last_alert_sent_at is not None # History survives the round trip
+
+
+def test_keyset_pagination_walks_every_subscription_once(app):
+    alert_service.bulk_upsert_subscriptions([("u1", f"SYM{i:02d}", "price_exceeds_1") for i in range(25)])
+    alert_service.bulk_upsert_subscriptions([("u2", "BTC-USD", "price_exceeds_1")])
+    alert_service.bulk_deactivate_subscriptions([("u1", f"SYM{i:02d}", "price_exceeds_1") for i in range(0, 25, 5)])
+
+    seen, cursor, pages = [], None, 0
+    while True:
+        page = alert_service.get_user_alert_subscriptions("u1", limit=7, after_id=cursor)
+        seen.extend(page["subscriptions"])
+        pages += 1
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert pages == 3 # 20 active rows: 7 + 7 + 6
+    assert [sub["crypto_symbol"] for sub in seen] == [f"SYM{i:02d}" for i in range(25) if i % 5]
+    ids = [sub["id"] for sub in seen]
+    assert ids == sorted(ids)
+
+    everything = alert_service.get_user_alert_subscriptions("u1", limit=100, include_inactive=True)
+    assert len(everything["subscriptions"]) == 25 and everything["next_cursor"] is None
+
+    exact = alert_service.get_user_alert_subscriptions("u1", limit=20)
+    assert len(exact["subscriptions"]) == 20 and exact["next_cursor"] is None # No empty trailing page
+    assert alert_service.get_user_alert_subscriptions("nobody") == {"subscriptions": [], "next_cursor": None}
+
+
+def test_ensure_indexes_merges_legacy_duplicates(tmp_path, request):
+    # A database from before the unique index: duplicate keys differing only in case/whitespace
+    conn = sqlite3.connect(tmp_path / "app.sqlite")
+    conn.executescript("""
+    CREATE TABLE user_preferences (id INTEGER PRIMARY KEY, user_identifier VARCHAR(100) UNIQUE NOT NULL,
+      followed_cryptos TEXT, alert_settings_json TEXT, report_preferences_json TEXT, updated_at DATETIME);
+    CREATE TABLE alert_subscriptions (id INTEGER PRIMARY KEY, user_identifier VARCHAR(100) NOT NULL,
+      crypto_symbol VARCHAR(20) NOT NULL, alert_condition VARCHAR(255) NOT NULL, is_active BOOLEAN NOT NULL DEFAULT 1,
+      created_at DATETIME, last_alert_sent_at DATETIME);
+    INSERT INTO user_preferences (user_identifier) VALUES ('u1'), ('u2');
+    INSERT INTO alert_subscriptions (id, user_identifier, crypto_symbol, alert_condition, is_active, last_alert_sent_at) VALUES
+      (1, 'u1', 'BTC-USD', 'price_exceeds_1', 0, '2026-01-01 00:00:00'),
+      (2, 'u1', 'btc-usd ', 'PRICE_EXCEEDS_1', 1, NULL),
+      (3, 'u1', 'BTC-USD', 'price_exceeds_1', 0, '2026-02-01 00:00:00'),
+      (4, 'u2', 'eth-usd', 'price_exceeds_2', 0, NULL),
+      (5, 'u2', 'ETH-USD', 'price_exceeds_2', 0, '2026-03-01 00:00:00'),
+      (6, 'u2', 'SOL-USD', 'price_exceeds_3', 1, NULL);
+    """)
+    conn.commit()
+    conn.close()
+
+    request.getfixturevalue("app") # create_app() runs ensure_indexes on the legacy tables
+    rows = db.session.execute(db.text(
+        "SELECT id, crypto_symbol, alert_condition, is_active, last_alert_sent_at FROM alert_subscriptions ORDER BY id"
+    )).all()
+    # The oldest row of each group survives, active if any copy was, with the latest send time
+    assert [tuple(row) for row in rows] == [
+        (1, "BTC-USD", "price_exceeds_1", 1, "2026-02-01 00:00:00"),
+        (4, "ETH-USD", "price_exceeds_2", 0, "2026-03-01 00:00:00"),
+        (6, "SOL-USD", "price_exceeds_3", 1, None),
+    ]
+    indexes = {row[1] for row in db.session.execute(db.text("PRAGMA index_list(alert_subscriptions)"))}
+    assert "uq_alert_subscription" in indexes
+
+    # The upsert now resolves against the unique index instead of adding a fourth row
+    alert_service.bulk_upsert_subscriptions([("u2", "eth-usd", "price_exceeds_2")])
+    assert AlertSubscription.query.count() == 3
+    assert active_keys("u2") == [("ETH-USD", "price_exceeds_2"), ("SOL-USD", "price_exceeds_3")]
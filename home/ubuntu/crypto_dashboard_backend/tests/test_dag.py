@@ -0,0 +1,164 @@
+# Pipeline DAG: checkpoint reuse, invalidation and resuming after failures, on a small
+# pipeline of per-symbol, batch and global stages.
+import pytest
+
+from pipeline import dag
+
+SYMBOLS = ["AAA", "BBB", "CCC"]
+
+
+class Toy:
+    """fetch (per symbol) -> scale (batch) -> total (global), counting every call."""
+
+    def __init__(self, tmp_path, prices=None):
+        self.checkpoint_dir = str(tmp_path / "checkpoints")
+        self.out_dir = tmp_path
+        self.prices = dict(prices or {"AAA": 1.0, "BBB": 2.0, "CCC": 3.0})
+        self.calls = {"fetch": [], "scale": [], "total": 0}
+        self.failing = set() # Symbols whose scale step raises
+
+    def fetch(self, symbol):
+        self.calls["fetch"].append(symbol)
+        return self.prices[symbol]
+
+    def scale(self, symbols, fetch):
+        self.calls["scale"].append(sorted(symbols))
+        if self.failing & set(symbols):
+            raise RuntimeError("scale failed")
+        return {symbol: fetch[symbol] * 10 for symbol in symbols}
+
+    def total(self, scale):
+        self.calls["total"] += 1
+        path = self.out_dir / "total.txt"
+        path.write_text(str(sum(scale.values())))
+        return str(path)
+
+    def pipeline(self, fetch_version=1, scale_version=1, factor_param=10):
+        return dag.Pipeline([
+            dag.Stage("fetch", self.fetch, per_symbol=True, version=fetch_version),
+            dag.Stage("scale", self.scale, deps=["fetch"], batch=True, version=scale_version, params=factor_param),
+            dag.Stage("total", self.total, deps=["scale"], outputs=lambda path: [path]),
+        ], checkpoint_dir=self.checkpoint_dir, max_workers=2)
+
+    def reset_calls(self):
+        self.calls = {"fetch": [], "scale": [], "total": 0}
+
+
+@pytest.fixture
+def toy(tmp_path):
+    return Toy(tmp_path)
+
+
+def statuses(pipeline, stage):
+    return {symbol: status for name, symbol, status, _ in pipeline.report if name == stage}
+
+
+def test_first_run_computes_batch_stage_in_one_call(toy):
+    values = toy.pipeline().run(SYMBOLS)
+    assert sorted(toy.calls["fetch"]) == SYMBOLS
+    assert toy.calls["scale"] == [SYMBOLS]
+    assert values["scale"] == {"AAA": 10.0, "BBB": 20.0, "CCC": 30.0}
+    assert (toy.out_dir / "total.txt").read_text() == "60.0"
+
+
+def test_rerun_loads_everything_from_checkpoints(toy):
+    toy.pipeline().run(SYMBOLS)
+    toy.reset_calls()
+    pipeline = toy.pipeline()
+    values = pipeline.run(SYMBOLS)
+    assert toy.calls == {"fetch": [], "scale": [], "total": 0}
+    assert set(status for _, _, status, _ in pipeline.report) == {"cached"}
+    assert values["scale"]["CCC"] == 30.0
+
+
+def test_changed_output_reruns_only_affected_downstream(toy):
+    toy.pipeline().run(SYMBOLS)
+    toy.reset_calls()
+    toy.prices["BBB"] = 5.0
+    values = toy.pipeline().run(SYMBOLS, from_stage="fetch")
+    assert sorted(toy.calls["fetch"]) == SYMBOLS # Forced
+    assert toy.calls["scale"] == [SYMBOLS] # Forced as downstream of fetch
+    toy.reset_calls()
+
+    toy.prices["BBB"] = 7.0
+    values = toy.pipeline().run(SYMBOLS, only_symbols=["BBB"], from_stage="fetch")
+    assert toy.calls["fetch"] == ["BBB"]
+    assert toy.calls["scale"] == [["BBB"]]
+    assert values["scale"] == {"AAA": 10.0, "BBB": 70.0, "CCC": 30.0}
+    assert toy.calls["total"] == 1
+
+
+def test_unchanged_output_keeps_downstream_cached(toy):
+    toy.pipeline().run(SYMBOLS)
+    toy.reset_calls()
+    pipeline = toy.pipeline(fetch_version=2)
+    pipeline.run(SYMBOLS)
+    # fetch re-ran, but its output is identical: nothing downstream of it runs again
+    assert sorted(toy.calls["fetch"]) == SYMBOLS
+    assert toy.calls["scale"] == []
+    assert toy.calls["total"] == 0
+    assert statuses(pipeline, "total") == {None: "cached"}
+
+
+def test_version_and_params_invalidate_a_stage(toy):
+    toy.pipeline().run(SYMBOLS)
+    toy.reset_calls()
+    toy.pipeline(scale_version=2).run(SYMBOLS)
+    assert toy.calls["fetch"] == []
+    assert toy.calls["scale"] == [SYMBOLS]
+    toy.reset_calls()
+    toy.pipeline(scale_version=2, factor_param=11).run(SYMBOLS)
+    assert toy.calls["scale"] == [SYMBOLS]
+
+
+def test_missing_output_file_reruns_stage(toy):
+    toy.pipeline().run(SYMBOLS)
+    (toy.out_dir / "total.txt").unlink()
+    toy.reset_calls()
+    toy.pipeline().run(SYMBOLS)
+    assert toy.calls["total"] == 1
+    assert (toy.out_dir / "total.txt").exists()
+
+
+def test_resume_after_failure_reruns_only_failed_work(toy):
+    toy.failing = {"CCC"}
+    pipeline = toy.pipeline()
+    values = pipeline.run(SYMBOLS)
+    assert ("scale", "AAA") in pipeline.failed and ("scale", "CCC") in pipeline.failed
+    assert values["scale"] == {} # Global stages still run, over the symbols that succeeded
+
+    toy.failing = set()
+    toy.reset_calls()
+    pipeline = toy.pipeline()
+    pipeline.run(SYMBOLS)
+    assert toy.calls["fetch"] == [] # Checkpointed before the failure
+    assert toy.calls["scale"] == [SYMBOLS] # The failed batch left no checkpoints
+    assert toy.calls["total"] == 1
+    assert pipeline.failed == []
+
+
+def test_force_ignores_checkpoints(toy):
+    toy.pipeline().run(SYMBOLS)
+    toy.reset_calls()
+    toy.pipeline().run(SYMBOLS, force=True)
+    assert sorted(toy.calls["fetch"]) == SYMBOLS
+    assert toy.calls["scale"] == [SYMBOLS]
+
+
+def test_shards_then_reduce_from_checkpoints(toy):
+    # A sharded run: each shard runs its branches only, then the global stages run alone
+    toy.pipeline().run(["AAA", "BBB"], global_stages=False)
+    toy.pipeline().run(["CCC"], global_stages=False)
+    assert toy.calls["total"] == 0
+    toy.reset_calls()
+    values = toy.pipeline().run(SYMBOLS, only_symbols=[])
+    assert toy.calls == {"fetch": [], "scale": [], "total": 1}
+    assert values["scale"] == {"AAA": 10.0, "BBB": 20.0, "CCC": 30.0}
+
+
+def test_reduce_reports_symbols_without_checkpoints(toy):
+    toy.pipeline().run(["AAA"], global_stages=False)
+    pipeline = toy.pipeline()
+    values = pipeline.run(SYMBOLS, only_symbols=[])
+    assert values["scale"] == {"AAA": 10.0} # Symbols whose shard never ran are left out
+    assert statuses(pipeline, "scale")["BBB"].startswith("skipped (no checkpoint")
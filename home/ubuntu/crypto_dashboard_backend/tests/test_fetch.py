@@ -0,0 +1,86 @@
+# Fetch stage: retries with backoff, per-call timeouts and the shared rate limiter, against
+# the offline StubApiClient.
+import threading
+import time
+
+from pipeline.fetch import RateLimiter, fetch_all, fetch_symbol, parse_chart_arrays
+from stub_api import StubApiClient
+
+
+class FlakyClient(StubApiClient):
+    """Fails the first `failures` calls for each symbol, then answers like the stub."""
+
+    def __init__(self, failures: int, **kwargs):
+        super().__init__(latency=0, **kwargs)
+        self.failures = failures
+        self.attempts = {}
+
+    def call_api(self, api_name: str, query: dict = None):
+        symbol = query["symbol"]
+        with self._lock:
+            self.attempts[symbol] = self.attempts.get(symbol, 0) + 1
+            failing = self.attempts[symbol] <= self.failures
+        if failing:
+            raise ConnectionError(f"injected failure for {symbol}")
+        return super().call_api(api_name, query)
+
+
+def test_fetch_retries_failed_calls():
+    client = FlakyClient(failures=2)
+    bars = fetch_symbol(client, "BTC-USD", retries=3, backoff=0, parser=parse_chart_arrays)
+    assert client.attempts["BTC-USD"] == 3
+    assert len(bars) == 10
+
+
+def test_fetch_gives_up_after_retries():
+    client = StubApiClient(latency=0, failure_rate=1.0)
+    bars = fetch_symbol(client, "BTC-USD", retries=2, backoff=0, parser=parse_chart_arrays)
+    assert client.calls == 3
+    assert len(bars) == 0
+
+
+def test_fetch_backs_off_exponentially():
+    client = FlakyClient(failures=2)
+    start = time.monotonic()
+    fetch_symbol(client, "BTC-USD", retries=2, backoff=0.05, parser=parse_chart_arrays)
+    assert time.monotonic() - start >= 0.05 + 0.1 # backoff * 1, then backoff * 2 (plus jitter)
+
+
+def test_fetch_abandons_hung_calls():
+    client = StubApiClient(latency=0, hang_rate=1.0)
+    start = time.monotonic()
+    bars = fetch_symbol(client, "BTC-USD", timeout=0.05, retries=1, backoff=0, parser=parse_chart_arrays)
+    assert len(bars) == 0
+    assert client.calls == 2
+    assert time.monotonic() - start < 5
+
+
+def test_rate_limiter_caps_rate_across_threads():
+    limiter = RateLimiter(rate=100, burst=1)
+
+    def worker():
+        for _ in range(5):
+            limiter.acquire()
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # 20 calls, the first from the initial token, then one every 1/100 s
+    assert time.monotonic() - start >= 0.18
+
+
+def test_fetch_all_keeps_going_when_a_symbol_fails():
+    class OneBadSymbol(StubApiClient):
+        def call_api(self, api_name, query=None):
+            if query["symbol"] == "BAD-USD":
+                raise ConnectionError("injected failure")
+            return super().call_api(api_name, query)
+
+    results = fetch_all(OneBadSymbol(latency=0), ["BTC-USD", "BAD-USD", "ETH-USD"], retries=1, backoff=0,
+                        max_workers=2, rate_limit=1000)
+    assert list(results) == ["BTC-USD", "BAD-USD", "ETH-USD"]
+    assert results["BAD-USD"].empty
+    assert len(results["BTC-USD"]) == len(results["ETH-USD"]) == 10
@@ -0,0 +1,60 @@
+# Vectorized indicators against the per-symbol pandas computation they replace, which they
+# must match bit for bit, on ragged (left-padded) histories with NaN gaps.
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.services import indicators
+
+
+def ragged_histories(seed=0):
+    rng = np.random.default_rng(seed)
+    histories = []
+    for length in (0, 1, 2, 6, 7, 8, 30, 250, 1000):
+        series = 100 * np.exp(np.cumsum(rng.normal(0, 0.03, length))) * 10.0 ** rng.integers(-3, 5)
+        if length > 20:
+            series[rng.choice(length, length // 10, replace=False)] = np.nan # Gaps
+            series[5:12] = series[4] # A constant run
+        histories.append(series)
+    histories.append(np.concatenate([[1e9, 1e-9, -3.5], np.full(5, 2.25), [np.nan] * 3, [0.1, 0.2, 0.3]]))
+    return histories
+
+
+@pytest.mark.parametrize("window", [1, 3, 7, 20])
+def test_rolling_mean_matches_pandas(window):
+    histories = ragged_histories()
+    prices = indicators.stack_prices(histories)
+    result = indicators.rolling_mean(prices, window)
+    for row, series in enumerate(histories):
+        expected = pd.Series(series, dtype="float64").rolling(window).mean().to_numpy()
+        actual = result[row, prices.shape[1] - len(series):]
+        assert np.array_equal(actual, expected, equal_nan=True), f"row {row} differs"
+        assert np.isnan(result[row, :prices.shape[1] - len(series)]).all() # Padding stays NaN
+
+
+def test_compute_indicators_matches_per_symbol_pandas():
+    histories = [series for series in ragged_histories(seed=1) if len(series)]
+    prices = indicators.stack_prices(histories)
+    result = indicators.compute_indicators(prices, short_window=3, long_window=7, horizon=3)
+    for row, series in enumerate(histories):
+        close = pd.Series(series, dtype="float64")
+        tail = slice(prices.shape[1] - len(series), None)
+        sma_short = close.rolling(3).mean()
+        sma_long = close.rolling(7).mean()
+        change = close.pct_change(fill_method=None) * 100
+        assert np.array_equal(result["sma_short"][row, tail], sma_short.to_numpy(), equal_nan=True)
+        assert np.array_equal(result["sma_long"][row, tail], sma_long.to_numpy(), equal_nan=True)
+        assert np.array_equal(result["daily_change_pct"][row, tail], change.to_numpy(), equal_nan=True)
+
+        short, long = sma_short.iloc[-1], sma_long.iloc[-1]
+        expected_trend = indicators.TREND_UP if short > long else indicators.TREND_DOWN if short < long \
+            else indicators.TREND_NEUTRAL
+        assert result["trend"][row] == expected_trend
+
+
+def test_short_histories_extrapolate_flat():
+    prices = indicators.stack_prices([[5.0], [1.0, 2.0, 3.0, 4.0]])
+    result = indicators.compute_indicators(prices, short_window=3, long_window=7, horizon=2)
+    assert result["predictions"][0].tolist() == [5.0, 5.0] # No SMA yet: the price, held flat
+    assert result["sma_slope"][1] == 1.0 # SMA-3 of 1..4 is 2, 3
+    assert result["predictions"][1].tolist() == [4.0, 5.0]
@@ -0,0 +1,100 @@
+# /api/crypto/prices/batch: request validation and the JSON, msgpack and Arrow encodings,
+# including gaps between symbols with different bars (nulls in every format).
+import json
+
+import numpy as np
+import pytest
+
+from app.services import ohlcv_store
+
+DAY = 86400
+
+
+@pytest.fixture
+def store(app):
+    # BTC-USD has 5 daily bars; ETH-USD only every other one of them, so aligning leaves gaps
+    end = int(np.datetime64("today", "D").astype("datetime64[s]").astype(np.int64)) - DAY
+    for symbol, days in (("BTC-USD", [4, 3, 2, 1, 0]), ("ETH-USD", [4, 2, 0])):
+        bars = np.zeros(len(days), dtype=ohlcv_store.BAR_DTYPE)
+        bars["timestamp"] = [end - day * DAY for day in days]
+        bars["close"] = bars["adj_close"] = np.arange(1, len(days) + 1, dtype=np.float64)
+        ohlcv_store.append_bars(app.config["OHLCV_STORE_DIR"], symbol, "1d", bars)
+    return end
+
+
+def post(client, **body):
+    body.setdefault("symbols", ["BTC-USD", "ETH-USD"])
+    body.setdefault("fields", ["close"])
+    return client.post("/api/crypto/prices/batch", json=body)
+
+
+@pytest.mark.parametrize("body, error", [
+    ({"symbols": "BTC-USD,ETH-USD"}, "symbols must be a JSON list of strings"),
+    ({"symbols": ["BTC-USD", 1]}, "symbols must be a JSON list of strings"),
+    ({"fields": "close"}, "fields must be a JSON list of strings"),
+    ({"range": 7}, "range must be a string"),
+    ({"format": ["arrow"]}, "format must be a string"),
+    ({"range": "7 days"}, "Invalid range '7 days'. Use e.g. 7d, 2w, 3mo, 1y or max."),
+    ({"fields": ["close", "bid"]}, "Unknown fields: bid"),
+])
+def test_invalid_requests_are_rejected(client, body, error):
+    response = post(client, **body)
+    assert response.status_code == 400
+    assert response.get_json() == {"error": error}
+
+
+def test_unknown_format_is_not_acceptable(client):
+    response = post(client, format="xml")
+    assert response.status_code == 406
+
+
+def test_json_encodes_gaps_as_null(client, store):
+    response = post(client, range="30d")
+    assert response.mimetype == "application/json"
+    body = response.get_json()
+    assert body["symbols"] == ["BTC-USD", "ETH-USD"]
+    assert body["timestamps"] == [store - day * DAY for day in (4, 3, 2, 1, 0)]
+    assert body["data"]["BTC-USD"]["close"] == [1.0, 2.0, 3.0, 4.0, 5.0]
+    assert body["data"]["ETH-USD"]["close"] == [1.0, None, 2.0, None, 3.0]
+
+
+def test_get_with_query_parameters(client, store):
+    response = client.get("/api/crypto/prices/batch?symbols=btc-usd&fields=close,adj_close&range=30d")
+    body = response.get_json()
+    assert body["symbols"] == ["BTC-USD"]
+    assert body["data"]["BTC-USD"]["adj_close"] == [1.0, 2.0, 3.0, 4.0, 5.0]
+
+
+def test_msgpack_carries_validity_bitmap_for_gaps(client, store):
+    msgpack = pytest.importorskip("msgpack")
+    response = post(client, range="30d", format="msgpack")
+    assert response.mimetype == "application/x-msgpack"
+    body = msgpack.unpackb(response.data)
+    assert np.frombuffer(body["timestamps"]["data"], dtype=body["timestamps"]["dtype"]).tolist() \
+        == [store - day * DAY for day in (4, 3, 2, 1, 0)]
+    btc = body["data"]["BTC-USD"]["close"]
+    assert "validity" not in btc # No gaps, no bitmap
+    assert np.frombuffer(btc["data"], dtype=btc["dtype"]).tolist() == [1.0, 2.0, 3.0, 4.0, 5.0]
+    eth = body["data"]["ETH-USD"]["close"]
+    valid = np.unpackbits(np.frombuffer(eth["validity"], dtype=np.uint8), bitorder="little")[:5].astype(bool)
+    assert valid.tolist() == [True, False, True, False, True]
+    assert np.frombuffer(eth["data"], dtype=eth["dtype"])[valid].tolist() == [1.0, 2.0, 3.0]
+
+
+def test_arrow_encodes_gaps_as_null(client, store):
+    pa = pytest.importorskip("pyarrow")
+    response = post(client, range="30d", format="arrow")
+    assert response.mimetype == "application/vnd.apache.arrow.stream"
+    table = pa.ipc.open_stream(response.data).read_all()
+    assert table.column_names == ["timestamp", "BTC-USD.close", "ETH-USD.close"]
+    assert table.column("BTC-USD.close").null_count == 0
+    assert table.column("ETH-USD.close").to_pylist() == [1.0, None, 2.0, None, 3.0]
+    assert json.loads(table.schema.metadata[b"symbols"]) == ["BTC-USD", "ETH-USD"]
+
+
+def test_format_from_accept_header(client, store):
+    pytest.importorskip("pyarrow")
+    response = client.post("/api/crypto/prices/batch", json={"symbols": ["BTC-USD"]},
+                           headers={"Accept": "application/vnd.apache.arrow.stream"})
+    assert response.mimetype == "application/vnd.apache.arrow.stream"
+    assert "Accept" in response.headers["Vary"]
@@ -0,0 +1,124 @@
+# /api/reports/archive and /api/reports/latest over the in-memory report index, filled by
+# record_report() or, on a fresh database, backfilled from the archive directory.
+import os
+from datetime import date, timedelta
+
+import pytest
+
+from app.models import Report
+from app.services import report_service
+
+
+@pytest.fixture(autouse=True)
+def fresh_index(monkeypatch):
+    # The index is per process; start every test from an unloaded one
+    for name, value in (("_dates", []), ("_reports", {}), ("_symbol_dates", {}), ("_loaded", False),
+                        ("_last_seen", None), ("_marker_mtime", None), ("_last_check", 0.0)):
+        monkeypatch.setattr(report_service, name, value)
+
+
+def record_days(count, start=date(2025, 1, 1)):
+    days = [(start + timedelta(days=i)).isoformat() for i in range(count)]
+    for i, day in enumerate(days):
+        symbols = {"BTC-USD": ("up", "higher")}
+        if i % 2:
+            symbols["ETH-USD"] = ("down", "lower")
+        report_service.record_report(day, symbols, f"/archive/{day}.md", None)
+    return days
+
+
+def archive_page(client, **params):
+    response = client.get("/api/reports/archive", query_string=params)
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_archive_pages_newest_first(client):
+    days = record_days(45)
+    newest_first = days[::-1]
+
+    first = archive_page(client)
+    assert (first["total"], first["page"], first["per_page"]) == (45, 1, 20)
+    assert [r["report_id"] for r in first["archive"]] == newest_first[:20]
+
+    walked = []
+    for page in (1, 2, 3, 4):
+        body = archive_page(client, page=page, per_page=13)
+        assert (body["total"], body["page"], body["per_page"]) == (45, page, 13)
+        walked.extend(r["report_id"] for r in body["archive"])
+    assert walked == newest_first # 13 + 13 + 13 + 6, no overlap or gap
+    assert archive_page(client, page=5, per_page=13)["archive"] == []
+
+    entry = first["archive"][0]
+    assert entry["formats"] == ["md"]
+    assert entry["summaries"]["BTC-USD"] == {"analysis": "up", "prediction": "higher"}
+
+
+def test_archive_filters_by_date_range_and_symbol(client):
+    days = record_days(10)
+    body = archive_page(client, start=days[2], end=days[6], per_page=2, page=2)
+    assert body["total"] == 5
+    assert [r["report_id"] for r in body["archive"]] == [days[4], days[3]]
+
+    eth = archive_page(client, symbol="eth-usd")
+    assert eth["total"] == 5
+    assert [r["report_id"] for r in eth["archive"]] == [days[i] for i in (9, 7, 5, 3, 1)]
+    unknown = archive_page(client, symbol="DOGE-USD")
+    assert (unknown["archive"], unknown["total"]) == ([], 0)
+
+
+@pytest.mark.parametrize("params", [{"page": 0}, {"per_page": 0}, {"per_page": 101}, {"start": "2025-1-1"}])
+def test_archive_rejects_bad_parameters(client, params):
+    assert client.get("/api/reports/archive", query_string=params).status_code == 400
+
+
+def test_rerecording_a_day_replaces_its_symbols(client):
+    report_service.record_report("2025-01-01", {"BTC-USD": ("a", "b"), "ETH-USD": ("c", "d")}, "x.md", None)
+    report_service.record_report("2025-01-01", {"SOL-USD": ("e", "f")}, "x.md", "x.pdf")
+    body = archive_page(client)
+    assert body["total"] == 1
+    assert body["archive"][0]["symbols"] == ["SOL-USD"]
+    assert body["archive"][0]["formats"] == ["pdf", "md"]
+    assert archive_page(client, symbol="BTC-USD")["total"] == 0
+
+
+def test_backfill_from_archive_directory(app, client):
+    archive_dir = app.config["REPORTS_ARCHIVE_DIR"]
+    os.makedirs(archive_dir)
+    files = {
+        "daily_crypto_report_2025-03-01.md": "# Daily Crypto Report\n\n## BTC-USD\ntext\n## ETH-USD (Ethereum)\n",
+        "daily_crypto_report_2025-03-01.pdf": "%PDF",
+        "daily_crypto_report_2025-03-02.pdf": "%PDF", # PDF only: one "ALL" row
+        "daily_crypto_report_2025-03-03.md": "# Empty report\n",
+        "notes.md": "## NOT-A-REPORT\n",
+    }
+    for name, content in files.items():
+        with open(os.path.join(archive_dir, name), "w", encoding="utf-8") as f:
+            f.write(content)
+
+    body = archive_page(client)
+    assert body["total"] == 3
+    by_id = {r["report_id"]: r for r in body["archive"]}
+    assert by_id["2025-03-01"]["symbols"] == ["BTC-USD", "ETH-USD"]
+    assert by_id["2025-03-01"]["formats"] == ["pdf", "md"]
+    assert (by_id["2025-03-02"]["symbols"], by_id["2025-03-02"]["formats"]) == (["ALL"], ["pdf"])
+    assert (by_id["2025-03-03"]["symbols"], by_id["2025-03-03"]["formats"]) == (["ALL"], ["md"])
+    assert Report.query.count() == 4
+
+    latest = client.get("/api/reports/latest?format=md").get_json()
+    assert latest["report"]["report_id"] == "2025-03-03"
+    assert latest["report_content"].endswith("/api/reports/download/2025-03-03?format=md")
+
+
+def test_backfill_only_runs_on_an_empty_table(app):
+    report_service.record_report("2025-04-01", {"BTC-USD": ("a", "b")}, "x.md", None)
+    archive_dir = app.config["REPORTS_ARCHIVE_DIR"]
+    with open(os.path.join(archive_dir, "daily_crypto_report_2025-03-01.md"), "w") as f:
+        f.write("## BTC-USD\n")
+    report_service.refresh_index(force=True)
+    assert Report.query.count() == 1
+    assert report_service.get_latest_report()["report_id"] == "2025-04-01"
+
+
+def test_latest_report_is_404_when_the_archive_is_empty(client):
+    assert client.get("/api/reports/latest").status_code == 404
@@ -0,0 +1,84 @@
+# /api/reports/download: strong ETags, conditional GETs (304) and byte ranges (206).
+import hashlib
+import os
+
+import pytest
+
+from app.services import report_service
+
+REPORT_ID = "2025-05-08"
+MD_BODY = ("# Daily Crypto Report\n\n## BTC\n\nTrend: Upward\n" * 50).encode("utf-8")
+PDF_BODY = b"%PDF-1.4\n" + bytes(range(256)) * 8
+
+
+@pytest.fixture
+def archive(app):
+    archive_dir = app.config["REPORTS_ARCHIVE_DIR"]
+    os.makedirs(archive_dir, exist_ok=True)
+    for ext, body in (("md", MD_BODY), ("pdf", PDF_BODY)):
+        with open(os.path.join(archive_dir, f"daily_crypto_report_{REPORT_ID}.{ext}"), "wb") as f:
+            f.write(body)
+    return archive_dir
+
+
+def download(client, fmt="md", **headers):
+    return client.get(f"/api/reports/download/{REPORT_ID}?format={fmt}", headers=headers)
+
+
+@pytest.mark.parametrize("fmt,body", [("md", MD_BODY), ("pdf", PDF_BODY)])
+def test_download_sends_content_hash_etag(client, archive, fmt, body):
+    response = download(client, fmt)
+    assert response.status_code == 200
+    assert response.data == body
+    assert response.headers["ETag"] == f'"{hashlib.sha256(body).hexdigest()}"'
+    assert response.headers["Accept-Ranges"] == "bytes"
+    assert "attachment" in response.headers["Content-Disposition"]
+
+
+def test_if_none_match_returns_304(client, archive):
+    etag = download(client).headers["ETag"]
+    response = download(client, **{"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.data == b""
+    assert response.headers["ETag"] == etag
+
+    assert download(client, **{"If-None-Match": '"stale"'}).status_code == 200
+
+
+def test_etag_changes_with_content(client, archive):
+    etag = download(client).headers["ETag"]
+    path = os.path.join(archive, f"daily_crypto_report_{REPORT_ID}.md")
+    with open(path, "ab") as f:
+        f.write(b"\n## ETH\n")
+    os.utime(path, ns=(os.stat(path).st_atime_ns, os.stat(path).st_mtime_ns + 10**9))
+    response = download(client, **{"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert response.headers["ETag"] == f'"{report_service.file_etag(path)}"'
+
+
+def test_range_returns_206(client, archive):
+    response = download(client, "pdf", Range="bytes=100-199")
+    assert response.status_code == 206
+    assert response.data == PDF_BODY[100:200]
+    assert response.headers["Content-Range"] == f"bytes 100-199/{len(PDF_BODY)}"
+
+    suffix = download(client, "pdf", Range="bytes=-16")
+    assert suffix.status_code == 206
+    assert suffix.data == PDF_BODY[-16:]
+
+
+def test_range_is_ignored_for_a_stale_if_range(client, archive):
+    response = download(client, "pdf", Range="bytes=0-9", **{"If-Range": '"stale"'})
+    assert response.status_code == 200
+    assert response.data == PDF_BODY
+
+
+def test_unsatisfiable_range_returns_416(client, archive):
+    assert download(client, "pdf", Range=f"bytes={len(PDF_BODY) + 10}-").status_code == 416
+
+
+def test_missing_or_malformed_report_is_404(client, archive):
+    assert client.get("/api/reports/download/2020-01-01?format=md").status_code == 404
+    assert client.get("/api/reports/download/..%2Fsecret?format=md").status_code == 404
+    assert download(client, "txt").status_code == 400
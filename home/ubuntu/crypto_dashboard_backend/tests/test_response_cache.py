@@ -0,0 +1,126 @@
+# Response cache: TTL expiry, LRU eviction, single-flight coalescing and invalidation by
+# data version or invalidate().
+import threading
+import time
+
+import pytest
+
+from app.services.response_cache import ResponseCache
+
+
+class Computation:
+    """compute() callable that counts its calls and can be held until released."""
+
+    def __init__(self, value="value", hold=False):
+        self.value = value
+        self.calls = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+        if not hold:
+            self.release.set()
+
+    def __call__(self):
+        self.calls += 1
+        self.started.set()
+        assert self.release.wait(5)
+        return self.value
+
+
+def in_thread(func, *args):
+    result = {}
+    thread = threading.Thread(target=lambda: result.setdefault("value", func(*args)))
+    thread.start()
+    return thread, result
+
+
+def test_hit_until_ttl_expires():
+    cache = ResponseCache(ttl_seconds=0.05)
+    compute = Computation()
+    assert cache.get_or_compute("k", compute) == "value"
+    assert cache.get_or_compute("k", compute) == "value"
+    assert compute.calls == 1
+    time.sleep(0.1)
+    cache.get_or_compute("k", compute)
+    assert compute.calls == 2
+    assert cache.snapshot()["hits"] == 1
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResponseCache(max_entries=2)
+    for key in ("a", "b"):
+        cache.get_or_compute(key, lambda key=key: key)
+    cache.get_or_compute("a", lambda: "recomputed") # Hit: "a" becomes most recently used
+    cache.get_or_compute("c", lambda: "c")
+    assert cache.get_or_compute("a", lambda: "recomputed") == "a"
+    assert cache.get_or_compute("b", lambda: "recomputed") == "recomputed"
+    assert cache.stats["evictions"] == 2
+
+
+def test_concurrent_misses_are_coalesced():
+    cache = ResponseCache()
+    compute = Computation(hold=True)
+    runs = [in_thread(cache.get_or_compute, "k", compute) for _ in range(8)]
+    assert compute.started.wait(5)
+    time.sleep(0.05) # Let the others queue up behind the first caller
+    compute.release.set()
+    for thread, _ in runs:
+        thread.join(5)
+    assert [result["value"] for _, result in runs] == ["value"] * 8
+    assert compute.calls == 1
+    assert cache.stats["misses"] == 1 and cache.stats["coalesced"] == 7
+
+
+def test_errors_are_shared_but_not_cached():
+    cache = ResponseCache()
+
+    def fail():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        cache.get_or_compute("k", fail)
+    assert cache.get_or_compute("k", lambda: "ok") == "ok"
+
+
+def test_new_version_recomputes():
+    cache = ResponseCache()
+    assert cache.get_or_compute("k", lambda: "v1", version=1) == "v1"
+    assert cache.get_or_compute("k", lambda: "v2", version=2) == "v2"
+    assert cache.get_or_compute("k", lambda: "v3", version=2) == "v2"
+    assert cache.stats["invalidations"] == 1
+
+
+def test_new_version_does_not_join_a_computation_for_the_old_one():
+    cache = ResponseCache()
+    old = Computation("old", hold=True)
+    thread, result = in_thread(cache.get_or_compute, "k", old, 1)
+    assert old.started.wait(5)
+    # The data changed while the old version was being computed
+    new_thread, new_result = in_thread(cache.get_or_compute, "k", lambda: "new", 2)
+    new_thread.join(2)
+    old.release.set()
+    assert new_result.get("value") == "new"
+    thread.join(5)
+    assert result["value"] == "old"
+    assert cache.stats["coalesced"] == 0
+
+
+def test_invalidate_drops_entries_and_running_computations():
+    cache = ResponseCache()
+    cache.get_or_compute(("prices", "BTC-USD", "7d"), lambda: "btc")
+    cache.get_or_compute(("prices", "ETH-USD", "7d"), lambda: "eth")
+    assert cache.invalidate("BTC-USD") == 1
+    assert cache.get_or_compute(("prices", "BTC-USD", "7d"), lambda: "btc2") == "btc2"
+    assert cache.get_or_compute(("prices", "ETH-USD", "7d"), lambda: "eth2") == "eth"
+
+    key = ("prices", "SOL-USD", "7d")
+    stale = Computation("stale", hold=True)
+    thread, result = in_thread(cache.get_or_compute, key, stale)
+    assert stale.started.wait(5)
+    cache.invalidate()
+    fresh = Computation("fresh")
+    assert cache.get_or_compute(key, fresh) == "fresh" # Not the computation started before invalidate()
+    stale.release.set()
+    thread.join(5)
+    assert result["value"] == "stale"
+    assert cache.get_or_compute(key, lambda: "other") == "fresh" # The stale result was not cached
+    assert cache.snapshot()["entries"] == 1
@@ -0,0 +1,133 @@
+# Sharded-run work queue: leases, reclaiming tasks of dead workers, retries and the reduce
+# task, including workers in separate processes sharing one queue file.
+import multiprocessing
+import os
+import time
+
+import pytest
+
+from pipeline import work_queue
+from pipeline.work_queue import Heartbeat, WorkQueue
+
+SHARDS = [["A", "B"], ["C", "D"], ["E"]]
+
+
+@pytest.fixture
+def queue_path(tmp_path):
+    return str(tmp_path / "work_queue.sqlite")
+
+
+def make_queue(path, lease_seconds=300.0, max_attempts=3, shards=SHARDS):
+    queue = WorkQueue(path, lease_seconds=lease_seconds, max_attempts=max_attempts)
+    queue.create(shards)
+    return queue
+
+
+def statuses(queue):
+    return [(task["kind"], task["status"], task["attempts"]) for task in queue.tasks()]
+
+
+def test_create_is_idempotent_and_rejects_other_shards(queue_path):
+    queue = make_queue(queue_path)
+    assert queue.create(SHARDS) is False
+    with pytest.raises(ValueError):
+        queue.create([["A"], ["B"]])
+    assert len(queue.tasks()) == len(SHARDS) + 1
+
+
+def test_reduce_waits_for_every_shard(queue_path):
+    queue = make_queue(queue_path)
+    claimed = [queue.claim("w1") for _ in SHARDS]
+    assert [task["symbols"] for task in claimed] == SHARDS
+    assert queue.claim("w2") is None # Only the reduce task is left, and shards are still leased
+    for task in claimed:
+        assert queue.complete(task["id"], "w1", {"failed": []})
+    reduce = queue.claim("w2")
+    assert reduce["kind"] == work_queue.REDUCE
+    assert queue.complete(reduce["id"], "w2", {"failed": []})
+    assert queue.finished()
+
+
+def test_expired_lease_is_reclaimed_by_another_worker(queue_path):
+    queue = make_queue(queue_path, lease_seconds=0.05, shards=[["A"]])
+    first = queue.claim("dead")
+    time.sleep(0.1)
+    second = queue.claim("alive")
+    assert second["id"] == first["id"]
+    assert second["attempt"] == 2
+    # The first worker lost its lease: it can neither renew nor complete the task any more
+    assert queue.renew(first["id"], "dead") is False
+    assert queue.complete(first["id"], "dead", {"failed": []}) is False
+    assert queue.complete(second["id"], "alive", {"failed": []}) is True
+
+
+def test_task_fails_after_max_attempts(queue_path):
+    queue = make_queue(queue_path, lease_seconds=0.05, max_attempts=2, shards=[["A"]])
+    queue.claim("w1")
+    time.sleep(0.1)
+    queue.claim("w2")
+    time.sleep(0.1)
+    reduce = queue.claim("w3") # The shard's lease expired on its last attempt: it fails for good
+    assert reduce["kind"] == work_queue.REDUCE
+    shard = queue.tasks()[0]
+    assert (shard["status"], shard["attempts"], shard["error"]) == ("failed", 2, "lease expired")
+
+
+def test_failed_task_is_retried_until_attempts_run_out(queue_path):
+    queue = make_queue(queue_path, max_attempts=2, shards=[["A"]])
+    task = queue.claim("w1")
+    assert queue.fail(task["id"], "w1", "boom")
+    task = queue.claim("w1")
+    assert task["attempt"] == 2
+    assert queue.fail(task["id"], "w1", "boom again")
+    assert statuses(queue)[0] == ("shard", "failed", 2)
+    assert queue.tasks()[0]["error"] == "boom again"
+
+
+def test_heartbeat_keeps_the_lease(queue_path):
+    queue = make_queue(queue_path, lease_seconds=0.3, shards=[["A"]])
+    task = queue.claim("w1")
+    with Heartbeat(queue, task["id"], "w1") as heartbeat:
+        time.sleep(0.8) # Well past the lease, which the heartbeat renews every 0.1s
+        assert queue.claim("w2") is None
+    assert not heartbeat.lost
+    assert queue.complete(task["id"], "w1", {"failed": []})
+
+
+def _worker_process(path, worker, crash):
+    queue = WorkQueue(path, lease_seconds=0.5)
+
+    def run_shard(symbols):
+        if crash:
+            os._exit(1) # Dies holding the lease, like a killed process
+        time.sleep(0.05)
+        return {"failed": [], "symbols": symbols, "worker": worker}
+
+    def reduce():
+        shards = [task for task in queue.tasks() if task["kind"] == work_queue.SHARD]
+        return {"failed": [], "symbols": sorted(s for task in shards for s in task["result"]["symbols"])}
+
+    ok = work_queue.run_worker(queue, worker, run_shard, reduce, poll_seconds=0.05)
+    os._exit(0 if ok else 2)
+
+
+def test_workers_in_processes_finish_a_crashed_workers_shard(queue_path):
+    shards = [[f"S{i}{j}" for j in range(2)] for i in range(6)]
+    make_queue(queue_path, lease_seconds=0.5, shards=shards)
+    context = multiprocessing.get_context("spawn")
+    crasher = context.Process(target=_worker_process, args=(queue_path, "crasher", True))
+    crasher.start()
+    crasher.join(30) # Claims the first shard and dies with it
+    workers = [context.Process(target=_worker_process, args=(queue_path, f"w{i}", False)) for i in range(3)]
+    for process in workers:
+        process.start()
+    for process in workers:
+        process.join(60)
+    assert crasher.exitcode == 1
+    assert [process.exitcode for process in workers] == [0, 0, 0]
+
+    tasks = WorkQueue(queue_path).tasks()
+    assert all(task["status"] == "done" for task in tasks)
+    assert tasks[0]["attempts"] == 2 and tasks[0]["result"]["worker"] != "crasher"
+    assert all(task["attempts"] == 1 for task in tasks[1:])
+    assert tasks[-1]["result"]["symbols"] == sorted(s for shard in shards for s in shard)